@@ -9,7 +9,10 @@ setup(
         "xlrd>=1.2",
         "openpyxl>=3.0",
         "fhirpy>=1.4",
-        "fhir.resources>=7.0",
+        "aiohttp>=3.9",
+        "requests>=2.31",
+        "fhir.resources>=7.0,<8.0",
+        "pydantic>=2.0",
     ],
     author="I-TECH-UW",
     author_email="pmanko@uw.edu",
@@ -0,0 +1,7 @@
+import os
+
+from who_l3_smart_tools.utils.cache import CACHE_DIR_ENV
+
+# The tests must not write to the developer's cache, so it is disabled unless a test
+# sets its own cache directory
+os.environ[CACHE_DIR_ENV] = ""
@@ -0,0 +1,116 @@
+import unittest
+
+from fhir.resources.bundle import Bundle
+
+from who_l3_smart_tools.core.indicator_testing.bundle_builder import BundleBuilder
+from who_l3_smart_tools.core.indicator_testing.generator_functions import (
+    FhirGenerator,
+    find_or_create_condition_resource,
+    find_or_create_test_resources,
+    update_condition_resource,
+)
+
+
+def observation(observation_id, coding):
+    return {
+        "resourceType": "Observation",
+        "id": observation_id,
+        "status": "final",
+        "code": {"coding": [coding]},
+    }
+
+
+class TestBundleBuilder(unittest.TestCase):
+    def setUp(self):
+        self.codings = FhirGenerator.codings
+        self.row = {"Patient.id": "p1"}
+
+    def test_lookups(self):
+        builder = BundleBuilder()
+        first = builder.add(observation("o1", self.codings["hiv-test"]))
+        builder.add(observation("o2", self.codings["hiv-test"]))
+        builder.add(observation("o3", self.codings["death"]))
+
+        self.assertIs(
+            builder.find_by_code("Observation", self.codings["hiv-test"]), first
+        )
+        self.assertIsNone(builder.find_by_code("Condition", self.codings["hiv-test"]))
+        self.assertEqual(builder.find_by_id("Observation", "o3")["id"], "o3")
+        self.assertEqual(len(builder.of_type("Observation")), 3)
+
+    def test_remove(self):
+        builder = BundleBuilder()
+        first = builder.add(observation("o1", self.codings["hiv-test"]))
+        second = builder.add(observation("o2", self.codings["hiv-test"]))
+
+        builder.remove(first)
+
+        self.assertIs(
+            builder.find_by_code("Observation", self.codings["hiv-test"]), second
+        )
+        self.assertIsNone(builder.find_by_id("Observation", "o1"))
+        self.assertEqual([x["resource"]["id"] for x in builder.entry], ["o2"])
+
+    def test_test_resources_are_reused(self):
+        builder = BundleBuilder()
+        row = {**self.row, "Test.id": "t1"}
+
+        coding = self.codings["hiv-test"]
+
+        first, _ = find_or_create_test_resources(builder, row, coding)
+        second, _ = find_or_create_test_resources(builder, row, coding)
+
+        for key in ("sr", "dr", "obs"):
+            self.assertIs(first[key], second[key])
+        self.assertEqual(len(builder.entry), 3)
+        self.assertIs(
+            builder.find_by_based_on("DiagnosticReport", "ServiceRequest/t1"),
+            first["dr"],
+        )
+
+    def test_condition_is_indexed_by_its_coding(self):
+        builder = BundleBuilder()
+        coding = self.codings["hiv-condition"]
+
+        condition, _ = find_or_create_condition_resource(builder, coding)
+        update_condition_resource(condition, self.row, coding=[coding])
+        again, _ = find_or_create_condition_resource(builder, coding)
+
+        self.assertIs(condition, again)
+        self.assertEqual(len(builder.entry), 1)
+
+    def test_build(self):
+        builder = BundleBuilder()
+        obs = builder.add(observation("o1", self.codings["hiv-test"]))
+        obs["valueString"] = "added after"
+
+        bundle = builder.build()
+
+        self.assertIsInstance(bundle, Bundle)
+        self.assertEqual(bundle.type, "transaction")
+        self.assertEqual(bundle.entry[0].request.method, "PUT")
+        self.assertEqual(bundle.entry[0].request.url, "Observation")
+        self.assertEqual(bundle.entry[0].resource.valueString, "added after")
+
+    def test_build_without_validation(self):
+        builder = BundleBuilder(meta={"tag": [{"code": "test"}]})
+        builder.add(observation("o1", self.codings["hiv-test"]))
+
+        bundle = builder.build(validate=False)
+
+        self.assertIsInstance(bundle, dict)
+        self.assertEqual(bundle["meta"], {"tag": [{"code": "test"}]})
+        self.assertEqual(
+            Bundle.parse_obj(bundle).json(), builder.build(validate=True).json()
+        )
+
+    def test_invalid_resources_fail_validation(self):
+        builder = BundleBuilder()
+        builder.add({"resourceType": "Observation", "status": "final", "bogus": 1})
+
+        with self.assertRaises(ValueError):
+            builder.build()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import datetime
 import os
+import tempfile
 import unittest
 from unittest.mock import MagicMock
 from fhir.resources.measurereport import MeasureReport
@@ -63,5 +64,206 @@ class TestBundleGenerator(unittest.TestCase):
                 )
 
 
+class TestShardedBundleGeneration(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tmp_dir.name, "test_data.xlsx")
+
+        features = BundleGenerator.features["HIV.IND.27"]
+        rows = []
+        for i in range(7):
+            row = {
+                "Bundle #": i,
+                "Patient.id": f"patient-{i}",
+                "Patient.gender": "female",
+                "Patient.birthDate": "1990-01-01",
+                "Key population member type": "Sex worker",
+            }
+            row.update({feature: (i + j) % 2 for j, feature in enumerate(features)})
+            row["Numerator"] = i % 2
+            row["Denominator"] = 1
+            rows.append(row)
+        with pd.ExcelWriter(self.input_path) as writer:
+            pd.DataFrame(rows).to_excel(writer, sheet_name="HIV.IND.27", index=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def generator(self, output_directory, seed=42, validate=1.0):
+        return BundleGenerator(
+            self.input_path,
+            output_directory,
+            "2024-01-01T00:00:00+00:00",
+            "2024-12-31T00:00:00+00:00",
+            validate=validate,
+            seed=seed,
+        )
+
+    def generate(self, jobs, validate=1.0):
+        output_directory = os.path.join(
+            self.tmp_dir.name, f"output_{jobs}_{validate}"
+        )
+        os.makedirs(output_directory)
+        return output_directory, self.generator(
+            output_directory, validate=validate
+        ).generate_ndjson_shards(jobs=jobs, shard_rows=3)
+
+    def test_output_does_not_depend_on_jobs(self):
+        # only some of the bundles are validated, which must not show in the output
+        serial_directory, serial = self.generate(jobs=1)
+        parallel_directory, parallel = self.generate(jobs=2, validate=0.5)
+
+        sheet_directory = os.path.join(serial_directory, "HIV.IND.27")
+        file_names = sorted(os.listdir(sheet_directory))
+        self.assertIn("0002.Observation.000.ndjson", file_names)
+        self.assertIn("MeasureReport.000.ndjson", file_names)
+        self.assertEqual(
+            file_names,
+            sorted(os.listdir(os.path.join(parallel_directory, "HIV.IND.27"))),
+        )
+        for file_name in file_names:
+            if file_name.startswith("MeasureReport"):
+                continue
+            with open(os.path.join(sheet_directory, file_name)) as f:
+                serial_content = f.read()
+            with open(os.path.join(parallel_directory, "HIV.IND.27", file_name)) as f:
+                self.assertEqual(f.read(), serial_content)
+
+        self.assertEqual(
+            [
+                population["count"]
+                for population in parallel["HIV.IND.27"]["MeasureReport"].group[0][
+                    "population"
+                ]
+            ],
+            [7, 3, 7],
+        )
+        self.assertEqual(len(serial["HIV.IND.27"]["files"]), len(file_names))
+
+    def test_measure_report_is_stratified_by_disaggregation(self):
+        generator = self.generator(self.tmp_dir.name)
+        measure_report = generator.generate_example_measure_report(
+            generator.measure_counts("HIV.IND.27")
+        )
+
+        stratifiers = {
+            stratifier["code"]["coding"][0]["code"]: {
+                stratum["valueCodeableConcept"]["text"]: [
+                    population["count"] for population in stratum["population"]
+                ]
+                for stratum in stratifier["stratum"]
+            }
+            for stratifier in measure_report.group[0]["stratifier"]
+        }
+        self.assertEqual(
+            stratifiers,
+            {
+                "age-band": {"30-34": [7, 3, 7]},
+                "gender": {"female": [7, 3, 7]},
+                "key-population": {"Sex worker": [7, 3, 7]},
+            },
+        )
+
+        age_bands = generator.age_band(
+            pd.Series(
+                ["2024-06-01", "2020-01-01", "1975-01-01", "1974-12-31", None]
+                + ["2025-06-01"]
+            )
+        )
+        self.assertEqual(age_bands[:4].tolist(), ["<1", "1-4", "45-49", "50+"])
+        self.assertTrue(age_bands[4:].isna().all())
+
+    def test_seeded_generation_is_reproducible(self):
+        def bundles(seed):
+            generator = self.generator(self.tmp_dir.name, seed)
+            return [bundle.json() for _, bundle in generator.iter_bundles()]
+
+        self.assertEqual(bundles(1), bundles(1))
+        self.assertNotEqual(bundles(1), bundles(2))
+
+        # rows do not depend on the rows generated before them
+        generator = self.generator(self.tmp_dir.name, 1)
+        _, bundle = next(generator.iter_sheet_bundles("HIV.IND.27", start=4))
+        self.assertEqual(bundle.json(), bundles(1)[4])
+
+    def test_generation_stats_aggregate_errors_by_feature(self):
+        generator = self.generator(self.tmp_dir.name)
+        list(generator.iter_bundles())
+        stats = generator.fhir_generator.stats
+        for feature in BundleGenerator.features["HIV.IND.27"]:
+            self.assertEqual(stats.generated[feature], 7)
+            self.assertEqual(stats.failed[feature], 0)
+            self.assertIn(feature, stats.summary())
+
+        def fail(row, bundle, header):
+            raise ValueError("no medication")
+
+        stats.clear()
+        generator.fhir_generator.generate_on_art_true_at_reporting_period_end_date = (
+            fail
+        )
+        list(generator.iter_bundles())
+        feature = '"On ART"=True at reporting period end date'
+        self.assertEqual(stats.failed[feature], 7)
+        self.assertEqual(stats.generated[feature], 0)
+        self.assertEqual(stats.errors[feature], {"ValueError: no medication": 7})
+        self.assertIn("7 x " + feature, stats.summary())
+
+    def test_invalid_resources_are_counted_without_ending_the_run(self):
+        generator = self.generator(self.tmp_dir.name)
+        stats = generator.fhir_generator.stats
+
+        def malformed(row, bundle, header):
+            bundle.add(
+                {
+                    "resourceType": "Observation",
+                    "status": "final",
+                    "code": {"text": header},
+                    "valueInteger": "many",
+                }
+            )
+            return bundle
+
+        generator.fhir_generator.generate_on_art_true_at_reporting_period_end_date = (
+            malformed
+        )
+        bundles = [bundle for _, bundle in generator.iter_bundles()]
+        self.assertEqual(len(bundles), 7)
+        for bundle in bundles:
+            self.assertIsInstance(bundle, dict)
+            self.assertIn(
+                "many",
+                [entry["resource"].get("valueInteger") for entry in bundle["entry"]],
+            )
+        self.assertEqual(stats.failed["Bundle"], 7)
+        self.assertEqual(
+            stats.errors["Bundle"],
+            {"Observation.valueInteger: value is not a valid integer": 7},
+        )
+        self.assertIn("7 x Bundle: Observation.valueInteger", stats.summary())
+
+    def test_csv_input_reads_needed_columns_with_compact_dtypes(self):
+        csv_directory = os.path.join(self.tmp_dir.name, "csv")
+        os.makedirs(csv_directory)
+        pd.read_excel(self.input_path).to_csv(
+            os.path.join(csv_directory, "HIV.IND.27.csv"), index=False
+        )
+        xlsx_generator = self.generator(self.tmp_dir.name, 1)
+        self.input_path = csv_directory
+        csv_generator = self.generator(self.tmp_dir.name, 1)
+
+        sheet_data = csv_generator.pd_data["HIV.IND.27"]
+        self.assertNotIn("Bundle #", sheet_data.columns)
+        self.assertEqual(sheet_data["Patient.id"].dtype, object)
+        self.assertEqual(sheet_data["Key population member type"].dtype, "category")
+        for feature in BundleGenerator.features["HIV.IND.27"]:
+            self.assertEqual(sheet_data[feature].dtype, bool)
+
+        self.assertEqual(
+            [bundle.json() for _, bundle in csv_generator.iter_bundles()],
+            [bundle.json() for _, bundle in xlsx_generator.iter_bundles()],
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+
+from who_l3_smart_tools.core.parsers.calculation_parser import (
+    parse_calculation_expression,
+    parse_exclusion_terms,
+    tokenize,
+)
+
+
+class TestCalculationParser(unittest.TestCase):
+    def test_tokenize_keeps_quoted_elements_and_values_together(self):
+        tokens = [
+            (token.kind, token.text)
+            for token in tokenize('("Date(s) of switch" IN \'A, B\') OR x>=3')
+            if token.kind != "space"
+        ]
+        self.assertEqual(
+            tokens,
+            [
+                ("open", "("),
+                ("element", '"Date(s) of switch"'),
+                ("word", "IN"),
+                ("value", "'A, B'"),
+                ("close", ")"),
+                ("word", "OR"),
+                ("word", "x"),
+                ("operator", ">="),
+                ("word", "3"),
+            ],
+        )
+
+    def test_parse_count_calculation(self):
+        calculation = parse_calculation_expression(
+            "COUNT of tests with \"HIV test result\"='HIV-positive' AND "
+            '(("Date HIV test results returned" in the reporting period) OR '
+            '("HIV diagnosis date" in the reporting period))'
+        )
+        self.assertEqual(calculation.operation, "COUNT")
+        self.assertEqual(calculation.scope, "tests")
+        self.assertEqual(
+            calculation.terms,
+            (
+                "\"HIV test result\"='HIV-positive'",
+                '(("Date HIV test results returned" in the reporting period)',
+                '("HIV diagnosis date" in the reporting period))',
+            ),
+        )
+        self.assertEqual(calculation.connectives, ("AND", "OR"))
+        self.assertEqual(calculation.condition, ("AND", [0, ("OR", [1, 2])]))
+
+    def test_parse_sum_and_constant_calculations(self):
+        calculation = parse_calculation_expression(
+            'SUM of "Number of days prescribed" for all clients with '
+            "\"Medications prescribed\"='PrEP for HIV prevention'"
+        )
+        self.assertEqual(calculation.operation, "SUM")
+        self.assertEqual(calculation.scope, "clients")
+        self.assertEqual(
+            calculation.terms,
+            (
+                '"Number of days prescribed"',
+                "\"Medications prescribed\"='PrEP for HIV prevention'",
+            ),
+        )
+        self.assertEqual(calculation.condition, ("AND", [0, 1]))
+
+        self.assertTrue(parse_calculation_expression("1").is_constant)
+        self.assertEqual(parse_calculation_expression("Not included in DAK").terms, ())
+
+    def test_connectives_within_quotes_do_not_split_terms(self):
+        calculation = parse_calculation_expression(
+            "COUNT of women with \"Cervical cancer diagnosis\"='Invasive' for a "
+            '"Date of diagnosis of precancer lesions or invasive cancer" in the '
+            "reporting period\nPLUS\nCOUNT of clients with \"On ART\"=True"
+        )
+        self.assertEqual(len(calculation.terms), 1)
+        self.assertEqual(calculation.condition, 0)
+
+    def test_parsed_calculations_are_memoized(self):
+        text = 'COUNT of clients with "On ART"=True'
+        self.assertIs(
+            parse_calculation_expression(text), parse_calculation_expression(text)
+        )
+
+    def test_parse_exclusion_terms(self):
+        self.assertEqual(
+            parse_exclusion_terms(
+                "Clients with an \"HIV treatment outcome\" IN 'Lost to follow up', "
+                "'Death (documented)' at the end of the reporting period"
+            ),
+            (
+                "\"HIV treatment outcome\" IN 'Lost to follow up'",
+                "\"HIV treatment outcome\" IN 'Death (documented)'",
+            ),
+        )
+        self.assertEqual(
+            parse_exclusion_terms("died, or refused"), ("died", " or refused")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
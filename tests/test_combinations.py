@@ -0,0 +1,84 @@
+import itertools
+import unittest
+
+from who_l3_smart_tools.core.indicator_testing.combinations import (
+    covering_combinations,
+    generate_combinations,
+    mcdc_combinations,
+    parse_condition,
+)
+from who_l3_smart_tools.core.indicator_testing.scaffolding_generator import (
+    parse_calculation,
+    parse_connectives,
+)
+
+
+def evaluate(condition, combination):
+    if isinstance(condition, int):
+        return bool(combination[condition])
+    operator, operands = condition
+    values = [evaluate(operand, combination) for operand in operands]
+    if operator == "NOT":
+        return not values[0]
+    return all(values) if operator == "AND" else any(values)
+
+
+class TestCombinations(unittest.TestCase):
+    calculation = (
+        "COUNT of clients with \"HIV test result\"='HIV-positive' AND "
+        '"HIV test date" in the reporting period AND (("Date HIV test results '
+        'returned" in the reporting period) OR ("HIV diagnosis date" in the '
+        "reporting period))"
+    )
+
+    def test_parse_condition_follows_parentheses(self):
+        terms, _ = parse_calculation(self.calculation)
+        connectives = parse_connectives(self.calculation)
+        self.assertEqual(connectives, ["AND", "AND", "OR"])
+
+        condition = parse_condition(terms, connectives, num_exclusions=1)
+        self.assertEqual(
+            condition,
+            ("AND", [("AND", [0, 1, ("OR", [2, 3])]), ("NOT", [4])]),
+        )
+
+    def test_covering_arrays_cover_every_combination(self):
+        for num_terms, strength in [(1, 2), (5, 2), (12, 2), (8, 3)]:
+            rows = list(covering_combinations(num_terms, strength))
+            for columns in itertools.combinations(range(num_terms), strength):
+                self.assertEqual(
+                    {tuple(row[column] for column in columns) for row in rows},
+                    set(itertools.product((0, 1), repeat=len(columns))),
+                )
+        self.assertLess(len(list(covering_combinations(20))), 30)
+
+    def test_mcdc_shows_each_term_changing_the_outcome(self):
+        terms, _ = parse_calculation(self.calculation)
+        condition = parse_condition(
+            terms, parse_connectives(self.calculation), num_exclusions=2
+        )
+        rows = list(mcdc_combinations(condition, 6))
+
+        self.assertLessEqual(len(rows), 2 * 6)
+        for term in range(6):
+            self.assertTrue(
+                any(
+                    row[term] == 1
+                    and row[:term] + (0,) + row[term + 1 :] in rows
+                    and evaluate(condition, row)
+                    != evaluate(condition, row[:term] + (0,) + row[term + 1 :])
+                    for row in rows
+                ),
+                f"term {term}",
+            )
+
+    def test_generate_combinations_is_lazy_and_bounded(self):
+        rows = generate_combinations("exhaustive", 40, max_rows=3)
+        self.assertEqual(list(rows), [(0,) * 40, (0,) * 39 + (1,), (0,) * 38 + (1, 0)])
+        self.assertEqual(len(list(generate_combinations("mcdc", 3))), 8)
+        with self.assertRaises(ValueError):
+            generate_combinations("random", 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
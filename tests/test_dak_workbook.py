@@ -0,0 +1,166 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from who_l3_smart_tools.core.parsers.dak_workbook import DakWorkbook
+from who_l3_smart_tools.core.parsers.logical_model_parser import LogicalModelParser
+from who_l3_smart_tools.utils.cache import (
+    ParsedFileCache,
+    code_version,
+    get_cache_dir,
+    set_cache_dir,
+)
+
+
+class _Record:
+    pass
+
+
+class TestDakWorkbook(unittest.TestCase):
+    def setUp(self):
+        self.input_file = os.path.join("tests", "data", "l2", "test_dd.xlsx")
+        self.cache_dir = tempfile.mkdtemp()
+        self.previous_cache_dir = get_cache_dir()
+        set_cache_dir(self.cache_dir)
+
+    def tearDown(self):
+        set_cache_dir(self.previous_cache_dir)
+        DakWorkbook.close_all()
+        shutil.rmtree(self.cache_dir)
+
+    def test_open_is_shared(self):
+        workbook = DakWorkbook.open(self.input_file)
+
+        self.assertIs(workbook, DakWorkbook.open(os.path.abspath(self.input_file)))
+        self.assertIs(workbook, DakWorkbook.open(workbook))
+
+    def test_sheets_are_parsed_lazily(self):
+        workbook = DakWorkbook.open(self.input_file)
+
+        self.assertIn("HIV.A Registration", workbook)
+        self.assertEqual(workbook._frames, {})
+
+        df = workbook["HIV.A Registration"]
+
+        self.assertIs(df, workbook["HIV.A Registration"])
+        self.assertEqual(list(workbook._frames.keys()), ["HIV.A Registration"])
+
+    def test_sheet_matches_read_excel(self):
+        workbook = DakWorkbook.open(self.input_file)
+        expected = pd.read_excel(self.input_file, sheet_name="HIV.B HTS visit")
+
+        pd.testing.assert_frame_equal(expected, workbook["HIV.B HTS visit"])
+
+    def test_iter_rows_matches_openpyxl(self):
+        workbook = DakWorkbook.open(self.input_file)
+        expected = load_workbook(self.input_file)["HIV.A Registration"]
+
+        self.assertEqual(
+            list(expected.iter_rows(values_only=True)),
+            list(workbook.iter_rows("HIV.A Registration")),
+        )
+
+    def test_iter_records_uses_header_row(self):
+        workbook = DakWorkbook.open(self.input_file)
+
+        record = next(workbook.iter_records("HIV.A Registration"))
+
+        self.assertEqual(record["Data Element ID"], "HIV.A.DE1")
+
+    def test_closed_workbook_is_reopened(self):
+        with DakWorkbook.open(self.input_file) as workbook:
+            workbook["HIV.A Registration"]
+
+        self.assertIsNone(workbook._excel_file)
+        self.assertGreater(len(list(workbook.iter_rows("HIV.B HTS visit"))), 0)
+
+    def test_missing_sheet(self):
+        workbook = DakWorkbook.open(self.input_file)
+
+        with self.assertRaises(KeyError):
+            workbook["Not a sheet"]
+
+
+class TestDakWorkbookCache(unittest.TestCase):
+    def setUp(self):
+        self.input_file = os.path.join("tests", "data", "l2", "test_dd.xlsx")
+        self.cache_dir = tempfile.mkdtemp()
+        self.previous_cache_dir = get_cache_dir()
+
+    def tearDown(self):
+        set_cache_dir(self.previous_cache_dir)
+        DakWorkbook.close_all()
+        shutil.rmtree(self.cache_dir)
+
+    def _workbook(self):
+        return DakWorkbook(
+            self.input_file, ParsedFileCache(self.input_file, self.cache_dir)
+        )
+
+    def test_cached_sheets_do_not_open_excel(self):
+        first = self._workbook()
+        expected_frame = first["HIV.A Registration"]
+        expected_rows = list(first.iter_rows("HIV.A Registration"))
+
+        second = self._workbook()
+
+        pd.testing.assert_frame_equal(expected_frame, second["HIV.A Registration"])
+        self.assertEqual(expected_rows, list(second.iter_rows("HIV.A Registration")))
+        self.assertEqual(first.sheet_names, second.sheet_names)
+        self.assertIsNone(second._excel_file)
+
+    def test_partially_read_rows_are_not_cached(self):
+        first = self._workbook()
+        rows = first.iter_rows("HIV.A Registration")
+        next(rows)
+        rows.close()
+
+        self.assertIsNone(
+            first.cache.load_records("rows:HIV.A Registration"),
+        )
+
+    def test_unreadable_rows_are_read_from_the_workbook(self):
+        first = self._workbook()
+        expected = list(first.iter_rows("HIV.A Registration"))
+        cache_key = "rows:HIV.A Registration"
+
+        # rows written by an older version, whose classes no longer exist
+        with open(first.cache._path(cache_key), "wb") as f:
+            pickle.dump(expected[0], f)
+            f.write(pickle.dumps(_Record()).replace(b"_Record", b"_Remove"))
+
+        second = self._workbook()
+        self.assertEqual(expected, list(second.iter_rows("HIV.A Registration")))
+        self.assertEqual(expected, list(second.cache.load_records(cache_key)))
+
+    def test_entries_are_keyed_on_the_parser_code(self):
+        cache = ParsedFileCache(self.input_file, self.cache_dir)
+
+        self.assertIn(code_version()[:16], cache.directory.split(os.sep))
+
+    def test_logical_model_is_restored_from_cache(self):
+        set_cache_dir(self.cache_dir)
+
+        parser = LogicalModelParser(self.input_file)
+        parser.parse_logical_model()
+
+        DakWorkbook.close_all()
+        cached_parser = LogicalModelParser(self.input_file)
+        cached_parser.parse_logical_model()
+
+        self.assertEqual(parser.dak_name, cached_parser.dak_name)
+        self.assertEqual(parser.cover_info, cached_parser.cover_info)
+        self.assertEqual(
+            list(parser.logical_model.data_element_records),
+            list(cached_parser.logical_model.data_element_records),
+        )
+        self.assertIsNone(DakWorkbook.open(self.input_file)._excel_file)
+
+
+if __name__ == "__main__":
+    unittest.main()
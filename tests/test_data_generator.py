@@ -1,5 +1,16 @@
+import datetime
+import os
+import tempfile
 import unittest
-from who_l3_smart_tools.core.indicator_testing.data_generator import DataGenerator
+from unittest.mock import patch
+
+from who_l3_smart_tools.core.indicator_testing import (
+    data_generator as data_generator_module,
+)
+from who_l3_smart_tools.core.indicator_testing.data_generator import (
+    DataGenerator,
+    read_data_file,
+)
 
 
 class TestDataGenerator(unittest.TestCase):
@@ -33,5 +44,110 @@ class TestDataGenerator(unittest.TestCase):
         self.assertTrue(path)
 
 
+class TestSeededDataGenerator(unittest.TestCase):
+    file_name = "tests/data/scaffolding/indicator_test_output_MINI_2405313_mod_2.xlsx"
+
+    def generate(self, seed):
+        data_generator = DataGenerator(self.file_name, seed=seed)
+        return {
+            sheet_name: data_generator.generate_data_sheet(sheet_name, 20)
+            for sheet_name in data_generator.get_excel_data().keys()
+        }
+
+    def test_seeded_generation_is_reproducible(self):
+        first = self.generate(seed=5)
+        second = self.generate(seed=5)
+
+        for sheet_name, sheet_data in first.items():
+            self.assertTrue(sheet_data.equals(second[sheet_name]))
+        other = self.generate(seed=6)
+        self.assertFalse(
+            all(
+                sheet_data.equals(other[sheet_name])
+                for sheet_name, sheet_data in first.items()
+            )
+        )
+
+    def test_dates_of_birth_are_drawn_at_the_reference_date(self):
+        def birth_dates(today):
+            with patch.object(data_generator_module, "date") as mock_date:
+                mock_date.today.return_value = today
+                data_generator = DataGenerator(
+                    self.file_name, seed=5, reference_date=datetime.date(2024, 2, 29)
+                )
+                return [
+                    data_generator.generate_data_sheet(sheet_name, 200)[
+                        "Patient.birthDate"
+                    ]
+                    for sheet_name in data_generator.get_excel_data().keys()
+                ]
+
+        first = birth_dates(datetime.date(2024, 3, 1))
+        second = birth_dates(datetime.date(2030, 1, 1))
+        for dobs, other_dobs in zip(first, second):
+            self.assertTrue(dobs.equals(other_dobs))
+            dobs = dobs.dropna()
+            self.assertGreaterEqual(dobs.min(), datetime.date(1923, 3, 1))
+            self.assertLessEqual(dobs.max(), datetime.date(2006, 2, 28))
+
+    def test_random_rows_copy_example_phenotypes(self):
+        data_generator = DataGenerator(self.file_name, seed=1)
+        for sheet_name, examples in data_generator.get_excel_data().items():
+            parsed_data = data_generator.get_parsed_data()[sheet_name]
+            sheet_data = data_generator.generate_data_sheet(sheet_name, 50)
+            self.assertEqual(len(sheet_data), len(examples) + 50)
+            self.assertEqual(
+                sheet_data["Bundle #"].tolist(), list(range(1, len(sheet_data) + 1))
+            )
+            self.assertTrue(sheet_data["Patient.id"].is_unique)
+
+            phenotype_headers = [
+                header
+                for header in sheet_data.columns
+                if header in parsed_data["numerator_terms"]
+                or header in parsed_data["denominator_terms"]
+            ]
+            phenotypes = set(examples[phenotype_headers].itertuples(index=False))
+            for row in sheet_data[phenotype_headers].itertuples(index=False):
+                self.assertIn(row, phenotypes)
+
+    def test_blank_numerator_values_are_calculated(self):
+        data_generator = DataGenerator(self.file_name, seed=1)
+        examples = data_generator.get_excel_data()["HIV.IND.19"]
+        parsed_data = data_generator.get_parsed_data()["HIV.IND.19"]
+        self.assertEqual(parsed_data["numerator_exclusions"], ("Self-testing",))
+
+        values_index = parsed_data["numerator_index"] + 1
+        typed_values = examples.iloc[:, values_index].tolist()
+        examples.isetitem(values_index, None)
+
+        sheet_data = data_generator.generate_data_sheet("HIV.IND.19", 0)
+        self.assertEqual(sheet_data["Numerator"].tolist(), typed_values)
+
+    def test_data_file_formats_read_back_equal(self):
+        data_generator = DataGenerator(self.file_name, seed=1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            xlsx_path = os.path.join(tmp_dir, "test_data.xlsx")
+            csv_path = os.path.join(tmp_dir, "test_data")
+            data_generator.generate_data_file(xlsx_path, 20)
+            data_generator.generate_data_file(csv_path, 20, file_format="csv")
+
+            xlsx_data = read_data_file(xlsx_path)
+            csv_data = read_data_file(csv_path)
+
+        self.assertEqual(
+            list(xlsx_data.keys()), list(data_generator.get_excel_data().keys())
+        )
+        self.assertEqual(sorted(csv_data.keys()), sorted(xlsx_data.keys()))
+        for sheet_name, sheet_data in xlsx_data.items():
+            self.assertEqual(
+                sheet_data.columns.tolist(), csv_data[sheet_name].columns.tolist()
+            )
+            self.assertEqual(
+                sheet_data["Patient.id"].tolist(),
+                csv_data[sheet_name]["Patient.id"].tolist(),
+            )
+
+
 if __name__ == "__main__":
     unittest.main()
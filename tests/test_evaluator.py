@@ -0,0 +1,88 @@
+import itertools
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from who_l3_smart_tools.core.indicator_testing.evaluator import (
+    count_measure,
+    evaluate_calculation,
+)
+from who_l3_smart_tools.core.parsers.calculation_parser import (
+    parse_calculation_expression,
+)
+
+
+class TestEvaluator(unittest.TestCase):
+    calculation = parse_calculation_expression(
+        "COUNT of clients with \"HIV test result\"='HIV-positive' AND "
+        '"HIV test date" in the reporting period AND (("Date HIV test results '
+        'returned" in the reporting period) OR ("HIV diagnosis date" in the '
+        "reporting period))"
+    )
+
+    def test_evaluate_calculation_matches_row_by_row_evaluation(self):
+        terms = list(self.calculation.terms) + ["Self-testing"]
+        data = pd.DataFrame(
+            list(itertools.product((0, 1), repeat=len(terms))), columns=terms
+        )
+
+        expected = data.apply(
+            lambda row: int(
+                row.iloc[0]
+                and row.iloc[1]
+                and (row.iloc[2] or row.iloc[3])
+                and not row.iloc[4]
+            ),
+            axis=1,
+        )
+        numerator = evaluate_calculation(self.calculation, data, ["Self-testing"])
+        self.assertEqual(numerator.tolist(), expected.tolist())
+
+        # Blank and text values, as read from CSV files
+        data = data.astype(object)
+        data.iloc[-1, 0] = None
+        data.iloc[-2, 0] = "True"
+        numerator = evaluate_calculation(self.calculation, data, ["Self-testing"])
+        self.assertEqual(numerator[-2:].tolist(), [1, 0])
+
+    def test_evaluate_calculation_needs_a_column_per_term(self):
+        data = pd.DataFrame({"Self-testing": [0, 1]})
+        self.assertEqual(
+            evaluate_calculation(parse_calculation_expression("1"), data).tolist(),
+            [1, 1],
+        )
+        with self.assertRaises(ValueError):
+            evaluate_calculation(self.calculation, data)
+        with self.assertRaises(ValueError):
+            evaluate_calculation(
+                parse_calculation_expression("Not included in DAK"), data
+            )
+
+    def test_count_measure_by_stratum(self):
+        counts = count_measure(
+            numerator=[1, 0, 1, None],
+            denominator=np.array([1, 1, 1, 1]),
+            strata={
+                "Patient.gender": pd.Series(
+                    ["female", "male", "female", "male"], index=[5, 6, 7, 8]
+                ),
+                "Key population member type": ["FSW", None, "MSM", "MSM"],
+            },
+        )
+        self.assertEqual(counts[:3], (4, 2, 4))
+        self.assertEqual(
+            counts.strata["Patient.gender"].to_dict("index"),
+            {
+                "female": {"initial-population": 2, "numerator": 2, "denominator": 2},
+                "male": {"initial-population": 2, "numerator": 0, "denominator": 2},
+            },
+        )
+        self.assertEqual(
+            counts.strata["Key population member type"]["numerator"].to_dict(),
+            {"FSW": 1, "MSM": 1},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from fhir.resources.bundle import Bundle
+
+from who_l3_smart_tools.utils.fhirclient import AsyncFhirUploader, FhirUploader
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.reason = "Error" if status_code >= 400 else "OK"
+        self.headers = headers or {}
+        self._body = body
+
+    def json(self):
+        if self._body is None:
+            raise ValueError("No JSON body")
+        return self._body
+
+
+class FakeSession:
+    """Records the bundles posted to it and replies with the queued responses."""
+
+    def __init__(self, responses=None):
+        self.responses = list(responses or [])
+        self.bundles = []
+
+    def post(self, url, data, headers, timeout):
+        self.bundles.append(json.loads(data))
+        if self.responses:
+            return self.responses.pop(0)
+        return FakeResponse(200, {"resourceType": "Bundle", "type": "response"})
+
+
+def patient_bundle(patient_id, entries=2):
+    return Bundle.parse_obj(
+        {
+            "resourceType": "Bundle",
+            "type": "transaction",
+            "entry": [
+                {
+                    "resource": {
+                        "resourceType": "Patient",
+                        "id": f"{patient_id}-{i}",
+                    },
+                    "request": {"method": "PUT", "url": f"Patient/{patient_id}-{i}"},
+                }
+                for i in range(entries)
+            ],
+        }
+    )
+
+
+class TestFhirUploader(unittest.TestCase):
+    def test_bundles_are_coalesced_without_splitting(self):
+        session = FakeSession()
+
+        with FhirUploader(
+            "http://fhir", max_entries=5, max_workers=1, session=session
+        ) as uploader:
+            for i in range(5):
+                uploader.add(patient_bundle(f"p{i}"))
+
+        self.assertEqual([len(b["entry"]) for b in session.bundles], [4, 4, 2])
+        self.assertTrue(all(b["type"] == "transaction" for b in session.bundles))
+        self.assertEqual(
+            session.bundles[0]["entry"][2]["resource"]["id"],
+            "p1-0",
+        )
+        self.assertEqual(uploader.report.requests, 3)
+        self.assertEqual(uploader.report.entries, 10)
+        self.assertEqual(uploader.report.failures, [])
+
+    def test_transient_errors_are_retried(self):
+        session = FakeSession([FakeResponse(503), FakeResponse(200, {})])
+
+        with FhirUploader(
+            "http://fhir", max_workers=1, backoff=0, session=session
+        ) as uploader:
+            uploader.add(patient_bundle("p0"))
+
+        self.assertEqual(len(session.bundles), 2)
+        self.assertEqual(uploader.report.entries, 2)
+        self.assertEqual(uploader.report.failures, [])
+
+    def test_failures_are_reported(self):
+        outcome = {
+            "resourceType": "OperationOutcome",
+            "issue": [{"severity": "error", "diagnostics": "Invalid resource"}],
+        }
+        session = FakeSession([FakeResponse(400, outcome)])
+
+        with FhirUploader(
+            "http://fhir", max_entries=2, max_workers=1, session=session
+        ) as uploader:
+            uploader.add(patient_bundle("p0"))
+            uploader.add(patient_bundle("p1"))
+
+        self.assertEqual(len(uploader.report.failures), 1)
+        failure = uploader.report.failures[0]
+        self.assertEqual(failure.bundles, [0])
+        self.assertEqual(failure.status, 400)
+        self.assertEqual(failure.message, "Invalid resource")
+        self.assertEqual(uploader.report.entries, 2)
+
+    def test_batch_entry_failures_are_reported(self):
+        statuses = ["201 Created"] * 6
+        statuses[1] = statuses[4] = "422 Unprocessable Entity"
+        response = {
+            "resourceType": "Bundle",
+            "type": "batch-response",
+            "entry": [{"response": {"status": status}} for status in statuses],
+        }
+        session = FakeSession([FakeResponse(200, response)])
+
+        with FhirUploader(
+            "http://fhir", bundle_type="batch", max_workers=1, session=session
+        ) as uploader:
+            uploader.add(patient_bundle("p0"))
+            uploader.add(patient_bundle("p1", entries=0))
+            uploader.add(patient_bundle("p2", entries=3))
+            uploader.add(patient_bundle("p3", entries=1))
+
+        self.assertEqual(session.bundles[0]["type"], "batch")
+        self.assertEqual(uploader.report.entries, 4)
+        # each failed entry names the bundle it came from
+        self.assertEqual(
+            [
+                (failure.bundles, failure.status)
+                for failure in uploader.report.failures
+            ],
+            [([0], 422), ([2], 422)],
+        )
+
+
+class FhirServerHandler(BaseHTTPRequestHandler):
+    """Accepts every bundle, except the first request which fails with a 503."""
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        bundle = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests += 1
+        if self.server.requests == 1:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.server.bundles.append(bundle)
+        body = json.dumps(
+            {"resourceType": "Bundle", "type": "transaction-response"}
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/fhir+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+class TestAsyncFhirUploader(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), FhirServerHandler)
+        self.server.requests = 0
+        self.server.bundles = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/fhir"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_upload(self):
+        async def upload():
+            async with AsyncFhirUploader(
+                self.url, max_entries=4, max_workers=2, backoff=0
+            ) as uploader:
+                for i in range(5):
+                    await uploader.add(patient_bundle(f"p{i}"))
+            return uploader.report
+
+        report = asyncio.run(upload())
+
+        self.assertEqual(report.entries, 10)
+        self.assertEqual(report.requests, 3)
+        self.assertEqual(report.failures, [])
+        self.assertEqual(
+            sorted(len(bundle["entry"]) for bundle in self.server.bundles), [2, 4, 4]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,9 @@
 # Generated by CodiumAI
 from datetime import datetime, timezone
 import os
+import tempfile
 from who_l3_smart_tools.core.indicator_testing.scaffolding_generator import (
+    MAX_ROWS,
     ScaffoldingGenerator,
 )
 import pandas as pd
@@ -34,6 +36,23 @@ class TestGenerateTestScaffolding(unittest.TestCase):
 
         assert 29 == actual_sheets
 
+    # Fills are applied once per block of columns, whatever the number of rows
+    def test_generate_test_scaffolding_paints_column_blocks(self):
+        input_file = "tests/data/l2/test_indicators.xlsx"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = os.path.join(tmp_dir, "scaffolding.xlsx")
+            ScaffoldingGenerator(
+                input_file, output_file, combinations="mcdc"
+            ).generate_test_scaffolding()
+            wb = load_workbook(output_file)
+
+        ws = wb["HIV.IND.27"]
+        ranges = [str(cf.sqref) for cf in ws.conditional_formatting]
+        self.assertEqual(len(ranges), 4)
+        self.assertEqual(ranges[0], f"A1:A{MAX_ROWS}")
+        self.assertEqual(ws["B2"].fill.fill_type, None)
+        self.assertEqual(ws.max_row, 7)
+
     # The input file does not exist.
     def test_generate_test_scaffolding_input_file_not_exist(self):
         input_file = "path/to/nonexistent_input_file.xlsx"
@@ -3,9 +3,12 @@ import os
 import pandas as pd
 import shutil
 import sys
+import tempfile
+from unittest import mock
 from who_l3_smart_tools.core.logical_models.logical_model_generator import (
     LogicalModelAndTerminologyGenerator,
 )
+from who_l3_smart_tools.utils.manifest import MANIFEST_FILE
 
 
 class TestLogicalModelAndTerminologyGenerator(unittest.TestCase):
@@ -45,6 +48,109 @@ class TestFullLogicalModelGeneration(unittest.TestCase):
 
         generator.generate_fsh_from_excel()
 
+    def test_parallel_generation_matches_serial(self):
+        serial_dir = os.path.join(self.output_dir, "serial")
+        parallel_dir = os.path.join(self.output_dir, "parallel")
+
+        LogicalModelAndTerminologyGenerator(
+            self.input_file, serial_dir
+        ).generate_fsh_from_excel()
+        LogicalModelAndTerminologyGenerator(
+            self.input_file, parallel_dir
+        ).generate_fsh_from_excel(jobs=2)
+
+        for root, _, files in os.walk(serial_dir):
+            for file in files:
+                if file == MANIFEST_FILE:
+                    continue
+
+                serial_file = os.path.join(root, file)
+                parallel_file = os.path.join(
+                    parallel_dir, os.path.relpath(serial_file, serial_dir)
+                )
+
+                with open(serial_file, "r") as f:
+                    expected = f.read()
+                with open(parallel_file, "r") as f:
+                    self.assertEqual(expected, f.read(), serial_file)
+
+
+class TestIncrementalLogicalModelGeneration(unittest.TestCase):
+    def setUp(self) -> None:
+        self.input_file = os.path.join("tests", "data", "l2", "test_dd.xlsx")
+        self.output_dir = tempfile.mkdtemp()
+        self.model_file = os.path.join(
+            self.output_dir, "models", "HIVARegistration.fsh"
+        )
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.output_dir)
+
+    def _generate(self, jobs=1):
+        LogicalModelAndTerminologyGenerator(
+            self.input_file, self.output_dir
+        ).generate_fsh_from_excel(jobs=jobs)
+
+    def _read_output(self):
+        output = {}
+        for root, _, files in os.walk(self.output_dir):
+            for file in files:
+                if file != MANIFEST_FILE:
+                    with open(os.path.join(root, file), "r") as f:
+                        output[os.path.join(root, file)] = f.read()
+        return output
+
+    def test_unchanged_files_are_not_rewritten(self):
+        self._generate()
+        mtime = os.stat(self.model_file).st_mtime_ns
+
+        self._generate()
+
+        self.assertEqual(os.stat(self.model_file).st_mtime_ns, mtime)
+
+    def test_unchanged_sheets_are_not_generated(self):
+        self._generate()
+        expected = self._read_output()
+
+        for jobs in (1, 2):
+            with mock.patch.object(
+                LogicalModelAndTerminologyGenerator,
+                "generate_sheet",
+                side_effect=AssertionError("generated"),
+            ):
+                self._generate(jobs)
+            self.assertEqual(expected, self._read_output())
+
+        # only the sheet whose file was modified is generated again
+        with open(self.model_file, "a") as f:
+            f.write("// local edit\n")
+        generate_sheet = LogicalModelAndTerminologyGenerator.generate_sheet
+        with mock.patch.object(
+            LogicalModelAndTerminologyGenerator,
+            "generate_sheet",
+            autospec=True,
+            side_effect=generate_sheet,
+        ) as generated:
+            self._generate()
+        self.assertEqual(
+            [call.args[1] for call in generated.call_args_list],
+            ["HIV.A Registration"],
+        )
+        self.assertEqual(expected, self._read_output())
+
+    def test_modified_files_are_rewritten(self):
+        self._generate()
+        with open(self.model_file, "r") as f:
+            expected = f.read()
+
+        with open(self.model_file, "a") as f:
+            f.write("// local edit\n")
+
+        self._generate()
+
+        with open(self.model_file, "r") as f:
+            self.assertEqual(expected, f.read())
+
 
 if __name__ == "__main__":
     unittest.main()
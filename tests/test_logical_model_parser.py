@@ -0,0 +1,97 @@
+import os
+import pickle
+import unittest
+
+from who_l3_smart_tools.core.models.logical_model import (
+    DataElementRecord,
+    Invariant,
+    MultipleChoiceType,
+    QuantityType,
+    RequiredType,
+)
+from who_l3_smart_tools.core.parsers.logical_model_parser import LogicalModelParser
+from who_l3_smart_tools.utils.cache import get_cache_dir, set_cache_dir
+
+
+class TestLogicalModelParser(unittest.TestCase):
+    def setUp(self):
+        self.input_file = os.path.join("tests", "data", "l2", "test_dd.xlsx")
+        # always parse the workbook rather than restoring a cached model
+        self.previous_cache_dir = get_cache_dir()
+        set_cache_dir(None)
+
+        self.parser = LogicalModelParser(self.input_file)
+        self.parser.parse_logical_model()
+        self.records = self.parser.logical_model.data_element_records
+
+    def tearDown(self):
+        set_cache_dir(self.previous_cache_dir)
+
+    def test_other_specify_is_named_for_valueset(self):
+        record = self.records["HIV.A.DE24"]
+
+        self.assertEqual(record.data_element_label, "Other (specify)")
+        self.assertEqual(record.data_element_label_camel, "otherGender")
+
+    def test_coding_defaults_to_one_of(self):
+        record = self.records["HIV.A.DE5"]
+
+        self.assertEqual(record.data_type, "Coding")
+        self.assertEqual(record.multiple_choice_type, MultipleChoiceType.ONE_OF)
+        self.assertEqual(record.required, RequiredType.CONDITIONAL)
+        self.assertEqual(record.decision_support_tables, [])
+        self.assertIsNone(record.annotations)
+
+    def test_quantity_subtype(self):
+        record = self.records["HIV.A.DE16"]
+
+        self.assertEqual(record.quantity_subtype, QuantityType.DURATION)
+        self.assertIsNone(record.multiple_choice_type)
+
+    def test_records_by_name(self):
+        records_by_name = self.parser.logical_model.data_element_records_by_name
+
+        for label, records in records_by_name.items():
+            for record in records:
+                self.assertEqual(record.data_element_label, label)
+                self.assertIs(record, self.records[record.data_element_id])
+
+
+class TestDataElementRecord(unittest.TestCase):
+    def test_collections_are_allocated_on_first_access(self):
+        record = DataElementRecord("HIV.A.DE1")
+
+        self.assertFalse(hasattr(record, "__dict__"))
+        self.assertEqual(record.invariants, [])
+
+        record.invariants += [Invariant("HIV.A.DE1-1")]
+        record.decision_support_tables.append("HIV.DT.1")
+
+        self.assertEqual(record.invariants[0].invariant_id, "HIV.A.DE1-1")
+        self.assertEqual(record.decision_support_tables, ["HIV.DT.1"])
+        self.assertEqual(record.aggregate_indicators, [])
+
+    def test_repeated_strings_are_interned(self):
+        first = DataElementRecord("HIV.A.DE1")
+        second = DataElementRecord("HIV.A.DE2")
+
+        first.data_type = "".join(["Cod", "ing"])
+        second.data_type = "".join(["Codi", "ng"])
+
+        self.assertIs(first.data_type, second.data_type)
+
+    def test_pickle_round_trip(self):
+        record = DataElementRecord("HIV.A.DE1")
+        record.activity_id = "HIV.A1"
+        record.extra_attributes["key"] = "value"
+
+        restored = pickle.loads(pickle.dumps(record))
+
+        self.assertEqual(restored.data_element_id, "HIV.A.DE1")
+        self.assertEqual(restored.activity_id, "HIV.A1")
+        self.assertEqual(restored.extra_attributes, {"key": "value"})
+        self.assertEqual(restored.invariants, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
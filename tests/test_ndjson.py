@@ -0,0 +1,99 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from fhir.resources.bundle import Bundle
+
+from who_l3_smart_tools.utils.ndjson import NdjsonWriter
+
+
+def patient_bundle(patient_id):
+    return Bundle.parse_obj(
+        {
+            "resourceType": "Bundle",
+            "type": "transaction",
+            "entry": [
+                {
+                    "resource": {"resourceType": "Patient", "id": patient_id},
+                    "request": {"method": "PUT", "url": f"Patient/{patient_id}"},
+                },
+                {
+                    "resource": {
+                        "resourceType": "Observation",
+                        "id": f"{patient_id}-obs",
+                        "status": "final",
+                        "code": {"text": "A\nmultiline\ncode"},
+                        "subject": {"reference": f"Patient/{patient_id}"},
+                    },
+                    "request": {"method": "PUT", "url": f"Observation/{patient_id}-obs"},
+                },
+            ],
+        }
+    )
+
+
+def read_lines(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+class TestNdjsonWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_resources_are_grouped_by_type(self):
+        with NdjsonWriter(self.output_dir) as writer:
+            for i in range(3):
+                writer.write(patient_bundle(f"p{i}"))
+
+        self.assertEqual(
+            sorted(os.listdir(self.output_dir)),
+            ["Observation.000.ndjson", "Patient.000.ndjson"],
+        )
+        patients = read_lines(os.path.join(self.output_dir, "Patient.000.ndjson"))
+        self.assertEqual([p["id"] for p in patients], ["p0", "p1", "p2"])
+        observations = read_lines(
+            os.path.join(self.output_dir, "Observation.000.ndjson")
+        )
+        self.assertEqual(observations[0]["code"]["text"], "A\nmultiline\ncode")
+        self.assertEqual(writer.lines, 6)
+
+    def test_bundles(self):
+        with NdjsonWriter(
+            self.output_dir, split_resources=False, compress=True
+        ) as writer:
+            writer.write(patient_bundle("p0"))
+            writer.write(patient_bundle("p1").dict())
+
+        self.assertEqual(os.listdir(self.output_dir), ["Bundle.000.ndjson.gz"])
+        bundles = read_lines(writer.files[0])
+        self.assertEqual(len(bundles), 2)
+        self.assertEqual(bundles[1]["entry"][0]["resource"]["id"], "p1")
+
+    def test_files_are_split_by_size(self):
+        line_size = len(patient_bundle("p0").entry[0].resource.json()) + 1
+
+        with NdjsonWriter(self.output_dir, max_bytes=2 * line_size) as writer:
+            for i in range(5):
+                writer.write(patient_bundle(f"p{i}"))
+
+        patient_files = sorted(f for f in writer.files if "Patient" in f)
+        self.assertEqual(
+            [os.path.basename(f) for f in patient_files],
+            ["Patient.000.ndjson", "Patient.001.ndjson", "Patient.002.ndjson"],
+        )
+        self.assertEqual(
+            [p["id"] for f in patient_files for p in read_lines(f)],
+            ["p0", "p1", "p2", "p3", "p4"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
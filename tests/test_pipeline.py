@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import pandas as pd
+
+from who_l3_smart_tools.cli.indicator_testing import stream_fhir_data
+from who_l3_smart_tools.core.indicator_testing.bundle_generator import BundleGenerator
+from who_l3_smart_tools.core.indicator_testing.pipeline import (
+    FhirServerSink,
+    run_pipeline,
+)
+
+
+class TestPipeline(unittest.TestCase):
+    def test_bundles_reach_every_sink(self):
+        received = {"first": [], "second": []}
+
+        def sink(name):
+            async def consume(sheet_name, bundle):
+                await asyncio.sleep(0)
+                received[name].append((sheet_name, bundle))
+
+            return consume
+
+        bundles = [("HIV.IND.19", i) for i in range(50)]
+        asyncio.run(
+            run_pipeline(
+                iter(bundles), [sink("first"), sink("second")], queue_size=4
+            )
+        )
+
+        self.assertEqual(sorted(received["first"]), bundles)
+        self.assertEqual(sorted(received["second"]), bundles)
+
+    def test_generation_is_bounded_by_queue(self):
+        produced = 0
+        max_ahead = 0
+        consumed = 0
+        lock = threading.Lock()
+
+        def generate():
+            nonlocal produced, max_ahead
+            for i in range(100):
+                with lock:
+                    produced += 1
+                    max_ahead = max(max_ahead, produced - consumed)
+                yield "HIV.IND.19", i
+
+        async def slow_sink(sheet_name, bundle):
+            nonlocal consumed
+            await asyncio.sleep(0.001)
+            with lock:
+                consumed += 1
+
+        asyncio.run(run_pipeline(generate(), [slow_sink], queue_size=4, workers=2))
+
+        self.assertEqual(consumed, 100)
+        # the queue, the workers and the bundle being put
+        self.assertLessEqual(max_ahead, 4 + 2 + 1)
+
+    def test_sink_errors_stop_generation(self):
+        def generate():
+            for i in range(1000):
+                yield "HIV.IND.19", i
+
+        async def failing_sink(sheet_name, bundle):
+            if bundle == 10:
+                raise RuntimeError("upload failed")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(run_pipeline(generate(), [failing_sink], queue_size=4))
+
+    def test_generation_errors_are_raised(self):
+        def generate():
+            yield "HIV.IND.19", 0
+            raise ValueError("bad row")
+
+        async def sink(sheet_name, bundle):
+            pass
+
+        with self.assertRaises(ValueError):
+            asyncio.run(run_pipeline(generate(), [sink]))
+
+
+class TestStreamFhirData(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tmp_dir.name)
+
+        features = BundleGenerator.features["HIV.IND.27"]
+        rows = []
+        for i in range(5):
+            row = {"Patient.id": f"patient-{i}", "Patient.gender": "male"}
+            row.update({feature: i % 2 for feature in features})
+            row["Numerator"] = i % 2
+            row["Denominator"] = 1
+            rows.append(row)
+        with pd.ExcelWriter("test_data.xlsx") as writer:
+            pd.DataFrame(rows).to_excel(writer, sheet_name="HIV.IND.27", index=False)
+
+    def test_measure_report_follows_the_bundles(self):
+        asyncio.run(
+            stream_fhir_data(
+                "test_data.xlsx",
+                "2024-01-01T00:00:00+00:00",
+                "2024-12-31T00:00:00+00:00",
+                "local",
+                None,
+                seed=1,
+            )
+        )
+
+        path = os.path.join("output", "HIV.IND.27", "MeasureReport.000.ndjson")
+        with open(path) as f:
+            measure_reports = [json.loads(line) for line in f]
+        self.assertEqual(len(measure_reports), 1)
+        populations = measure_reports[0]["group"][0]["population"]
+        self.assertEqual(
+            [population["count"] for population in populations], [5, 2, 5]
+        )
+
+    def test_server_sink_uploads_other_resources_in_a_bundle(self):
+        uploaded = []
+
+        class Uploader:
+            async def add(self, bundle):
+                uploaded.append(bundle)
+
+        generator = BundleGenerator(
+            "test_data.xlsx",
+            "output/",
+            "2024-01-01T00:00:00+00:00",
+            "2024-12-31T00:00:00+00:00",
+        )
+        sink = FhirServerSink(Uploader())
+        bundle = {"resourceType": "Bundle", "type": "transaction", "entry": []}
+        measure_report = generator.generate_example_measure_report(
+            generator.measure_counts("HIV.IND.27")
+        )
+        asyncio.run(sink("HIV.IND.27", bundle))
+        asyncio.run(sink("HIV.IND.27", measure_report))
+
+        self.assertIs(uploaded[0], bundle)
+        self.assertEqual(
+            uploaded[1]["entry"],
+            [
+                {
+                    "resource": json.loads(measure_report.json()),
+                    "request": {"method": "POST", "url": "MeasureReport"},
+                }
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,3 +14,17 @@ class TestQuestionnaireGenerator(unittest.TestCase):
         generator = QuestionnaireGenerator(self.input_file, self.output_dir)
 
         generator.generate_fsh_from_excel()
+
+    def test_iter_activity_items_streams_and_closes_workbook(self):
+        generator = QuestionnaireGenerator(self.input_file, self.output_dir)
+
+        activities = generator.iter_activity_items()
+        activity_id, items = next(activities)
+
+        self.assertIsInstance(items, list)
+
+        for activity_id, items in activities:
+            for item in items:
+                self.assertIn("data_element_id", item)
+
+        self.assertIsNone(generator.workbook._excel_file)
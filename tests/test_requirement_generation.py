@@ -19,3 +19,30 @@ class TestRequirementGenerator(unittest.TestCase):
         generator = RequirementGenerator(self.input_file, self.output_dir)
 
         generator.generate_fsh_from_excel()
+
+    def test_each_file_is_written_once(self):
+        writer = MemoryWriter()
+        generator = RequirementGenerator(self.input_file, self.output_dir, writer)
+
+        generator.generate_fsh_from_excel()
+
+        files = [os.path.basename(output_file) for output_file, _ in writer.writes]
+        self.assertEqual(len(files), len(set(files)))
+        self.assertIn("HIV.A.fsh", files)
+        self.assertIn("HIV.Non_Functional.fsh", files)
+        # activities without any requirements are not written
+        self.assertNotIn("HIV.E.fsh", files)
+
+        registration = dict(writer.writes)[os.path.join(self.output_dir, "HIV.A.fsh")]
+        self.assertTrue(registration.startswith("Instance: HIV.A.Registration\n"))
+        self.assertIn('* statement[+]\n  * key = "HIV.FXNREQ.001"', registration)
+
+
+class MemoryWriter:
+    """Captures the files written by a generator."""
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, output_file, content, input_hash=None):
+        self.writes.append((output_file, content))
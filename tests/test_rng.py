@@ -0,0 +1,51 @@
+import pickle
+import unittest
+
+from who_l3_smart_tools.utils.rng import SeededRandom, get_rng, use_rng, uuid4
+
+
+class TestSeededRandom(unittest.TestCase):
+    def test_derived_streams(self):
+        rng = SeededRandom(42)
+        first = rng.derive("HIV.IND.19", 0).random()
+
+        # deriving does not depend on the state of the parent generator
+        rng.random()
+        self.assertEqual(rng.derive("HIV.IND.19", 0).random(), first)
+        self.assertEqual(SeededRandom(42).derive("HIV.IND.19", 0).random(), first)
+
+        self.assertNotEqual(rng.derive("HIV.IND.19", 1).random(), first)
+        self.assertNotEqual(rng.derive("HIV.IND.20", 0).random(), first)
+        self.assertNotEqual(SeededRandom(43).derive("HIV.IND.19", 0).random(), first)
+
+    def test_uuid4(self):
+        ids = [SeededRandom(1).uuid4() for _ in range(2)]
+
+        self.assertEqual(ids[0], ids[1])
+        self.assertEqual(ids[0].version, 4)
+        self.assertNotEqual(SeededRandom(2).uuid4(), ids[0])
+
+    def test_pickle(self):
+        rng = SeededRandom(7)
+        rng.random()
+
+        copy = pickle.loads(pickle.dumps(rng))
+
+        self.assertEqual(copy.initial_seed, 7)
+        self.assertEqual(copy.random(), rng.random())
+        self.assertEqual(copy.derive("a").random(), rng.derive("a").random())
+
+    def test_current_rng(self):
+        default = get_rng()
+
+        with use_rng(SeededRandom(3)) as rng:
+            self.assertIs(get_rng(), rng)
+            ids = [uuid4(), uuid4()]
+
+        self.assertIs(get_rng(), default)
+        expected = SeededRandom(3)
+        self.assertEqual(ids, [expected.uuid4(), expected.uuid4()])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+
+from who_l3_smart_tools.core.parsers.dak_workbook import DakWorkbook
+from who_l3_smart_tools.core.terminology.who.terminology import HIVTerminology
+
+
+class TestHIVTerminology(unittest.TestCase):
+    def setUp(self):
+        self.input_file = os.path.join("tests", "data", "l2", "test_dd.xlsx")
+
+    def tearDown(self):
+        DakWorkbook.close_all()
+
+    def test_valuesets_are_read_on_first_access(self):
+        terminology = HIVTerminology(self.input_file)
+        valuesets = terminology.valuesets
+
+        self.assertGreater(len(valuesets), 0)
+        self.assertIsNone(terminology._rows)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            written = HIVTerminology(self.input_file)
+            written.to_json(os.path.join(tmp_dir, "hiv_concepts.json"))
+        self.assertEqual(valuesets, written.valuesets)
+
+    def test_missing_file_fails_on_construction(self):
+        with self.assertRaises(FileNotFoundError):
+            HIVTerminology(os.path.join("tests", "data", "l2", "missing.xlsx"))
+
+
+if __name__ == "__main__":
+    unittest.main()
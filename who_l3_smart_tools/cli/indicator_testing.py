@@ -1,55 +1,196 @@
 #! /usr/bin/env python
 import argparse
+import asyncio
 import datetime
+import logging
 import os
-from pathlib import Path
+import sys
 
 from who_l3_smart_tools.core.indicator_testing.bundle_generator import BundleGenerator
-from who_l3_smart_tools.core.indicator_testing.data_generator import DataGenerator
+from who_l3_smart_tools.core.indicator_testing.combinations import (
+    COMBINATION_STRATEGIES,
+)
+from who_l3_smart_tools.core.indicator_testing.data_generator import (
+    DATA_FILE_FORMATS,
+    DataGenerator,
+)
+from who_l3_smart_tools.core.indicator_testing.pipeline import (
+    FhirServerSink,
+    NdjsonSink,
+    run_pipeline,
+)
 from who_l3_smart_tools.core.indicator_testing.scaffolding_generator import (
     ScaffoldingGenerator,
 )
-from who_l3_smart_tools.utils.fhirclient import send_to_fhir_server
+from who_l3_smart_tools.utils.fhirclient import AsyncFhirUploader, FhirUploader
 
 
-def generate_test_scaffold(input_file):
+def generate_test_scaffold(
+    input_file, combinations="exhaustive", strength=2, max_rows=None
+):
     scaffolding_generator = ScaffoldingGenerator(
         input_file,
         "Indicator_Scaffold_"
         + datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d_%H%M%S")
         + ".xlsx",
+        combinations=combinations,
+        strength=strength,
+        max_rows=max_rows,
     )
     scaffolding_generator.generate_test_scaffolding()
 
 
-def generate_test_values(input_file):
-    data_generator = DataGenerator(input_file)
-    data_generator.generate_data_file(
-        "Indicator_Test_Data_"
-        + datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d_%H%M%S")
-        + ".xlsx",
-        1000,
+def generate_test_values(
+    input_file, rows=1000, seed=None, file_format="xlsx", reference_date=None
+):
+    data_generator = DataGenerator(
+        input_file, seed=seed, reference_date=reference_date
     )
+    timestamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d_%H%M%S")
+    # CSV and Parquet files are written to a directory, one file per sheet
+    path = "Indicator_Test_Data_" + timestamp
+    if file_format == "xlsx":
+        path += ".xlsx"
+    data_generator.generate_data_file(path, rows, file_format)
 
 
-def generate_fhir_data(input_file, start_date, end_date, output_mode, fhir_server_url):
+def generate_fhir_data(
+    input_file,
+    start_date,
+    end_date,
+    output_mode,
+    fhir_server_url,
+    upload_batch_size=500,
+    upload_workers=4,
+    ndjson_options=None,
+    validate=1.0,
+    seed=None,
+):
     # Create the output directory if it does not exist and if local output is needed
     if output_mode in ["local", "both"] and not os.path.exists("output"):
         os.makedirs("output")
 
-    bundle_generator = BundleGenerator(input_file, "output/", start_date, end_date)
+    bundle_generator = BundleGenerator(
+        input_file, "output/", start_date, end_date, validate=validate, seed=seed
+    )
     generated_data = bundle_generator.generate_all_data()
 
-    # Save generated bundles as ndjson files:
-    for indicator, bundles in generated_data["bundles"].items():
-        for bundle in bundles:
-            if output_mode in ["local", "both"]:
-                Path(f"output/{indicator}.json").write_text(bundle.json())
-            if output_mode in ["server", "both"]:
-                send_to_fhir_server(bundle, fhir_server_url)
+    uploader = None
+    if output_mode in ["server", "both"]:
+        uploader = FhirUploader(
+            fhir_server_url,
+            max_entries=upload_batch_size,
+            max_workers=upload_workers,
+        )
+
+    # Save generated bundles as ndjson files, in a directory per indicator
+    if output_mode in ["local", "both"]:
+        bundle_generator.save_to_ndjson(**(ndjson_options or {}))
+
+    if uploader is not None:
+        for data in generated_data.values():
+            for bundle in data["bundles"]:
+                uploader.add(bundle)
+        print_upload_report(uploader.close())
+    print(bundle_generator.fhir_generator.stats.summary())
     print("FHIR data generation complete.")
 
 
+def generate_sharded_fhir_data(
+    input_file,
+    start_date,
+    end_date,
+    jobs,
+    shard_rows,
+    ndjson_options=None,
+    validate=1.0,
+    seed=None,
+):
+    """
+    Generates FHIR data locally like `generate_fhir_data`, but in shards of rows
+    spread over a pool of processes, each shard written to its own NDJSON files.
+    """
+    if not os.path.exists("output"):
+        os.makedirs("output")
+
+    bundle_generator = BundleGenerator(
+        input_file, "output/", start_date, end_date, validate=validate, seed=seed
+    )
+    bundle_generator.generate_ndjson_shards(
+        jobs=jobs, shard_rows=shard_rows, **(ndjson_options or {})
+    )
+    print(bundle_generator.fhir_generator.stats.summary())
+    print("FHIR data generation complete.")
+
+
+async def stream_fhir_data(
+    input_file,
+    start_date,
+    end_date,
+    output_mode,
+    fhir_server_url,
+    upload_batch_size=500,
+    upload_workers=4,
+    ndjson_options=None,
+    validate=1.0,
+    seed=None,
+):
+    """
+    Generates FHIR data like `generate_fhir_data`, but writes and uploads the
+    bundles while they are being generated, rather than after generating all of
+    them. The MeasureReport of each sheet, counted from the input data, is
+    written and uploaded once all the bundles are.
+    """
+    bundle_generator = BundleGenerator(
+        input_file, "output/", start_date, end_date, validate=validate, seed=seed
+    )
+
+    sinks = []
+    file_sink = None
+    if output_mode in ["local", "both"]:
+        file_sink = NdjsonSink("output", **(ndjson_options or {}))
+        sinks.append(file_sink)
+
+    server_sink = None
+    if output_mode in ["server", "both"]:
+        server_sink = FhirServerSink(
+            AsyncFhirUploader(
+                fhir_server_url,
+                max_entries=upload_batch_size,
+                max_workers=upload_workers,
+            )
+        )
+        sinks.append(server_sink)
+
+    try:
+        await run_pipeline(
+            bundle_generator.iter_bundles(), sinks, workers=upload_workers
+        )
+        for sheet_name in bundle_generator.pd_data.keys():
+            measure_report = bundle_generator.generate_example_measure_report(
+                bundle_generator.measure_counts(sheet_name)
+            )
+            for sink in sinks:
+                await sink(sheet_name, measure_report)
+    finally:
+        if file_sink is not None:
+            file_sink.close()
+        if server_sink is not None:
+            print_upload_report(await server_sink.close())
+    print(bundle_generator.fhir_generator.stats.summary())
+    print("FHIR data generation complete.")
+
+
+def print_upload_report(report):
+    print(report)
+    for failure in report.failures:
+        print(
+            f"Bundles {failure.bundles} failed ({failure.status}): "
+            f"{failure.message}",
+            file=sys.stderr,
+        )
+
+
 def main():
     parser = argparse.ArgumentParser(
         description=(
@@ -68,6 +209,27 @@ def main():
         "input_file",
         help="The Indicator Excel file to be used as input for generating the scaffolding.",
     )
+    scaffolding_parser.add_argument(
+        "--combinations",
+        choices=COMBINATION_STRATEGIES,
+        default="exhaustive",
+        help=(
+            "How rows combine the values of the numerator terms: every combination, "
+            "a covering array of --strength terms, or MC/DC pairs following the "
+            "AND/OR structure of the calculation."
+        ),
+    )
+    scaffolding_parser.add_argument(
+        "--strength",
+        type=int,
+        default=2,
+        help="Number of terms whose values covering arrays combine (default: 2).",
+    )
+    scaffolding_parser.add_argument(
+        "--max-rows",
+        type=int,
+        help="Maximum number of rows per indicator.",
+    )
 
     # Step 2: Test Data Generation
     test_data_parser = subparsers.add_parser(
@@ -77,13 +239,47 @@ def main():
     test_data_parser.add_argument(
         "input_file", help="The Excel file containing the scaffolding data."
     )
+    test_data_parser.add_argument(
+        "--rows",
+        type=int,
+        default=1000,
+        help="Number of random rows generated per sheet, besides the example rows.",
+    )
+    test_data_parser.add_argument(
+        "--seed",
+        type=int,
+        help=(
+            "Seed for reproducible random test data. Also pass --reference-date, as "
+            "the dates of birth depend on the current date."
+        ),
+    )
+    test_data_parser.add_argument(
+        "--reference-date",
+        type=datetime.date.fromisoformat,
+        metavar="YYYY-MM-DD",
+        help="Date at which the patients' ages are drawn (default: today).",
+    )
+    test_data_parser.add_argument(
+        "--format",
+        choices=DATA_FILE_FORMATS,
+        default="xlsx",
+        help=(
+            "Output format. CSV and Parquet write a directory with a file per "
+            "sheet, which generate-fhir-data reads faster than a workbook. "
+            "Parquet needs pyarrow or fastparquet."
+        ),
+    )
 
     # Step 3: FHIR Bundle generation
     generate_fhir_parser = subparsers.add_parser(
         "generate-fhir-data", help="Generate FHIR patient bundles from Test Data file."
     )
     generate_fhir_parser.add_argument(
-        "input_file", help="The Excel file containing the patient data."
+        "input_file",
+        help=(
+            "The Excel file, or directory of CSV or Parquet files, containing the "
+            "patient data."
+        ),
     )
     generate_fhir_parser.add_argument(
         "--start_date", help="The start of the measurement period (inclusive)."
@@ -99,19 +295,139 @@ def main():
         help="FHIR server URL",
         default="http://localhost:8080/fhir/",
     )
+    generate_fhir_parser.add_argument(
+        "--upload-batch-size",
+        type=int,
+        default=500,
+        help="Maximum number of entries per transaction bundle sent to the server.",
+    )
+    generate_fhir_parser.add_argument(
+        "--upload-workers",
+        type=int,
+        default=4,
+        help="Maximum number of concurrent uploads to the server.",
+    )
+    generate_fhir_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Write and upload bundles while they are being generated.",
+    )
+    generate_fhir_parser.add_argument(
+        "--ndjson-bundles",
+        action="store_true",
+        help="Write one bundle per line instead of one resource per line.",
+    )
+    generate_fhir_parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Compress the NDJSON files with gzip.",
+    )
+    generate_fhir_parser.add_argument(
+        "--max-file-size",
+        type=int,
+        default=1024,
+        help="Maximum size in MiB of each NDJSON file before a new one is started.",
+    )
+    generate_fhir_parser.add_argument(
+        "--validate",
+        type=float,
+        default=1.0,
+        metavar="FRACTION",
+        help="Fraction of bundles to validate against the FHIR models (default: 1).",
+    )
+    generate_fhir_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes generating bundles in parallel (local output only).",
+    )
+    generate_fhir_parser.add_argument(
+        "--shard-rows",
+        type=int,
+        default=10000,
+        help="Number of rows per shard when generating in parallel.",
+    )
+    generate_fhir_parser.add_argument(
+        "--seed",
+        type=int,
+        help=(
+            "Seed for reproducible resources and ids. Also pass --start_date and "
+            "--end_date, as the default reporting period depends on the current date."
+        ),
+    )
+    generate_fhir_parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Log every resource generated, and the traceback of every error.",
+    )
 
     args = parser.parse_args()
 
+    logging.basicConfig(
+        level=logging.DEBUG if getattr(args, "verbose", False) else logging.WARNING,
+        format="%(levelname)s %(name)s: %(message)s",
+    )
+
+    if args.command == "generate-fhir-data":
+        if not 0 <= args.validate <= 1:
+            parser.error("--validate must be between 0 and 1")
+        if args.upload_batch_size < 1:
+            parser.error("--upload-batch-size must be at least 1")
+        if args.upload_workers < 1:
+            parser.error("--upload-workers must be at least 1")
+
     if args.command == "scaffold":
-        generate_test_scaffold(args.input_file)
+        if args.strength < 1:
+            parser.error("--strength must be at least 1")
+        if args.max_rows is not None and args.max_rows < 1:
+            parser.error("--max-rows must be at least 1")
+        generate_test_scaffold(
+            args.input_file, args.combinations, args.strength, args.max_rows
+        )
+    elif args.command == "generate-test-sheets":
+        generate_test_values(
+            args.input_file, args.rows, args.seed, args.format, args.reference_date
+        )
+    elif args.command == "generate-fhir-data" and args.jobs > 1:
+        if args.output != "local" or args.stream:
+            parser.error("--jobs only supports local output without --stream")
+        generate_sharded_fhir_data(
+            args.input_file,
+            getattr(args, "start_date", None),
+            getattr(args, "end_date", None),
+            args.jobs,
+            args.shard_rows,
+            {
+                "split_resources": not args.ndjson_bundles,
+                "compress": args.gzip,
+                "max_bytes": args.max_file_size * 1024 * 1024,
+            },
+            args.validate,
+            args.seed,
+        )
     elif args.command == "generate-fhir-data":
-        generate_fhir_data(
+        fhir_data_args = (
             args.input_file,
             getattr(args, "start_date", None),
             getattr(args, "end_date", None),
             args.output,
             args.fhir_server_url,
+            args.upload_batch_size,
+            args.upload_workers,
+            {
+                "split_resources": not args.ndjson_bundles,
+                "compress": args.gzip,
+                "max_bytes": args.max_file_size * 1024 * 1024,
+            },
+            args.validate,
+            args.seed,
         )
+        if args.stream:
+            asyncio.run(stream_fhir_data(*fhir_data_args))
+        else:
+            generate_fhir_data(*fhir_data_args)
     else:
         parser.print_help()
 
@@ -1,6 +1,6 @@
 import argparse
 
-from who_l3_smart_tools.cli.utils import add_common_args
+from who_l3_smart_tools.cli.utils import add_common_args, configure_cache
 from who_l3_smart_tools.core.logical_models.logical_model_generator import (
     LogicalModelAndTerminologyGenerator,
 )
@@ -11,12 +11,20 @@ def main():
         description="Generate Logical Model FSH from L3 Data Dictionary Excel file."
     )
     add_common_args(parser)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes used to generate the logical models (default: 1)",
+    )
 
     args = parser.parse_args()
+    configure_cache(args)
 
     LogicalModelAndTerminologyGenerator(
         args.input, args.output
-    ).generate_fsh_from_excel()
+    ).generate_fsh_from_excel(jobs=args.jobs)
 
 
 if __name__ == "__main__":
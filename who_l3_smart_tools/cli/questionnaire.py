@@ -1,7 +1,7 @@
 #! /usr/bin/env python
 import argparse
 
-from who_l3_smart_tools.cli.utils import add_common_args
+from who_l3_smart_tools.cli.utils import add_common_args, configure_cache
 from who_l3_smart_tools.core.questionnaires.questionnaire_generator import (
     QuestionnaireGenerator,
 )
@@ -14,6 +14,7 @@ def main():
     add_common_args(parser)
 
     args = parser.parse_args()
+    configure_cache(args)
 
     QuestionnaireGenerator(args.input, args.output).generate_fsh_from_excel()
 
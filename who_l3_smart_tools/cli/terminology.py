@@ -3,6 +3,7 @@ import argparse
 import json
 import os
 
+from who_l3_smart_tools.cli.utils import add_cache_args, configure_cache
 from who_l3_smart_tools.core.terminology.who.terminology import HIVTerminology
 
 
@@ -35,6 +36,8 @@ def main():
     -e, --excel-file: Excel file containing the HIV terminology data.
     -f, --output-format: Output format for the generated HIV Concept Terminology. (default: csv)
     -v, --values-set: File where to write valuesets.
+    --cache-dir: Directory for caching parsed input files.
+    --no-cache: Do not read or write the parsed input cache.
 
     Raises:
     - ValueError: If neither an Excel file nor CSV files are provided.
@@ -66,7 +69,9 @@ def main():
         required=False,
         help="File where to write valuesets.",
     )
+    add_cache_args(argparser)
     args = argparser.parse_args()
+    configure_cache(args)
 
     os.makedirs(args.output_dir, exist_ok=True)
 
@@ -1,3 +1,6 @@
+from who_l3_smart_tools.utils.cache import set_cache_dir
+
+
 def add_common_args(parser):
     """
     Add common arguments to the argument parser.
@@ -20,3 +23,42 @@ def add_common_args(parser):
         default="./data/output",
         help="Output Logical Model FSH file location",
     )
+    add_cache_args(parser)
+
+
+def add_cache_args(parser):
+    """
+    Add arguments controlling the parsed input cache to the argument parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The argument parser object.
+
+    Returns:
+        None
+    """
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory for caching parsed input files "
+        "(default: ~/.cache/who_l3_smart_tools)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the parsed input cache",
+    )
+
+
+def configure_cache(args):
+    """
+    Apply the cache arguments added by `add_cache_args`.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        None
+    """
+    if args.no_cache:
+        set_cache_dir(None)
+    elif args.cache_dir:
+        set_cache_dir(args.cache_dir)
@@ -3,6 +3,7 @@ from typing import Any
 
 import pandas as pd
 
+from who_l3_smart_tools.core.parsers.dak_workbook import DakWorkbook
 from who_l3_smart_tools.utils.cql_helpers import (
     create_cql_concept_dictionaries,
     get_dak_name,
@@ -18,9 +19,7 @@ class CqlFileGenerator:
         self.concept_lookup: dict[str, Any] = {}
         self.cql_concept_dictionary: dict[str, Any] = {}
 
-        self.data_dictionary_xls = pd.read_excel(
-            self.data_dictionary_file, sheet_name=None
-        )
+        self.data_dictionary_xls = DakWorkbook.open(self.data_dictionary_file)
 
         self.dak_name = get_dak_name(self.data_dictionary_xls)
 
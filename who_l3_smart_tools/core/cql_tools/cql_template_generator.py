@@ -3,6 +3,7 @@ import stringcase
 import pandas as pd
 from jinja2 import Environment, FileSystemLoader
 
+from who_l3_smart_tools.core.parsers.dak_workbook import DakWorkbook
 from who_l3_smart_tools.utils.cql_helpers import (
     determine_scoring_suggestion,
     get_dak_name,
@@ -255,7 +256,7 @@ class CqlTemplateGenerator:
         keys and scaffolds as values.
         concept_lookup (dict[str, Any]): A dictionary containing the concept lookup data.
         cql_concept_dictionary (dict[str, Any]): A dictionary containing the CQL concept dictionary data.
-        data_dictionary_xls (pd.ExcelFile): The data dictionary Excel file.
+        data_dictionary_xls (DakWorkbook): The data dictionary Excel file.
         indicator_artifact (pd.DataFrame): The indicator artifact data frame.
         dak_name (str): The DAK name.
 
@@ -275,14 +276,12 @@ class CqlTemplateGenerator:
         self.concept_lookup: dict[str, Any] = {}
         self.cql_concept_dictionary: dict[str, Any] = {}
 
-        self.data_dictionary_xls = pd.read_excel(
-            self.data_dictionary_file, sheet_name=None
-        )
+        self.data_dictionary_xls = DakWorkbook.open(self.data_dictionary_file)
 
         # Load the DAK
-        self.indicator_artifact = pd.read_excel(
-            self.indicator_artifact_file, sheet_name="Indicator definitions"
-        )
+        self.indicator_artifact = DakWorkbook.open(self.indicator_artifact_file)[
+            "Indicator definitions"
+        ]
 
         self.dak_name = get_dak_name(self.data_dictionary_xls)
 
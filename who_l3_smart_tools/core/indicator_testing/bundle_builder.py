@@ -0,0 +1,179 @@
+"""
+An indexed builder for the transaction bundles generated for test phenotypes.
+
+The generator functions repeatedly look up resources they have already added to a
+bundle, e.g. the ServiceRequest for a test code or the DiagnosticReport based on
+it. Rather than scanning the entries for every lookup, the builder keeps hash
+indexes alongside the entry list, so lookups take constant time however large the
+bundle grows.
+
+Resources are plain dicts, so building them costs no pydantic validation. The bundle
+is validated once, when it is built, or not at all.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from fhir.resources.bundle import Bundle
+
+__all__ = ["BundleBuilder"]
+
+Resource = Dict[str, Any]
+CodeKey = Tuple[Optional[str], Optional[str]]
+
+
+class BundleBuilder:
+    """
+    Collects the entries of a bundle as dicts, indexing the resources by type, id,
+    code and `basedOn` reference.
+
+    Resources are indexed when they are added, so a resource whose code is only set
+    afterwards must be added with its code given explicitly.
+
+    Args:
+        bundle_type (str, optional): The type of the bundle. Defaults to
+            "transaction".
+        meta (dict, optional): The metadata of the bundle.
+
+    Attributes:
+        entry (list[dict]): The entries added so far, in order.
+        meta (dict): The metadata of the bundle.
+    """
+
+    def __init__(
+        self, bundle_type: str = "transaction", meta: Optional[Dict[str, Any]] = None
+    ):
+        self.bundle_type = bundle_type
+        self.meta = meta
+        self.entry: List[Resource] = []
+
+        self.__by_type: Dict[str, List[Resource]] = defaultdict(list)
+        self.__by_id: Dict[Tuple[str, str], Resource] = {}
+        self.__by_code: Dict[Tuple[str, CodeKey], List[Resource]] = defaultdict(list)
+        self.__by_based_on: Dict[Tuple[str, str], List[Resource]] = defaultdict(list)
+
+    def add(
+        self,
+        resource: Resource,
+        method: str = "PUT",
+        code: Union[Dict[str, Any], None] = None,
+    ) -> Resource:
+        """
+        Adds a resource to the bundle.
+
+        Args:
+            resource (dict): The resource. It may still be modified after it has
+                been added.
+            method (str, optional): The HTTP method of the entry's request. Defaults
+                to "PUT".
+            code (dict, optional): The coding to index the resource by. By default
+                the first coding of the resource's code is used.
+
+        Returns:
+            dict: The resource.
+        """
+        resource_type = resource["resourceType"]
+        self.entry.append(
+            {"resource": resource, "request": {"method": method, "url": resource_type}}
+        )
+
+        self.__by_type[resource_type].append(resource)
+        if resource.get("id") is not None:
+            self.__by_id.setdefault((resource_type, resource["id"]), resource)
+
+        code_key = self._code_key(code) if code else self._resource_code_key(resource)
+        if code_key is not None:
+            self.__by_code[(resource_type, code_key)].append(resource)
+
+        for reference in self._based_on(resource):
+            self.__by_based_on[(resource_type, reference)].append(resource)
+
+        return resource
+
+    def remove(self, resource: Resource) -> None:
+        """
+        Removes a resource from the bundle and its indexes.
+
+        Args:
+            resource (dict): The resource, as added.
+        """
+        self.entry = [x for x in self.entry if x["resource"] is not resource]
+        for index in (self.__by_type, self.__by_code, self.__by_based_on):
+            for resources in index.values():
+                if any(r is resource for r in resources):
+                    resources[:] = [r for r in resources if r is not resource]
+        for key, value in list(self.__by_id.items()):
+            if value is resource:
+                del self.__by_id[key]
+
+    def of_type(self, resource_type: str) -> List[Resource]:
+        """
+        Returns the resources of a type, in the order they were added.
+        """
+        return list(self.__by_type.get(resource_type, ()))
+
+    def find_by_id(self, resource_type: str, resource_id: str) -> Optional[Resource]:
+        """
+        Returns the first resource of a type with the given id, or None.
+        """
+        return self.__by_id.get((resource_type, resource_id))
+
+    def find_by_code(
+        self, resource_type: str, coding: Dict[str, Any]
+    ) -> Optional[Resource]:
+        """
+        Returns the first resource of a type with the system and code of the given
+        coding, or None.
+        """
+        resources = self.__by_code.get((resource_type, self._code_key(coding)))
+        return resources[0] if resources else None
+
+    def find_by_based_on(
+        self, resource_type: str, reference: str
+    ) -> Optional[Resource]:
+        """
+        Returns the first resource of a type based on the given reference, e.g.
+        "ServiceRequest/123", or None.
+        """
+        resources = self.__by_based_on.get((resource_type, reference))
+        return resources[0] if resources else None
+
+    def build(self, validate: bool = True) -> Union[Bundle, Resource]:
+        """
+        Builds the bundle from the entries added so far.
+
+        Args:
+            validate (bool, optional): Whether to validate the bundle. Defaults to
+                True.
+
+        Returns:
+            Bundle | dict: The validated bundle, or the bundle as a dict if it is
+                not validated.
+        """
+        bundle = {"resourceType": "Bundle", "type": self.bundle_type}
+        if self.meta is not None:
+            bundle["meta"] = self.meta
+        bundle["entry"] = self.entry
+
+        if validate:
+            return Bundle.parse_obj(bundle)
+        return bundle
+
+    @staticmethod
+    def _code_key(coding: Dict[str, Any]) -> CodeKey:
+        return coding.get("system"), coding.get("code")
+
+    @classmethod
+    def _resource_code_key(cls, resource: Resource) -> Union[CodeKey, None]:
+        code = resource.get("code") or {}
+        # e.g. ServiceRequest.code is a CodeableReference
+        concept = code.get("concept") or code
+        codings = concept.get("coding")
+        if not codings:
+            return None
+        return cls._code_key(codings[0])
+
+    @staticmethod
+    def _based_on(resource: Resource) -> Iterable[str]:
+        based_on = resource.get("basedOn") or []
+        return [r["reference"] for r in based_on if r.get("reference")]
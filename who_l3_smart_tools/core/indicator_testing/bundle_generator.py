@@ -1,15 +1,22 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
 import os
 import random
-import json
 from re import sub
 import re
 
+import numpy as np
 import pandas as pd
+from who_l3_smart_tools.core.indicator_testing.bundle_builder import BundleBuilder
+from who_l3_smart_tools.core.indicator_testing.data_generator import read_data_file
+from who_l3_smart_tools.core.indicator_testing.evaluator import count_measure
 from who_l3_smart_tools.core.indicator_testing.generator_functions import *
 from fhir.resources.bundle import Bundle
 from fhir.resources.measurereport import MeasureReport
-from fhir.resources.meta import Meta
+from pydantic.v1 import ValidationError
+
+from who_l3_smart_tools.utils.ndjson import NdjsonWriter, resource_json
+from who_l3_smart_tools.utils.rng import SeededRandom, use_rng
 
 
 # This class takes a data file generated by the DataGenerator
@@ -31,10 +38,18 @@ class BundleGenerator:
         output_directory,
         reporting_period_start=None,
         reporting_period_end=None,
+        validate=1.0,
+        seed=None,
     ):
         self.data_file_path = data_file_path
+        # Each row's bundle is generated from its own stream derived from the seed,
+        # see iter_sheet_bundles
+        self.rng = SeededRandom(seed)
+        # The fraction of bundles validated, see generate_row_bundle
+        self.validate = validate
         self.all_feature_keys = self.get_all_feature_keys()
-        self.pd_data = pd.read_excel(data_file_path, sheet_name=None)
+        # Only the columns bundles are generated from are read, see input_dtypes
+        self.pd_data = read_data_file(data_file_path, self.input_dtypes)
 
         # If reporting_period_start is not provided or invalid format, set a year ago
         if (
@@ -73,6 +88,7 @@ class BundleGenerator:
 
         self.output_directory = output_directory
 
+        self.feature_list = {}
         self.parse_input_headers()
 
     # Getters
@@ -113,6 +129,23 @@ class BundleGenerator:
         ],
     }
 
+    # The disaggregations MeasureReports are stratified by: the code of each
+    # stratifier and the column of its values. Ages are grouped into age bands.
+    stratifiers = {
+        "age-band": "Patient.birthDate",
+        "gender": "Patient.gender",
+        "key-population": "Key population member type",
+        "tb-status": "TB diagnosis result",
+        "testing-entry-point": "Testing entry point",
+    }
+
+    # The lower bound of each age band, in years
+    age_bands = [0, 1, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50]
+
+    # Features that start with the pattern "<resource>.<attribute>" are consolidated
+    # into a single key for generator function lookup
+    resource_pattern = r"^(?P<resource>\w+)\.(?P<attribute>\w+)$"
+
     def get_all_feature_keys(self):
         all_keys = []
         for feature_list in self.features.values():
@@ -124,12 +157,39 @@ class BundleGenerator:
             )
         return all_keys
 
-    def parse_input_headers(self):
-        # Consolidate features that start with the pattern
-        # "<resource>.<attribute>" into a single key for
-        # generator function lookup
-        resource_pattern = r"^(?P<resource>\w+)\.(?P<attribute>\w+)$"
+    def input_dtypes(self, sheet_name, headers):
+        """
+        Returns the columns of a sheet that bundles are generated from, with
+        compact dtypes: ids as strings, phenotype features as booleans and
+        disaggregation features as categories.
+
+        Args:
+            sheet_name (str): The name of the sheet.
+            headers (list[str]): The headers of the sheet.
+
+        Returns:
+            dict | None: The dtypes by column name, None where inferred, or None to
+                read every column of a sheet without a feature list.
+        """
+        if sheet_name.strip() not in self.features.keys():
+            return None
+
+        dtypes = {}
+        for key in headers:
+            resource_match = re.match(self.resource_pattern, key)
+            if resource_match:
+                if resource_match.group("resource") in self.all_feature_keys:
+                    is_id = resource_match.group("attribute") == "id"
+                    dtypes[key] = "str" if is_id else None
+            elif key.strip() == "Numerator" or key.strip() == "Denominator":
+                dtypes[key] = None
+            elif key in self.features["disaggregation"]:
+                dtypes[key] = "category"
+            elif key in self.all_feature_keys:
+                dtypes[key] = "bool"
+        return dtypes
 
+    def parse_input_headers(self):
         # For each sheet in the data file, parse the headers into a
         # feature list that can be used to generate FHIR resources
         for sheet_name in self.pd_data.keys():
@@ -143,7 +203,7 @@ class BundleGenerator:
             sheet_df = self.pd_data[sheet_name]
 
             for key in sheet_df.columns:
-                resource_match = re.match(resource_pattern, key)
+                resource_match = re.match(self.resource_pattern, key)
                 if resource_match:
                     resource_key = f"{resource_match.group('resource')}"
 
@@ -168,40 +228,158 @@ class BundleGenerator:
         all_data = {}
         # Generate data for each sheet
         for sheet_name in self.pd_data.keys():
-            numerator_sum = 0
-            denominator_sum = 0
-
             all_data[sheet_name] = {"bundles": [], "MeasureReport": None}
-            sheet_fl = self.feature_list[sheet_name]
 
             # Generate bundle for each row
-            for index, row in self.pd_data[sheet_name].iterrows():
-                row_numerator = row["Numerator"]
-                row_denominator = row["Denominator"]
-
-                numerator_sum += row_numerator if row_numerator else 0
-                denominator_sum += row_denominator if row_denominator else 0
-
-                bundle = self.generate_row_bundle(row, sheet_fl)
-
+            for _, bundle in self.iter_sheet_bundles(sheet_name):
                 all_data[sheet_name]["bundles"].append(bundle)
 
             # Generate MeasurementReport for the sheet
             all_data[sheet_name]["MeasureReport"] = (
-                self.generate_example_measure_report(
-                    len(self.pd_data[sheet_name]), numerator_sum, denominator_sum
-                )
+                self.generate_example_measure_report(self.measure_counts(sheet_name))
             )
 
         self.all_data = all_data
 
         return all_data
 
+    def iter_bundles(self):
+        """
+        Generates the bundles for every sheet, yielding each one as soon as it has
+        been generated rather than holding them all in memory.
+
+        Yields:
+            tuple: The sheet name and the bundle for a row of that sheet.
+        """
+        for sheet_name in self.pd_data.keys():
+            for _, bundle in self.iter_sheet_bundles(sheet_name):
+                yield sheet_name, bundle
+
+    def iter_sheet_bundles(self, sheet_name, start=None, stop=None):
+        """
+        Generates the bundles for a sheet, one row at a time.
+
+        The random choices and ids of each bundle are drawn from a stream derived
+        from the generator's seed, the sheet name and the row's position, so a row
+        always yields the same bundle for the same seed.
+
+        Args:
+            sheet_name (str): The name of the sheet.
+            start (int, optional): The position of the first row to generate.
+            stop (int, optional): The position after the last row to generate.
+
+        Yields:
+            tuple: The row and the bundle generated from it.
+        """
+        sheet_fl = self.feature_list[sheet_name]
+        rows = self.pd_data[sheet_name].iloc[start:stop].iterrows()
+        for position, (_, row) in enumerate(rows, start or 0):
+            with use_rng(self.rng.derive(sheet_name, position)):
+                bundle = self.generate_row_bundle(row, sheet_fl, position)
+            yield row, bundle
+
+    def generate_ndjson_shards(self, jobs=1, shard_rows=10000, **kwargs):
+        """
+        Generates the bundles of every sheet in shards of rows, writing each shard
+        to its own NDJSON files as it is generated, followed by the MeasureReport of
+        each sheet once all its shards are done.
+
+        The shards can be generated in parallel by a pool of processes. As each row
+        is generated from its own random stream, see `iter_sheet_bundles`, the
+        generated data does not depend on the number of processes.
+
+        Args:
+            jobs (int, optional): The number of processes generating shards.
+                Defaults to 1, generating them in this process.
+            shard_rows (int, optional): The number of rows per shard. Defaults to
+                10000.
+            **kwargs: Passed on to `NdjsonWriter`.
+
+        Returns:
+            dict: The "files" written and the "MeasureReport" of each sheet.
+        """
+        output_directory = self.output_directory
+        if not output_directory or not os.path.isdir(output_directory):
+            output_directory = os.path.join(os.getcwd(), "output")
+
+        tasks = [
+            (
+                sheet_name,
+                shard,
+                start,
+                start + shard_rows,
+                output_directory,
+                kwargs,
+            )
+            for sheet_name in self.pd_data.keys()
+            if sheet_name in self.feature_list
+            for shard, start in enumerate(
+                range(0, len(self.pd_data[sheet_name]), shard_rows)
+            )
+        ]
+
+        sheet_files = {sheet_name: [] for sheet_name, *_ in tasks}
+
+        def reduce(results):
+            for (sheet_name, *_), files in zip(tasks, results):
+                sheet_files[sheet_name].extend(files)
+
+        if jobs > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(
+                max_workers=jobs, initializer=_init_shard_worker, initargs=(self,)
+            ) as executor:
+                results = []
+                for result, stats in executor.map(_generate_shard, tasks):
+                    # Keep the counts of the resources generated by the workers
+                    self.fhir_generator.stats.merge(stats)
+                    results.append(result)
+                reduce(results)
+        else:
+            reduce(self._generate_shard(*task) for task in tasks)
+
+        shard_data = {}
+        for sheet_name, files in sheet_files.items():
+            measure_report = self.generate_example_measure_report(
+                self.measure_counts(sheet_name)
+            )
+            with NdjsonWriter(
+                os.path.join(output_directory, sheet_name), **kwargs
+            ) as writer:
+                writer.write(measure_report)
+
+            shard_data[sheet_name] = {
+                "files": files + writer.files,
+                "MeasureReport": measure_report,
+            }
+
+        return shard_data
+
+    def _generate_shard(
+        self, sheet_name, shard, start, stop, output_directory, ndjson_options
+    ):
+        with NdjsonWriter(
+            os.path.join(output_directory, sheet_name),
+            prefix=f"{shard:04d}.",
+            **ndjson_options,
+        ) as writer:
+            for _, bundle in self.iter_sheet_bundles(sheet_name, start, stop):
+                writer.write(bundle)
+
+        return writer.files
+
     def datetime_handler(self, obj):
         if isinstance(obj, datetime):
             return obj.__str__()
 
-    def save_to_file(self):
+    def save_to_file(self, indent=None):
+        """
+        Saves the generated bundles and MeasureReport of each sheet as JSON files,
+        in a directory per sheet.
+
+        Args:
+            indent (int, optional): Pretty-prints the files with this indentation.
+                By default the files are written without indentation.
+        """
         output_directory = self.output_directory
         # Save the generated FHIR resources to a file
         if not output_directory or not os.path.isdir(output_directory):
@@ -212,31 +390,113 @@ class BundleGenerator:
             if not os.path.isdir(sheet_output_directory):
                 os.makedirs(sheet_output_directory)
 
-            for index, bundle in enumerate(data["bundles"]):
-                file_name = f"{sheet_name}_bundle_{index}.json"
+            files = [
+                (f"{sheet_name}_bundle_{index}.json", bundle)
+                for index, bundle in enumerate(data["bundles"])
+            ]
+            files.append((f"{sheet_name}_measure_report.json", data["MeasureReport"]))
+
+            for file_name, resource in files:
                 file_path = os.path.join(sheet_output_directory, file_name)
+                with open(file_path, "wb") as f:
+                    f.write(self.serialize(resource, indent))
+
+    def serialize(self, resource, indent=None):
+        """
+        Serializes a resource to JSON. Validated bundles and those that were not
+        are written alike, see `resource_json`.
+
+        Args:
+            resource (Resource | dict): The resource.
+            indent (int, optional): Pretty-prints the JSON with this indentation.
+                By default it is compact.
+
+        Returns:
+            bytes: The UTF-8 encoded JSON.
+        """
+        return resource_json(resource, indent).encode("utf-8")
+
+    def save_to_ndjson(self, **kwargs):
+        """
+        Saves the generated bundles and MeasureReport of each sheet as NDJSON files,
+        in a directory per sheet.
+
+        Args:
+            **kwargs: Passed on to `NdjsonWriter`, e.g. to compress the files or
+                write whole bundles instead of their resources.
+
+        Returns:
+            list[str]: The paths of the files written.
+        """
+        output_directory = self.output_directory
+        if not output_directory or not os.path.isdir(output_directory):
+            output_directory = os.path.join(os.getcwd(), "output")
 
-                with open(file_path, "w") as f:
-                    f.write(
-                        json.dumps(
-                            bundle.dict(), indent=4, default=self.datetime_handler
-                        )
-                    )
-
-            file_name = f"{sheet_name}_measure_report.json"
-            file_path = os.path.join(sheet_output_directory, file_name)
-
-            with open(file_path, "w") as f:
-                f.write(
-                    json.dumps(
-                        data["MeasureReport"].dict(),
-                        indent=4,
-                        default=self.datetime_handler,
-                    )
-                )
+        files = []
+        for sheet_name, data in self.all_data.items():
+            with NdjsonWriter(
+                os.path.join(output_directory, sheet_name), **kwargs
+            ) as writer:
+                for bundle in data["bundles"]:
+                    writer.write(bundle)
+                writer.write(data["MeasureReport"])
+            files.extend(writer.files)
+
+        return files
+
+    def measure_counts(self, sheet_name):
+        """
+        Returns the expected MeasureReport counts of a sheet, overall and for each
+        stratum of its disaggregations, see `stratifiers`.
+
+        Args:
+            sheet_name (str): The name of the sheet.
+
+        Returns:
+            MeasureCounts: The counts.
+        """
+        sheet_data = self.pd_data[sheet_name]
+
+        strata = {}
+        for code, column in self.stratifiers.items():
+            if column not in sheet_data.columns:
+                continue
+            if column == "Patient.birthDate":
+                strata[code] = self.age_band(sheet_data[column])
+            else:
+                strata[code] = sheet_data[column]
+
+        return count_measure(sheet_data["Numerator"], sheet_data["Denominator"], strata)
+
+    def age_band(self, birth_dates):
+        """
+        Returns the age band of each birth date at the end of the reporting period,
+        e.g. "<1", "15-19" or "50+". Blank or later dates have no age band.
+
+        Args:
+            birth_dates (Series): The birth dates.
+
+        Returns:
+            Categorical: The age bands.
+        """
+        birth_dates = pd.to_datetime(birth_dates, errors="coerce")
+        year, month, day = birth_dates.dt.year, birth_dates.dt.month, birth_dates.dt.day
+        end = self.end_date
+        # One year less for birthdays after the end of the reporting period
+        after_end = (month > end.month) | (month == end.month) & (day > end.day)
+        age = end.year - year - after_end
+
+        bounds = self.age_bands
+        labels = (
+            [f"<{bounds[1]}"]
+            + [f"{lower}-{upper - 1}" for lower, upper in zip(bounds[1:], bounds[2:])]
+            + [f"{bounds[-1]}+"]
+        )
+        return pd.cut(age, bounds + [np.inf], right=False, labels=labels)
 
-    def generate_example_measure_report(self, num_rows, numerator_sum, denominator_sum):
-        # Generate an example MeasurementReport resource
+    def generate_example_measure_report(self, counts):
+        # Generate an example MeasurementReport resource, with the population counts
+        # of the sheet and of each stratum of its disaggregations, see measure_counts
 
         # Initialize the MeasurementReport resource
         measurement_report = MeasureReport.parse_obj(
@@ -252,58 +512,79 @@ class BundleGenerator:
             }
         )
 
+        group = {
+            "population": self.measure_populations(
+                counts.initial_population, counts.numerator, counts.denominator
+            )
+        }
+
+        stratifiers = []
+        for code, strata in counts.strata.items():
+            if strata.empty:
+                continue
+            stratifiers.append(
+                {
+                    "code": {"coding": [{"code": code}]},
+                    "stratum": [
+                        {
+                            "valueCodeableConcept": {"text": str(value)},
+                            "population": self.measure_populations(*stratum_counts),
+                        }
+                        for value, *stratum_counts in strata.itertuples()
+                    ],
+                }
+            )
+        if stratifiers:
+            group["stratifier"] = stratifiers
+
         measurement_report.group = []
-        measurement_report.group.append(
-            {
-                "population": [
-                    {
-                        "code": {"coding": [{"code": "initial-population"}]},
-                        "count": num_rows,
-                    },
-                    {
-                        "code": {"coding": [{"code": "numerator"}]},
-                        "count": numerator_sum,
-                    },
-                    {
-                        "code": {"coding": [{"code": "denominator"}]},
-                        "count": denominator_sum,
-                    },
-                ]
-            }
-        )
+        measurement_report.group.append(group)
         return measurement_report
 
-    def generate_row_bundle(self, row, feature_list):
+    def measure_populations(self, num_rows, numerator_sum, denominator_sum):
+        # The population counts of a MeasureReport group or stratum
+        return [
+            {
+                "code": {"coding": [{"code": "initial-population"}]},
+                "count": int(num_rows),
+            },
+            {
+                "code": {"coding": [{"code": "numerator"}]},
+                "count": int(numerator_sum),
+            },
+            {
+                "code": {"coding": [{"code": "denominator"}]},
+                "count": int(denominator_sum),
+            },
+        ]
+
+    def generate_row_bundle(self, row, feature_list, position=0):
         # Generate a new FHIR bundle for the given row and feature list
 
         # Initialize the list of resources to be included in the bundle
-        bundle = Bundle.parse_obj(
-            {"resourceType": "Bundle", "type": "transaction", "entry": []}
-        )
+        bundle = BundleBuilder("transaction")
 
         # Add metadata for patient phenotype used to generate this bundle
-        bundle.meta = Meta.parse_obj(
-            {
-                "extension": [
-                    {
-                        "url": "http://example.org/fhir/StructureDefinition/phenotype-pattern",
-                        "extension": [],
-                    },
-                    {
-                        "url": "http://example.org/fhir/StructureDefinition/numerator",
-                        "valueInteger": row["Numerator"],
-                    },
-                    {
-                        "url": "http://example.org/fhir/StructureDefinition/denominator",
-                        "valueInteger": row["Denominator"],
-                    },
-                ]
-            }
-        )
+        bundle.meta = {
+            "extension": [
+                {
+                    "url": "http://example.org/fhir/StructureDefinition/phenotype-pattern",
+                    "extension": [],
+                },
+                {
+                    "url": "http://example.org/fhir/StructureDefinition/numerator",
+                    "valueInteger": row["Numerator"],
+                },
+                {
+                    "url": "http://example.org/fhir/StructureDefinition/denominator",
+                    "valueInteger": row["Denominator"],
+                },
+            ]
+        }
         # Add phenotype values for each feature
         for feature in feature_list:
             if feature not in ["Patient", "Test"]:
-                bundle.meta.extension[0].extension.append(
+                bundle.meta["extension"][0]["extension"].append(
                     {
                         "url": f"http://example.org/fhir/StructureDefinition/{snake_case(feature)}",
                         "valueBoolean": bool(row[feature]),
@@ -314,8 +595,49 @@ class BundleGenerator:
             # Generate the FHIR resource for the given feature
             bundle = self.fhir_generator.generate_for(feature, row, bundle)
 
-        return bundle
+        try:
+            return bundle.build(validate=self._sample_validation(position))
+        except ValidationError as e:
+            # An invalid resource is counted like the errors of the generator
+            # functions, and its bundle kept unvalidated, rather than ending the run
+            stats = self.fhir_generator.stats
+            stats.failed["Bundle"] += 1
+            for error in e.errors():
+                stats.errors["Bundle"][self._error_message(bundle, error)] += 1
+            return bundle.build(validate=False)
+
+    @staticmethod
+    def _error_message(bundle, error):
+        # Names the field by resource type rather than entry, e.g.
+        # "Observation.valueInteger: value is not a valid integer"
+        location = list(error["loc"])
+        if location[:1] == ["entry"] and location[2:3] == ["resource"]:
+            resource = bundle.entry[location[1]]["resource"]
+            location = [resource["resourceType"]] + location[3:]
+        return f"{'.'.join(str(x) for x in location)}: {error['msg']}"
+
+    def _sample_validation(self, position):
+        # Spreads the validated bundles evenly over the rows of a sheet rather than
+        # drawing from the random generator, so sampling does not change the
+        # generated data, and depends only on the row, not on the order of shards
+        return int((position + 1) * self.validate) > int(position * self.validate)
 
     def create_bundle(self, resources):
 
         return create_transaction_bundle(resources)
+
+
+# The generator used by the processes generating shards, see
+# BundleGenerator.generate_ndjson_shards
+_shard_generator = None
+
+
+def _init_shard_worker(generator):
+    global _shard_generator
+    _shard_generator = generator
+
+
+def _generate_shard(task):
+    stats = _shard_generator.fhir_generator.stats
+    stats.clear()
+    return _shard_generator._generate_shard(*task), stats
@@ -0,0 +1,262 @@
+"""
+Combinations of term values for the rows of test scaffolding.
+
+Each scaffolding row sets every numerator term of an indicator to true (1) or false
+(0). All combinations of n terms make 2^n rows, which is not practical for large
+indicators, so smaller sets of rows with equivalent logical coverage can be
+generated instead:
+
+- covering arrays, in which the values of any t terms appear in all their
+  combinations in some row (pairwise for t=2), and
+- MC/DC (modified condition/decision coverage) rows, which follow the AND/OR
+  structure of the calculation so that each term is shown to change its outcome
+  on its own.
+
+All rows are generated lazily, one at a time.
+"""
+
+import itertools
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+from who_l3_smart_tools.core.parsers.calculation_parser import (
+    Condition,
+    build_condition,
+    tokenize,
+)
+
+__all__ = [
+    "COMBINATION_STRATEGIES",
+    "covering_combinations",
+    "exclude",
+    "exhaustive_combinations",
+    "generate_combinations",
+    "mcdc_combinations",
+    "parse_condition",
+]
+
+COMBINATION_STRATEGIES = ("exhaustive", "covering", "mcdc")
+
+Combination = Tuple[int, ...]
+
+
+def exhaustive_combinations(num_terms: int) -> Iterator[Combination]:
+    """
+    Generates every combination of values of the terms.
+    """
+    return itertools.product((0, 1), repeat=num_terms)
+
+
+def covering_combinations(num_terms: int, strength: int = 2) -> Iterator[Combination]:
+    """
+    Generates a covering array of the terms: combinations in which the values of
+    any `strength` terms appear in all their combinations.
+
+    The array is built greedily, one combination at a time. Each combination starts
+    from a combination of values not covered yet and assigns the remaining terms the
+    value covering the most new combinations. The number of combinations grows
+    with the logarithm of the number of terms, rather than exponentially.
+
+    Args:
+        num_terms (int): The number of terms.
+        strength (int, optional): The number of terms whose values are combined,
+            e.g. 2 for pairwise coverage. Defaults to 2.
+
+    Yields:
+        tuple[int, ...]: The value of each term.
+    """
+    if strength < 1:
+        raise ValueError(f"Invalid covering array strength: {strength}")
+    if num_terms == 0:
+        yield ()
+        return
+
+    strength = min(strength, num_terms)
+    uncovered = {
+        (columns, values)
+        for columns in itertools.combinations(range(num_terms), strength)
+        for values in itertools.product((0, 1), repeat=strength)
+    }
+    while uncovered:
+        columns, values = min(uncovered)
+        row = dict(zip(columns, values))
+        for column in range(num_terms):
+            if column not in row:
+                row[column] = max(
+                    (0, 1),
+                    key=lambda value: _newly_covered(
+                        uncovered, row, column, value, strength
+                    ),
+                )
+
+        combination = tuple(row[column] for column in range(num_terms))
+        uncovered.difference_update(
+            (columns, tuple(combination[column] for column in columns))
+            for columns in itertools.combinations(range(num_terms), strength)
+        )
+        yield combination
+
+
+def _newly_covered(uncovered, row, column, value, strength):
+    # The uncovered combinations a value of a column covers together with the
+    # columns assigned so far
+    count = 0
+    for others in itertools.combinations(row, strength - 1):
+        columns = tuple(sorted(others + (column,)))
+        values = tuple(value if c == column else row[c] for c in columns)
+        count += (columns, values) in uncovered
+    return count
+
+
+def mcdc_combinations(condition: Condition, num_terms: int) -> Iterator[Combination]:
+    """
+    Generates combinations satisfying modified condition/decision coverage of a
+    condition: for each term, a pair of combinations that differ only in that term
+    and give the condition different outcomes.
+
+    Terms the condition does not depend on are false. Combinations shared by
+    several terms are generated once, so at most 2n combinations are generated for
+    n terms, and n+1 for a plain AND or OR of the terms.
+
+    Args:
+        condition (Condition): The condition, see `parse_condition`.
+        num_terms (int): The number of terms.
+
+    Yields:
+        tuple[int, ...]: The value of each term.
+    """
+    seen = set()
+    for term in range(num_terms):
+        assignment: Dict[int, int] = {}
+        if not _sensitize(condition, term, assignment):
+            continue
+
+        for value in (1, 0):
+            assignment[term] = value
+            combination = tuple(assignment.get(t, 0) for t in range(num_terms))
+            if combination not in seen:
+                seen.add(combination)
+                yield combination
+
+
+def _sensitize(condition, term, assignment):
+    # Assigns the other terms so the outcome of the condition follows the term.
+    # Returns False if the condition does not contain the term.
+    if isinstance(condition, int):
+        return condition == term
+
+    operator, operands = condition
+    for i, operand in enumerate(operands):
+        if _contains(operand, term):
+            if operator != "NOT":
+                # The other operands must not decide the outcome on their own
+                for other in operands[:i] + operands[i + 1 :]:
+                    _assign(other, 1 if operator == "AND" else 0, assignment)
+            return _sensitize(operand, term, assignment)
+    return False
+
+
+def _assign(condition, outcome, assignment):
+    # Assigns unassigned terms so the condition has the given outcome
+    if isinstance(condition, int):
+        assignment.setdefault(condition, outcome)
+        return
+
+    operator, operands = condition
+    if operator == "NOT":
+        _assign(operands[0], 1 - outcome, assignment)
+    elif (operator == "AND") == bool(outcome):
+        # All operands of a true AND, or of a false OR, share the outcome
+        for operand in operands:
+            _assign(operand, outcome, assignment)
+    else:
+        # The first operand decides a false AND, or a true OR
+        _assign(operands[0], outcome, assignment)
+        for operand in operands[1:]:
+            _assign(operand, 1 - outcome, assignment)
+
+
+def _contains(condition, term):
+    if isinstance(condition, int):
+        return condition == term
+    return any(_contains(operand, term) for operand in condition[1])
+
+
+def parse_condition(
+    terms: Sequence[str], connectives: Sequence[str], num_exclusions: int = 0
+) -> Condition:
+    """
+    Builds the condition of a calculation from its terms and the AND/OR connectives
+    between them, see `parse_connectives`. Unbalanced parentheses or brackets in a
+    term group the terms, and AND takes precedence over OR. Calculations parsed by
+    `parse_calculation_expression` come with their condition already built.
+
+    Exclusions follow the terms and are negated: the condition only holds if none
+    of them does.
+
+    Args:
+        terms (list[str]): The terms, as parsed by `parse_calculation`.
+        connectives (list[str]): The "AND" or "OR" between each pair of terms.
+        num_exclusions (int, optional): The number of exclusions following the
+            terms. Defaults to 0.
+
+    Returns:
+        Condition: The condition, with terms and exclusions by index.
+    """
+    condition = build_condition([tokenize(term) for term in terms], connectives)
+    return exclude(condition, len(terms), num_exclusions)
+
+
+def exclude(
+    condition: Optional[Condition], num_terms: int, num_exclusions: int
+) -> Optional[Condition]:
+    """
+    Adds the exclusions following the terms to a condition: the condition only
+    holds if none of them does.
+
+    Args:
+        condition (Condition): The condition of the terms.
+        num_terms (int): The number of terms.
+        num_exclusions (int): The number of exclusions following the terms.
+
+    Returns:
+        Condition: The condition, with terms and exclusions by index.
+    """
+    exclusions = [
+        ("NOT", [index]) for index in range(num_terms, num_terms + num_exclusions)
+    ]
+    if not exclusions:
+        return condition
+    return ("AND", ([condition] if condition is not None else []) + exclusions)
+
+
+def generate_combinations(
+    strategy: str,
+    num_terms: int,
+    condition: Optional[Condition] = None,
+    strength: int = 2,
+    max_rows: Optional[int] = None,
+) -> Iterator[Combination]:
+    """
+    Generates combinations of values of the terms with one of the strategies.
+
+    Args:
+        strategy (str): "exhaustive", "covering" or "mcdc".
+        num_terms (int): The number of terms.
+        condition (Condition, optional): The condition of the terms, needed for
+            "mcdc". Without it, combinations are exhaustive.
+        strength (int, optional): The strength of "covering" arrays. Defaults to
+            2.
+        max_rows (int, optional): The maximum number of combinations.
+
+    Yields:
+        tuple[int, ...]: The value of each term.
+    """
+    if strategy == "covering":
+        rows = covering_combinations(num_terms, strength)
+    elif strategy == "mcdc" and condition is not None:
+        rows = mcdc_combinations(condition, num_terms)
+    elif strategy in COMBINATION_STRATEGIES:
+        rows = exhaustive_combinations(num_terms)
+    else:
+        raise ValueError(f"Unknown combination strategy: {strategy}")
+    return itertools.islice(rows, max_rows)
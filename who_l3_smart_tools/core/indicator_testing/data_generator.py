@@ -1,8 +1,22 @@
+import importlib.util
+import logging
+import os
 import re
+from datetime import date, timedelta
+
+import numpy as np
 import pandas as pd
-import uuid
-from random import choice, randint
 from faker import Faker
+from openpyxl import Workbook
+
+from who_l3_smart_tools.core.indicator_testing.evaluator import evaluate_calculation
+from who_l3_smart_tools.core.parsers.calculation_parser import (
+    parse_calculation_expression,
+    parse_exclusion_terms,
+)
+from who_l3_smart_tools.utils.rng import SeededRandom, get_rng, use_rng
+
+logger = logging.getLogger(__name__)
 
 ##-----------------------------------------------------------------##
 ## This class will generate a dataset for testing indicator logic
@@ -14,10 +28,7 @@ from faker import Faker
 # Gender and DOB should always be included. In addition, we need a function for each dissagregation type, mapped to
 # the corresponding valueset perhaps...For generation we need to use the valueset to generate the data.
 
-
 class DataGenerator:
-    fake = Faker()
-
     # TODO: Reference IG for valuesets
     valuesets = {
         "Patient.state (home)": ["Lagos", "Abuja", "Kano", "Ogun", "Oyo"],
@@ -39,8 +50,18 @@ class DataGenerator:
 
     indicator_calculation_headers = ["Numerator", "Denominator"]
 
-    def __init__(self, template_file_name):
+    # The number of distinct given and family names generated per sheet
+    pool_size = 1000
+
+    def __init__(self, template_file_name, seed=None, reference_date=None):
         self.template_file = template_file_name
+        # Each sheet is generated from its own stream derived from the seed, see
+        # generate_data_sheet
+        self.rng = SeededRandom(seed)
+        # Dates of birth are drawn relative to this date, so that seeded data does
+        # not change from one day to the next
+        self.reference_date = reference_date or date.today()
+        self.fake = Faker()
         self.excel_data = pd.read_excel(self.template_file, sheet_name=None)
         self.parsed_data = self.parse_template_excel()
 
@@ -78,6 +99,18 @@ class DataGenerator:
             numerator_len = 3 if exclusion_indices else 2
             denominator_len = 3 if exclusion_indices else 2
 
+            # The exclusion terms of the numerator and denominator. Duplicate headers
+            # are read with an appended number, e.g. ".1".
+            numerator_exclusions = denominator_exclusions = ()
+            for i in exclusion_indices:
+                exclusions = parse_exclusion_terms(
+                    re.sub(r"^EXCLUSION: |\.\d+$", "", headers[i])
+                )
+                if i < denominator_index:
+                    numerator_exclusions = exclusions
+                else:
+                    denominator_exclusions = exclusions
+
             # Get all terms between the 'Numerator:' and 'Denominator:' headings
             numerator_formula = headers[numerator_index + 1]
             numerator_terms = headers[
@@ -106,10 +139,19 @@ class DataGenerator:
 
             parsed_data[sheet_name] = {
                 "numerator_formula": numerator_formula,
+                # The parsed calculations, shared with the scaffolding generator
+                "numerator_calculation": parse_calculation_expression(
+                    str(numerator_formula)
+                ),
                 "numerator_terms": numerator_terms,
+                "numerator_exclusions": numerator_exclusions,
                 "numerator_index": numerator_index,
                 "denominator_formula": denominator_formula,
+                "denominator_calculation": parse_calculation_expression(
+                    str(denominator_formula)
+                ),
                 "denominator_terms": denominator_terms,
+                "denominator_exclusions": denominator_exclusions,
                 "denominator_index": denominator_index,
                 "disaggregation_terms": disaggregation_terms,
                 "disaggregation_index": disaggregation_index,
@@ -117,46 +159,60 @@ class DataGenerator:
             }
         return parsed_data
 
-    def generate_data_file(self, path, num_random_rows=1000):
-        sheets = {}
-
-        # Generate data for each sheet
-        for sheet_name in self.excel_data.keys():
-            sheet_data = self.generate_data_sheet(sheet_name, num_random_rows)
-            sheets[sheet_name] = sheet_data
-
-        writer = pd.ExcelWriter(path, engine="openpyxl")
+    def generate_data_file(self, path, num_random_rows=1000, file_format="xlsx"):
+        """
+        Generates the test data of each sheet and writes it to a file, one sheet at
+        a time.
+
+        Args:
+            path (str): The path of the XLSX workbook, or of the directory to write
+                a CSV or Parquet file per sheet to.
+            num_random_rows (int, optional): The number of random rows generated
+                per sheet, besides the example rows. Defaults to 1000.
+            file_format (str, optional): One of "xlsx", "csv" or "parquet".
+                Defaults to "xlsx". Parquet needs pyarrow or fastparquet.
+        """
+        if file_format not in DATA_FILE_FORMATS:
+            raise ValueError(f"Unsupported test data file format: {file_format}")
+        if file_format == "parquet" and not any(
+            importlib.util.find_spec(engine) for engine in ("pyarrow", "fastparquet")
+        ):
+            raise ImportError("Writing Parquet files needs pyarrow or fastparquet")
+
+        sheets = (
+            (sheet_name, self.generate_data_sheet(sheet_name, num_random_rows))
+            for sheet_name in self.excel_data.keys()
+        )
 
-        workbook = writer.book
+        if file_format == "xlsx":
+            write_xlsx(path, sheets)
+            return
 
-        for sheet_name, sheet_data in sheets.items():
-            if sheet_name in workbook.sheetnames:
-                ws = workbook[sheet_name]
+        os.makedirs(path, exist_ok=True)
+        for sheet_name, sheet_data in sheets:
+            sheet_path = os.path.join(path, f"{sheet_name}.{file_format}")
+            if file_format == "csv":
+                sheet_data.to_csv(sheet_path, index=False)
             else:
-                ws = workbook.create_sheet(title=sheet_name)
-
-            ws.append(sheet_data.columns.tolist())
-
-            for row in sheet_data.itertuples(index=False):
-                ws.append(row)
-        writer.close()
+                sheet_data.to_parquet(sheet_path, index=False)
 
     # Generate a random dataset based on the template
     # Use provided example rows and fill in the additional required values, especially
     # for the disaggregation fields
     def generate_data_sheet(self, input_datasheet_name, num_random_rows):
+        rng = self.rng.derive(input_datasheet_name)
+        self.fake.seed_instance(rng.getrandbits(64))
+        with use_rng(rng):
+            return self._generate_data_sheet(input_datasheet_name, num_random_rows)
 
+    def _generate_data_sheet(self, input_datasheet_name, num_random_rows):
         sheet_parsed_data = self.parsed_data[input_datasheet_name]
         input_datasheet = self.excel_data[input_datasheet_name]
 
-        # Phenotypes will store the unique combinations of numerator, denominator terms and
-        # their calculated values to use for generating the randomized data rows
-        phenotypes = []
-
-        # Unique list of headers
+        # Unique list of headers, in a stable order
         phenotype_headers = (
             list(
-                set(
+                dict.fromkeys(
                     sheet_parsed_data["numerator_terms"]
                     + sheet_parsed_data["denominator_terms"]
                 )
@@ -184,134 +240,273 @@ class DataGenerator:
             self.general_output_headers + sheet_parsed_data["disaggregation_terms"]
         )
 
-        output_rows = []
-
-        # Get corresponding values from each example phenotype row and place
-        # them in the output row
-        for index, row in input_datasheet.iterrows():
-            general_column_values = []
-            phenotype_column_values = []
-
-            # Generate non-phenotype columns
-            for general_header in general_headers:
-                general_column_values.append(
-                    self.map_header_value(general_header, index, sheet_parsed_data, row)
-                )
-            for phenotype_header in phenotype_headers:
-                phenotype_column_values.append(
-                    self.map_header_value(
-                        phenotype_header, index, sheet_parsed_data, row
-                    )
-                )
-
-            # Add the phenotype to the list of phenotypes
-            phenotypes.append(phenotype_column_values)
+        # The example rows are followed by the random rows, each of which copies the
+        # phenotype of a randomly selected example row. Values are generated a whole
+        # column at a time.
+        num_examples = len(input_datasheet)
+        num_rows = num_examples + num_random_rows
+        np_rng = np.random.default_rng(get_rng().getrandbits(64))
+
+        phenotype_indices = np.concatenate(
+            [
+                np.arange(num_examples),
+                np_rng.integers(num_examples, size=num_random_rows),
+            ]
+        )
 
-            # Add the row to the output
-            output_row = general_column_values + phenotype_column_values
-            output_rows.append(output_row)
+        columns = {}
+        for header in general_headers:
+            columns[header] = self.generate_column(
+                header, num_rows, sheet_parsed_data, np_rng
+            )
+        for header in phenotype_headers:
+            phenotypes = self.phenotype_values(
+                header, input_datasheet, sheet_parsed_data, np_rng
+            )
+            columns[header] = phenotypes[phenotype_indices]
 
-        # Generate additional rows with randomized phenotypes
-        for i in range(num_random_rows):
-            index = i + len(input_datasheet)
-            output_row = []
+        output_headers = general_headers + phenotype_headers
+        df = pd.DataFrame(columns, columns=output_headers)
 
-            # Generate random values for each general header
-            for header in general_headers:
-                output_row.append(
-                    self.map_header_value(header, index, sheet_parsed_data)
-                )
+        return df
 
-            # Randomly select a phenotype from the list of phenotypes and add it to the output row
-            phenotype = choice(phenotypes)
+    def generate_column(self, header, num_rows, parsed_data, np_rng):
+        """
+        Generates the values of a non-phenotype column.
+
+        Args:
+            header (str): The column header.
+            num_rows (int): The number of values to generate.
+            parsed_data (dict): The parsed template data of the sheet.
+            np_rng (numpy.random.Generator): The random generator.
+
+        Returns:
+            numpy.ndarray: The values.
+        """
+        if header == "Patient #" or header == "Bundle #":
+            return np.arange(1, num_rows + 1)
+        elif header == "Patient.id" or header == "Test.id":
+            return self.generate_uuids(num_rows, np_rng)
+        elif header == "Patient.name.family":
+            return self.sample_pool(self.fake.last_name, num_rows, np_rng)
+        elif header == "Patient.name.given":
+            return self.sample_pool(self.fake.first_name, num_rows, np_rng)
+        elif header == "Patient.gender":
+            return self.random_valueset_values(header, num_rows, np_rng)
+        elif header == "Patient.birthDate":
+            return self.generate_dobs(num_rows, np_rng)
+        elif header in parsed_data["disaggregation_terms"]:
+            if header in self.valuesets:
+                return self.random_valueset_values(header, num_rows, np_rng)
+            return np.full(num_rows, None, dtype=object)
+
+        logger.warning("Header not found in mapping: %s", header)
+        return np.full(num_rows, None, dtype=object)
+
+    def phenotype_values(self, header, input_datasheet, parsed_data, np_rng):
+        """
+        Returns the values of a phenotype column for each example row.
+
+        Args:
+            header (str): The column header.
+            input_datasheet (DataFrame): The example rows.
+            parsed_data (dict): The parsed template data of the sheet.
+            np_rng (numpy.random.Generator): The random generator.
+
+        Returns:
+            numpy.ndarray: The values.
+        """
+        num_examples = len(input_datasheet)
+
+        if header == "Numerator" or header == "Denominator":
+            return self.calculated_values(header.lower(), input_datasheet, parsed_data)
+        elif header in parsed_data["disaggregation_terms"]:
+            return self.generate_column(header, num_examples, parsed_data, np_rng)
+        elif header in input_datasheet.columns:
+            return input_datasheet[header].to_numpy()
+
+        logger.warning("Header not found in example rows: %s", header)
+        return np.full(num_examples, None, dtype=object)
+
+    def calculated_values(self, part, input_datasheet, parsed_data):
+        """
+        Returns the numerator or denominator value of each example row.
+
+        Values are stored in the column after the Numerator/Denominator heading.
+        Blank values are calculated from the values of the terms, when the sheet
+        has a column for every term of the calculation, see `evaluate_calculation`.
+
+        Args:
+            part (str): "numerator" or "denominator".
+            input_datasheet (DataFrame): The example rows.
+            parsed_data (dict): The parsed template data of the sheet.
+
+        Returns:
+            numpy.ndarray: The values.
+        """
+        values = input_datasheet.iloc[:, parsed_data[f"{part}_index"] + 1].to_numpy()
+        blank = pd.isna(values)
+        if not blank.any():
+            return values
 
-            output_row += phenotype
-            output_rows.append(output_row)
+        try:
+            calculated = evaluate_calculation(
+                parsed_data[f"{part}_calculation"],
+                input_datasheet,
+                parsed_data[f"{part}_exclusions"],
+            )
+        except ValueError as e:
+            logger.warning("%s values not calculated: %s", part.capitalize(), e)
+            return values
+        return np.where(blank, calculated, values)
 
-        output_headers = general_headers + phenotype_headers
-        df = pd.DataFrame(output_rows, columns=output_headers)
+    # Generator Functions
+    def random_valueset_values(self, header, num_rows, np_rng):
+        valueset = np.array(self.valuesets[header], dtype=object)
+        return valueset[np_rng.integers(len(valueset), size=num_rows)]
+
+    # Faker is slow, so names are drawn from a pool of pre-generated ones
+    def sample_pool(self, generate, num_rows, np_rng):
+        pool = np.array(
+            [generate() for _ in range(min(num_rows, self.pool_size))], dtype=object
+        )
+        return pool[np_rng.integers(len(pool), size=num_rows)]
+
+    # Random (version 4) UUIDs, formatted a whole column at a time
+    def generate_uuids(self, num_rows, np_rng):
+        uuid_bytes = np_rng.integers(256, size=(num_rows, 16), dtype=np.uint8)
+        uuid_bytes[:, 6] = uuid_bytes[:, 6] & 0x0F | 0x40
+        uuid_bytes[:, 8] = uuid_bytes[:, 8] & 0x3F | 0x80
+
+        digits = uuid_bytes.tobytes().hex()
+        return np.array(
+            [
+                f"{digits[i:i + 8]}-{digits[i + 8:i + 12]}-{digits[i + 12:i + 16]}-"
+                f"{digits[i + 16:i + 20]}-{digits[i + 20:i + 32]}"
+                for i in range(0, 32 * num_rows, 32)
+            ],
+            dtype=object,
+        )
 
-        return df
+    # Dates of birth in the same range as Faker's date_of_birth, at the reference
+    # date rather than today
+    def generate_dobs(self, num_rows, np_rng, minimum_age=18, maximum_age=100):
+        day = self.reference_date
+        start = self.years_before(day, maximum_age + 1) + timedelta(days=1)
+        end = self.years_before(day, minimum_age)
+        days = np_rng.integers((end - start).days + 1, size=num_rows)
+        return (np.datetime64(start, "D") + days).astype(object)
+
+    @staticmethod
+    def years_before(day, years):
+        try:
+            return day.replace(year=day.year - years)
+        except ValueError:
+            # 29 February
+            return day.replace(year=day.year - years, day=28)
+
+
+# The formats test data files can be written in and read back from
+DATA_FILE_FORMATS = ("xlsx", "csv", "parquet")
+
+
+def write_xlsx(path, sheets):
+    """
+    Writes sheets to an XLSX workbook in openpyxl's write-only mode, which streams
+    the rows to the file rather than keeping every cell in memory.
+
+    Args:
+        path (str): The path of the workbook.
+        sheets (Iterable[tuple[str, DataFrame]]): The sheet names and data.
+    """
+    workbook = Workbook(write_only=True)
+    for sheet_name, sheet_data in sheets:
+        ws = workbook.create_sheet(title=sheet_name)
+        ws.append(sheet_data.columns.tolist())
+        for row in sheet_data.itertuples(index=False, name=None):
+            ws.append(row)
+    workbook.save(path)
+
+
+def read_data_file(path, schema=None):
+    """
+    Reads test data written by `DataGenerator.generate_data_file`.
+
+    Args:
+        path (str): The path of the XLSX workbook, or of a directory of CSV or
+            Parquet files, one per sheet.
+        schema (Callable[[str, list[str]], dict | None], optional): Given a sheet
+            name and its headers, returns the dtypes of the columns to read, by
+            column name, or None to read every column. A dtype of None is
+            inferred, and a "bool" column is only converted if all its values
+            are 0 or 1. By default every column is read with inferred dtypes.
+
+    Returns:
+        dict[str, DataFrame]: The data of each sheet, by sheet name.
+    """
+    data = {}
+    if not os.path.isdir(path):
+        with pd.ExcelFile(path) as workbook:
+            for sheet_name in workbook.sheet_names:
+                headers = workbook.parse(sheet_name, nrows=0).columns.tolist()
+                dtypes = schema(sheet_name, headers) if schema else None
+                sheet_data = workbook.parse(
+                    sheet_name,
+                    usecols=None if dtypes is None else list(dtypes),
+                    dtype=_reader_dtypes(dtypes),
+                )
+                data[sheet_name] = _convert_booleans(sheet_data, dtypes)
+        return data
+
+    for file_name in sorted(os.listdir(path)):
+        sheet_name, extension = os.path.splitext(file_name)
+        file_path = os.path.join(path, file_name)
+        if extension == ".csv":
+            headers = pd.read_csv(file_path, nrows=0).columns.tolist()
+            dtypes = schema(sheet_name, headers) if schema else None
+            sheet_data = pd.read_csv(
+                file_path,
+                usecols=None if dtypes is None else list(dtypes),
+                dtype=_reader_dtypes(dtypes),
+            )
+        elif extension == ".parquet":
+            dtypes = schema(sheet_name, _parquet_columns(file_path)) if schema else None
+            sheet_data = pd.read_parquet(
+                file_path, columns=None if dtypes is None else list(dtypes)
+            )
+            sheet_data = sheet_data.astype(_reader_dtypes(dtypes) or {})
+        else:
+            continue
+        data[sheet_name] = _convert_booleans(sheet_data, dtypes)
+    return data
 
-    # Generator Functions
-    def random_valueset_value(self, header):
-        if header not in self.valuesets:
-            print(f"Header not found in Value Sets: {header}")
-            return None
 
-        valueset = self.valuesets[header]
-        return choice(valueset)
+def _reader_dtypes(dtypes):
+    # The dtypes the readers can apply themselves
+    if dtypes is None:
+        return None
+    return {
+        column: dtype
+        for column, dtype in dtypes.items()
+        if dtype is not None and dtype != "bool"
+    }
 
-    # Generate random family name
-    def generate_family_name(self):
-        return self.fake.name().split(" ")[1]
 
-    def generate_given_name(self):
-        return self.fake.name().split(" ")[0]
+def _convert_booleans(sheet_data, dtypes):
+    for column, dtype in (dtypes or {}).items():
+        if dtype != "bool" or column not in sheet_data:
+            continue
+        values = sheet_data[column]
+        if values.notna().all() and values.isin([0, 1]).all():
+            sheet_data[column] = values.astype(bool)
+    return sheet_data
 
-    def generate_gender(self):
-        return self.fake.random_element()
 
-    def generate_dob(self):
-        return self.fake.date_of_birth(minimum_age=18, maximum_age=100)
+def _parquet_columns(path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        from fastparquet import ParquetFile
 
-    def generate_disaggregation_value(self, header):
-        if header in self.valuesets.keys():
-            return self.random_valueset_value(header)
-        else:
-            if header == "Age":
-                print("Age already generated by default.")
-                return None
-            elif header == "Gender":
-                print("Gender already generated by default.")
-                return None
-
-    def random_term_value(self):
-        return randint(0, 1)
-
-    # Case function for mapping header values to generator functions
-    def map_header_value(self, header, index, parsed_data, row=None):
-        # Map header to function
-        # Call function with row as argument
-        try:
-            if header == "Patient #" or header == "Bundle #":
-                return index + 1
-            elif header == "Patient.id":
-                return str(uuid.uuid4())
-            elif header == "Test.id":
-                return str(uuid.uuid4())
-            elif header == "Patient.name.family":
-                return self.generate_family_name()
-            elif header == "Patient.name.given":
-                return self.generate_given_name()
-            elif header == "Patient.gender":
-                return self.random_valueset_value(header)
-            elif header == "Patient.birthDate":
-                return self.generate_dob()
-            # For now, the formula calculated value is stored in the column after the Denominator/Numerator heading
-            elif header in self.indicator_calculation_headers:
-                if row is None:
-                    return None
-                else:
-                    if header == "Numerator":
-                        return row.iloc[parsed_data["numerator_index"] + 1]
-                    elif header == "Denominator":
-                        return row.iloc[parsed_data["denominator_index"] + 1]
-            elif header in parsed_data["disaggregation_terms"]:
-                return self.generate_disaggregation_value(header)
-            elif (
-                header in parsed_data["numerator_terms"]
-                or header in parsed_data["denominator_terms"]
-            ):
-                if row is None:
-                    return self.random_term_value()
-                if header in row:
-                    return row[header]
-                else:
-                    print(f"Header not found in row:\n{header}\n{row}")
-                return row[header]
-        except Exception as e:
-            print(f"Error mapping header value: {header}\n{e}")
-            return None
-        print(f"Header not found in mapping: {header}")
-        return None
+        return ParquetFile(path).columns
+    return pq.read_schema(path).names
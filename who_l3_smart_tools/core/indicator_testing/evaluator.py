@@ -0,0 +1,192 @@
+"""
+Vectorized evaluation of indicator calculations over test data.
+
+The terms of a parsed calculation, see `parse_calculation_expression`, are columns of
+true/false values with a row per client or test. A calculation is evaluated for all
+rows at once by combining the columns with NumPy boolean operations following its
+condition, rather than row by row. The expected MeasureReport counts are then summed
+from the results, overall and for each stratum of the disaggregations.
+"""
+
+from typing import Dict, Mapping, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from who_l3_smart_tools.core.indicator_testing.combinations import exclude
+from who_l3_smart_tools.core.parsers.calculation_parser import Calculation, Condition
+
+__all__ = [
+    "MeasureCounts",
+    "count_measure",
+    "evaluate_calculation",
+    "evaluate_condition",
+    "term_values",
+]
+
+# Text values read as true, e.g. from CSV files
+TRUE_VALUES = ("1", "1.0", "true", "yes")
+
+
+def term_values(data: DataFrame, terms: Sequence[str]) -> np.ndarray:
+    """
+    Returns the values of the terms in each row as booleans. Blank values are
+    false.
+
+    Args:
+        data (DataFrame): The rows, with a column per term.
+        terms (list[str]): The terms.
+
+    Returns:
+        numpy.ndarray: A boolean matrix with a row per row and a column per term.
+    """
+    missing = [term for term in terms if term not in data.columns]
+    if missing:
+        raise ValueError(f"No column for the terms: {', '.join(missing)}")
+
+    values = np.empty((len(data), len(terms)), dtype=bool)
+    for index, term in enumerate(terms):
+        values[:, index] = _as_bool(data[term])
+    return values
+
+
+def _as_bool(column: pd.Series) -> np.ndarray:
+    if pd.api.types.is_bool_dtype(column):
+        return column.fillna(False).to_numpy(dtype=bool)
+    if pd.api.types.is_numeric_dtype(column):
+        return column.fillna(0).to_numpy() != 0
+    return column.astype(str).str.strip().str.lower().isin(TRUE_VALUES).to_numpy()
+
+
+def evaluate_condition(
+    condition: Optional[Condition], values: np.ndarray
+) -> np.ndarray:
+    """
+    Evaluates a condition for every row at once.
+
+    Args:
+        condition (Condition): The condition, with terms by index. None holds for
+            every row.
+        values (numpy.ndarray): The boolean values of the terms, see `term_values`.
+
+    Returns:
+        numpy.ndarray: Whether the condition holds for each row.
+    """
+    if condition is None:
+        return np.ones(len(values), dtype=bool)
+    if isinstance(condition, int):
+        return values[:, condition]
+
+    operator, operands = condition
+    results = [evaluate_condition(operand, values) for operand in operands]
+    if operator == "NOT":
+        return ~results[0]
+    if operator == "AND":
+        return np.logical_and.reduce(results)
+    return np.logical_or.reduce(results)
+
+
+def evaluate_calculation(
+    calculation: Calculation, data: DataFrame, exclusions: Sequence[str] = ()
+) -> np.ndarray:
+    """
+    Evaluates a COUNT calculation, e.g. a numerator, for every row of the data:
+    1 for the rows counted and 0 for the others. A constant calculation counts
+    every row.
+
+    Args:
+        calculation (Calculation): The parsed calculation.
+        data (DataFrame): The rows, with a column of values per term.
+        exclusions (list[str], optional): The exclusion terms, see
+            `parse_exclusion_terms`. Rows with any exclusion are not counted.
+
+    Returns:
+        numpy.ndarray: The count of each row.
+
+    Raises:
+        ValueError: If the calculation is not a COUNT with terms, or the data has
+            no column for one of its terms.
+    """
+    if calculation.is_constant:
+        return np.ones(len(data), dtype=np.int64)
+    if calculation.operation != "COUNT" or not calculation.terms:
+        raise ValueError(f"Cannot evaluate the calculation: {calculation.text}")
+
+    values = term_values(data, list(calculation.terms) + list(exclusions))
+    condition = exclude(calculation.condition, len(calculation.terms), len(exclusions))
+    return evaluate_condition(condition, values).astype(np.int64)
+
+
+class MeasureCounts(NamedTuple):
+    """
+    The expected population counts of a MeasureReport.
+
+    Attributes:
+        initial_population (int): The number of rows.
+        numerator (int): The sum of the numerator values.
+        denominator (int): The sum of the denominator values.
+        strata (dict[str, DataFrame]): The counts of each stratum by stratifier,
+            indexed by the value of the stratum with an "initial-population",
+            "numerator" and "denominator" column.
+    """
+
+    initial_population: int
+    numerator: int
+    denominator: int
+    strata: Dict[str, DataFrame]
+
+
+def count_measure(
+    numerator: Sequence,
+    denominator: Sequence,
+    strata: Optional[Mapping[str, Sequence]] = None,
+) -> MeasureCounts:
+    """
+    Sums the numerator and denominator values of the rows, overall and by stratum.
+    Blank values count as 0, and rows without a value of a stratifier are left out
+    of its strata.
+
+    Args:
+        numerator (array-like): The numerator value of each row.
+        denominator (array-like): The denominator value of each row.
+        strata (dict, optional): The value of each row by stratifier, e.g. the
+            gender of each client by "Patient.gender".
+
+    Returns:
+        MeasureCounts: The counts.
+    """
+    numerator = _as_counts(numerator)
+    counts = DataFrame(
+        {
+            "initial-population": np.ones(len(numerator), dtype=np.int64),
+            "numerator": numerator,
+            "denominator": _as_counts(denominator),
+        }
+    )
+
+    strata_counts = {}
+    if strata:
+        # A single pass over the rows counts each combination of strata, whose
+        # counts are then summed by stratifier
+        keys = [
+            pd.Series(values, name=stratifier).reset_index(drop=True)
+            for stratifier, values in strata.items()
+        ]
+        combinations = counts.groupby(keys, observed=True, dropna=False).sum()
+        for level, stratifier in enumerate(strata):
+            strata_counts[stratifier] = combinations.groupby(
+                level=level, observed=True
+            ).sum()
+
+    return MeasureCounts(
+        len(counts),
+        int(numerator.sum()),
+        int(counts["denominator"].sum()),
+        strata_counts,
+    )
+
+
+def _as_counts(values):
+    values = pd.to_numeric(pd.Series(values).reset_index(drop=True), errors="coerce")
+    return values.fillna(0).astype(np.int64)
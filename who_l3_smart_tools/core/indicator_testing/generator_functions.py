@@ -1,27 +1,15 @@
+from collections import Counter, defaultdict
+import logging
 from re import sub
 import re
-import traceback
-import uuid
-from fhir.resources.patient import Patient
-from fhir.resources.observation import Observation
-from fhir.resources.condition import Condition
-from fhir.resources.medicationstatement import MedicationStatement
-from fhir.resources.medication import Medication
-from fhir.resources.codeablereference import CodeableReference
-from fhir.resources.coding import Coding
-from fhir.resources.codeableconcept import CodeableConcept
-from fhir.resources.diagnosticreport import DiagnosticReport
-from fhir.resources.servicerequest import ServiceRequest
-from fhir.resources.episodeofcare import EpisodeOfCare
-from fhir.resources.bundle import Bundle
-from fhir.resources.bundle import BundleEntry
-from fhir.resources.bundle import BundleEntryRequest
-from fhir.resources.fhirtypes import Uri
-
-import random
 import time
+from who_l3_smart_tools.core.indicator_testing.bundle_builder import BundleBuilder
+from who_l3_smart_tools.utils.rng import get_rng, uuid4
+
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 # This collection of functions is used to generate synthetic FHIR resources for testing purposes.
 
 
@@ -39,21 +27,23 @@ def snake_case(s):
     return s.lower()
 
 
+# Resources are built as plain dicts, and only validated once the whole bundle has
+# been generated, see BundleBuilder.build.
+
+
 def generate_patient_resource(row):
-    # Create an instance of Patient
-    patient = Patient.parse_obj(
-        {
-            "resourceType": "Patient",
-            "id": row["Patient.ID"],
-            "gender": (
-                row["Patient.Gender"].lower()
-                if row["Patient.Gender"] in ["male", "female", "other", "unknown"]
-                else "unknown"
-            ),
-            "birthDate": row["Patient.DOB"],
-            # Additional required attributes should be added here
-        }
-    )
+    # Create a Patient
+    patient = {
+        "resourceType": "Patient",
+        "id": row["Patient.ID"],
+        "gender": (
+            row["Patient.Gender"].lower()
+            if row["Patient.Gender"] in ["male", "female", "other", "unknown"]
+            else "unknown"
+        ),
+        "birthDate": row["Patient.DOB"],
+        # Additional required attributes should be added here
+    }
     return patient
 
 
@@ -64,19 +54,17 @@ def generate_observation_resource(code, patient_id, val=None):
     elif code and isinstance(code, dict) and "code" in code:
         code = {"coding": [code]}
 
-    # Create an instance of Observation
-    observation = Observation.parse_obj(
-        {
-            "resourceType": "Observation",
-            "status": "final",
-            # Observation subject would need to be a reference to the Patient resource
-            "subject": {"reference": f"Patient/{patient_id}"},
-            "code": code,
-        }
-    )
+    # Create an Observation
+    observation = {
+        "resourceType": "Observation",
+        "status": "final",
+        # Observation subject would need to be a reference to the Patient resource
+        "subject": {"reference": f"Patient/{patient_id}"},
+        "code": code,
+    }
 
     if val:
-        observation.valueString = val
+        observation["valueString"] = val
 
     return observation
 
@@ -86,31 +74,15 @@ def find_or_create_test_resources(bundle, row, test_coding):
     test_resources = {}
 
     # Generate uuids for the resources
-    dr_uuid = str(uuid.uuid4())
-    obs_uuid = str(uuid.uuid4())
-    sr_uuid = row["Test.id"] if "Test.id" in row else str(uuid.uuid4())
+    dr_uuid = str(uuid4())
+    obs_uuid = str(uuid4())
+    sr_uuid = row["Test.id"] if "Test.id" in row else str(uuid4())
 
     # Find ServiceRequest if it exists
-    service_request_entry = next(
-        (
-            x
-            for x in bundle.entry
-            if x.resource.resource_type == "ServiceRequest"
-            and x.resource.code.concept.coding
-            and len(x.resource.code.concept.coding) > 0
-            and x.resource.code.concept.coding[0].code == test_coding["code"]
-        ),
-        None,
-    )
-
-    service_request = (
-        service_request_entry.resource
-        if service_request_entry and service_request_entry.resource
-        else None
-    )
+    service_request = bundle.find_by_code("ServiceRequest", test_coding)
 
     if not service_request:
-        service_request = ServiceRequest.parse_obj(
+        service_request = bundle.add(
             {
                 "id": f"{sr_uuid}",
                 "resourceType": "ServiceRequest",
@@ -120,35 +92,15 @@ def find_or_create_test_resources(bundle, row, test_coding):
                 "code": {"concept": {"coding": [test_coding]}},
             }
         )
-
-        bundle.entry.append(
-            BundleEntry(
-                resource=service_request,
-                request=BundleEntryRequest(method="PUT", url=Uri("ServiceRequest")),
-            )
-        )
     test_resources["sr"] = service_request
 
     # Find DiagnosticReport if it exists
-    diagnostic_report = next(
-        (
-            x
-            for x in bundle.entry
-            if x.resource.resource_type == "DiagnosticReport"
-            and x.resource.basedOn
-            and x.resource.basedOn[0].reference == f"ServiceRequest/{sr_uuid}"
-        ),
-        None,
-    )
-
-    diagnostic_report = (
-        diagnostic_report.resource
-        if diagnostic_report and diagnostic_report.resource
-        else None
+    diagnostic_report = bundle.find_by_based_on(
+        "DiagnosticReport", f"ServiceRequest/{sr_uuid}"
     )
 
     if not diagnostic_report:
-        diagnostic_report = DiagnosticReport.parse_obj(
+        diagnostic_report = bundle.add(
             {
                 "id": f"{dr_uuid}",
                 "resourceType": "DiagnosticReport",
@@ -159,30 +111,13 @@ def find_or_create_test_resources(bundle, row, test_coding):
                 "result": [{"reference": f"Observation/{obs_uuid}"}],
             }
         )
-        bundle.entry.append(
-            BundleEntry(
-                resource=diagnostic_report,
-                request=BundleEntryRequest(method="PUT", url=Uri("DiagnosticReport")),
-            )
-        )
     test_resources["dr"] = diagnostic_report
-    # Find Observation if it exists
-    observation = next(
-        (
-            x
-            for x in bundle.entry
-            if x.resource.resource_type == "Observation"
-            and x.resource.code.coding
-            and len(x.resource.code.coding) > 0
-            and x.resource.code.coding[0] == test_coding
-        ),
-        None,
-    )
 
-    observation = observation.resource if observation and observation.resource else None
+    # Find Observation if it exists
+    observation = bundle.find_by_code("Observation", test_coding)
 
     if not observation:
-        observation = Observation.parse_obj(
+        observation = bundle.add(
             {
                 "id": f"{obs_uuid}",
                 "resourceType": "Observation",
@@ -191,46 +126,24 @@ def find_or_create_test_resources(bundle, row, test_coding):
                 "subject": {"reference": f"Patient/{row['Patient.id']}"},
             }
         )
-        bundle.entry.append(
-            BundleEntry(
-                resource=observation,
-                request=BundleEntryRequest(method="PUT", url=Uri("Observation")),
-            )
-        )
     test_resources["obs"] = observation
 
     return test_resources, bundle
 
 
 def find_or_create_condition_resource(bundle, coding):
-    condition_resource = None
+    condition_resource = bundle.find_by_code("Condition", coding)
 
-    for r in bundle.entry:
-        try:
-            if r.resource.resource_type == "Condition":
-                if (
-                    r.resource.code.coding[0].code == coding["code"]
-                    and r.resource.code.coding[0].system == coding["system"]
-                ):
-                    condition_resource = r.resource
-                    break
-        except:
-            pass
     if not condition_resource:
-        condition_resource = Condition.construct()
-        bundle.entry.append(
-            BundleEntry(
-                resource=condition_resource,
-                request=BundleEntryRequest(method="PUT", url=Uri("Condition")),
-            )
-        )
+        # The code is set by update_condition_resource, so index by the given coding
+        condition_resource = bundle.add({"resourceType": "Condition"}, code=coding)
     return condition_resource, bundle
 
 
 def update_condition_resource(
     condition, row, coding=None, start_date=None, end_date=None
 ):
-    condition.clinicalStatus = {
+    condition["clinicalStatus"] = {
         "coding": [
             {
                 "system": "http://terminology.hl7.org/CodeSystem/condition-clinical",
@@ -239,7 +152,7 @@ def update_condition_resource(
             }
         ]
     }
-    condition.verificationStatus = {
+    condition["verificationStatus"] = {
         "coding": [
             {
                 "system": "http://terminology.hl7.org/CodeSystem/condition-ver-status",
@@ -249,21 +162,23 @@ def update_condition_resource(
     }
 
     if coding and isinstance(coding, list):
-        condition.code = {"coding": coding}
+        condition["code"] = {"coding": coding}
 
     if start_date and end_date:
-        condition.onsetDateTime = random_date_between(start_date, end_date).isoformat()
+        condition["onsetDateTime"] = random_date_between(
+            start_date, end_date
+        ).isoformat()
 
-    condition.subject = {"reference": f"Patient/{row['Patient.id']}"}
+    condition["subject"] = {"reference": f"Patient/{row['Patient.id']}"}
 
 
 def generate_art_medication_statement_resource(row, start_date, end_date):
-    # Create an instance of MedicationStatement
-    medication_statement = MedicationStatement.parse_obj(
-        {
-            "resourceType": "MedicationStatement",
-            "status": "active",
-            "code": {
+    # Create a MedicationStatement
+    medication_statement = {
+        "resourceType": "MedicationStatement",
+        "status": "recorded",
+        "medication": {
+            "concept": {
                 "coding": [
                     {
                         "system": "http://www.nlm.nih.gov/research/umls/rxnorm",
@@ -271,46 +186,50 @@ def generate_art_medication_statement_resource(row, start_date, end_date):
                         "display": "Tenofovir disoproxil fumarate 300 MG / emtricitabine 200 MG Oral Tablet [Truvada]",
                     }
                 ]
-            },
-            "subject": {"reference": f"Patient/{row['Patient.ID']}"},
-            "effectiveDateTime": random_date_between(start_date, end_date).isoformat(),
-            "dosage": [
-                {
-                    "text": "Take one tablet once daily",
-                    "timing": {
-                        "repeat": {"frequency": 1, "period": 1, "periodUnit": "d"}
-                    },
-                    "route": {
-                        "coding": [
-                            {
-                                "system": "http://snomed.info/sct",
-                                "code": "26643006",
-                                "display": "Oral route",
-                            }
-                        ]
-                    },
-                    "doseQuantity": {
-                        "value": 1,
-                        "unit": "tablet",
-                        "system": "http://unitsofmeasure.org",
-                        "code": "tablet",
-                    },
-                }
-            ],
-        }
-    )
+            }
+        },
+        "subject": {"reference": f"Patient/{row['Patient.id']}"},
+        "effectiveDateTime": random_date_between(start_date, end_date).isoformat(),
+        "dosage": [
+            {
+                "text": "Take one tablet once daily",
+                "timing": {
+                    "repeat": {"frequency": 1, "period": 1, "periodUnit": "d"}
+                },
+                "route": {
+                    "coding": [
+                        {
+                            "system": "http://snomed.info/sct",
+                            "code": "26643006",
+                            "display": "Oral route",
+                        }
+                    ]
+                },
+                "doseAndRate": [
+                    {
+                        "doseQuantity": {
+                            "value": 1,
+                            "unit": "tablet",
+                            "system": "http://unitsofmeasure.org",
+                            "code": "tablet",
+                        }
+                    }
+                ],
+            }
+        ],
+    }
     return medication_statement
 
 
 def add_deceased_information(patient, measurementEnd):
     # Generate random date of death before measurementEnd
-    deathDate = random_date(patient.birthDate, measurementEnd)
+    deathDate = random_date(patient["birthDate"], measurementEnd)
 
     # Add deceased information to the Patient resource
-    if random.choice([True, False]):
-        patient.deceasedBoolean = True
+    if get_rng().choice([True, False]):
+        patient["deceasedBoolean"] = True
     else:
-        patient.deceasedDateTime = deathDate
+        patient["deceasedDateTime"] = deathDate
 
     return patient
 
@@ -320,10 +239,10 @@ def add_future_deceased_information(patient, measurementEnd):
     deathDate = random_date(measurementEnd, measurementEnd + timedelta(days=365))
 
     # Add deceased information to the Patient resource
-    if random.choice([True, False]):
-        patient.deceasedBoolean = True
+    if get_rng().choice([True, False]):
+        patient["deceasedBoolean"] = True
     else:
-        patient.deceasedDateTime = deathDate
+        patient["deceasedDateTime"] = deathDate
 
     return patient
 
@@ -339,41 +258,39 @@ def str_time_prop(start, end, time_format, prop):
     start = start[:10]
     end = end[:10]
 
-    stime = time.mktime(time.strptime(start, time_format))
-    etime = time.mktime(time.strptime(end, time_format))
+    stime = datetime.strptime(start, time_format)
+    etime = datetime.strptime(end, time_format)
 
     ptime = stime + prop * (etime - stime)
 
-    return time.strftime(time_format, time.localtime(ptime))
+    return ptime.strftime(time_format)
 
 
 def random_date(start, end):
     return str_time_prop(
-        start.isoformat(), end.isoformat(), "%Y-%m-%d", random.random()
+        start.isoformat(), end.isoformat(), "%Y-%m-%d", get_rng().random()
     )
 
 
 def get_episode_of_care_scaffold():
-    return EpisodeOfCare.parse_obj(
-        {
-            "resourceType": "EpisodeOfCare",
-            "patient": {"reference": f"Patient/{row['Patient.id']}"},
-            "diagnosis": [
-                {
-                    "condition": {"reference": "Condition/condition1"},
-                    "role": {
-                        "coding": [
-                            {
-                                "system": "http://terminology.hl7.org/CodeSystem/diagnosis-role",
-                                "code": "primary",
-                            }
-                        ]
-                    },
-                    "rank": 1,
-                }
-            ],
-        }
-    )
+    return {
+        "resourceType": "EpisodeOfCare",
+        "patient": {"reference": f"Patient/{row['Patient.id']}"},
+        "diagnosis": [
+            {
+                "condition": {"reference": "Condition/condition1"},
+                "role": {
+                    "coding": [
+                        {
+                            "system": "http://terminology.hl7.org/CodeSystem/diagnosis-role",
+                            "code": "primary",
+                        }
+                    ]
+                },
+                "rank": 1,
+            }
+        ],
+    }
 
 
 def generate_episode_of_care_finished_before_measurement(row, measurement_end):
@@ -382,7 +299,7 @@ def generate_episode_of_care_finished_before_measurement(row, measurement_end):
     """
     # Parse from string
     episode_of_care = get_episode_of_care_scaffold()
-    episode_of_care.status = "finished"
+    episode_of_care["status"] = "finished"
 
     # Assuming the date of birth is in row['Patient.birthDate']
     dob = datetime.fromisoformat(row["Patient.birthDate"])
@@ -390,7 +307,7 @@ def generate_episode_of_care_finished_before_measurement(row, measurement_end):
     period_start = random_date_between(dob, period_end)
 
     # Create the period
-    episode_of_care.period = {
+    episode_of_care["period"] = {
         "start": period_start.isoformat(),
         "end": period_end.isoformat(),
     }
@@ -403,14 +320,14 @@ def generate_episode_of_care_finished_after_measurement(row, measurement_end):
     Generate an EpisodeOfCare resource that ends after the measurement period.
     """
     episode_of_care = get_episode_of_care_scaffold()
-    episode_of_care.status = "active"
+    episode_of_care["status"] = "active"
 
     period_start = random_date_between(
         measurement_end, measurement_end + timedelta(days=365)
     )
 
     # Create the period
-    episode_of_care.period = {
+    episode_of_care["period"] = {
         "start": period_start.isoformat()
         # The 'end' key is not set, assuming the episode is ongoing after the measurement period.
     }
@@ -423,40 +340,91 @@ def random_date_between(start_date, end_date):
     Generate a random datetime between start_date and end_date.
     """
     time_between_dates = end_date - start_date
-    random_number_of_days = random.randrange(time_between_dates.days)
+    random_number_of_days = get_rng().randrange(time_between_dates.days)
     random_date = start_date + timedelta(days=random_number_of_days)
     return random_date
 
 
 def create_transaction_bundle(resources):
-    entries = []
+    bundle = BundleBuilder()
 
     for resource in resources:
-        entry = BundleEntry(
-            resource=resource,
-            request=BundleEntryRequest(method="POST", url=Uri(resource.resource_type)),
-        )
-        entries.append(entry)
-
-    bundle = Bundle(type="transaction", entry=entries)
+        if not isinstance(resource, dict):
+            resource = resource.dict()
+        bundle.add(resource, method="POST")
 
-    return bundle
+    return bundle.build()
 
 
 # Function to generate a random date of birth
 def random_dob(start_year=1920, end_year=2003):
     start = datetime(year=start_year, month=1, day=1)
     end = datetime(year=end_year, month=12, day=31)
-    random_date = start + timedelta(days=randint(0, (end - start).days))
+    random_date = start + timedelta(days=get_rng().randint(0, (end - start).days))
     return random_date.isoformat()[:10]
 
 
+class GenerationStats:
+    """
+    Counts the resources generated and failed for each feature, and the time spent
+    generating them. Errors are counted by feature and message rather than reported
+    for every row.
+
+    Attributes:
+        generated (Counter): The number of rows generated, by feature.
+        failed (Counter): The number of rows that failed, by feature.
+        elapsed (dict[str, float]): The seconds spent, by feature.
+        errors (dict[str, Counter]): The number of each error, by feature.
+    """
+
+    def __init__(self):
+        self.generated = Counter()
+        self.failed = Counter()
+        self.elapsed = defaultdict(float)
+        self.errors = defaultdict(Counter)
+
+    def merge(self, other):
+        """
+        Adds the counts of other stats, e.g. from another process, to these.
+        """
+        self.generated.update(other.generated)
+        self.failed.update(other.failed)
+        for feature, elapsed in other.elapsed.items():
+            self.elapsed[feature] += elapsed
+        for feature, errors in other.errors.items():
+            self.errors[feature].update(errors)
+
+    def clear(self):
+        self.generated.clear()
+        self.failed.clear()
+        self.elapsed.clear()
+        self.errors.clear()
+
+    def summary(self):
+        """
+        Returns the counts as a table, one line per feature, followed by the errors.
+        """
+        features = list(dict.fromkeys([*self.generated, *self.failed]))
+        width = max([len(feature) for feature in features] + [len("Feature")])
+
+        lines = [f"{'Feature':<{width}}  Generated  Failed  Time (s)"]
+        for feature in features:
+            lines.append(
+                f"{feature:<{width}}  {self.generated[feature]:>9}  "
+                f"{self.failed[feature]:>6}  {self.elapsed[feature]:>8.2f}"
+            )
+        for feature, errors in self.errors.items():
+            for message, count in errors.most_common():
+                lines.append(f"{count} x {feature}: {message}")
+        return "\n".join(lines)
+
+
 # Generator Fuctions
 # These functions are mapped to the features from the list above using the snake_case
 # function. They generate FHIR resources based on the input data.
 #
-# Each function is a passthrough: it takes in a FHIR bundle, makes some modifications,
-# and returns the modified bundle.
+# Each function is a passthrough: it takes in a BundleBuilder, makes some modifications,
+# and returns the modified builder.
 
 
 class FhirGenerator:
@@ -533,26 +501,35 @@ class FhirGenerator:
         self.all_feature_keys = all_feature_keys
         self.reporting_period_start_date = reporting_period_start_date
         self.reporting_period_end_date = reporting_period_end_date
+        self.stats = GenerationStats()
 
         return
 
     def generate_for(self, header, row, bundle):
+        start = time.perf_counter()
         try:
             # Get the function to call based on the header
-            print(f"Generating resource for header '{header}'")
+            logger.debug("Generating resource for header '%s'", header)
             function = self.get_mapped_function(header)
-            return function(row, bundle, header)
+            bundle = function(row, bundle, header)
+            self.stats.generated[header] += 1
         except Exception as e:
-            print(f"Error generating resource for header '{header}':\n{e}")
-            print(traceback.format_exc())
-            return bundle
+            # Errors are summarized by self.stats, the traceback of each one is only
+            # logged for debugging
+            logger.debug(
+                "Error generating resource for header '%s'", header, exc_info=True
+            )
+            self.stats.failed[header] += 1
+            self.stats.errors[header][f"{type(e).__name__}: {e}"] += 1
+        self.stats.elapsed[header] += time.perf_counter() - start
+        return bundle
 
     def get_mapped_function(self, key):
+        function_name = "generate_" + snake_case(key)
+
         if key not in self.all_feature_keys:
             raise Exception(f"Function {function_name} not found for key '{key}'")
 
-        function_name = "generate_" + snake_case(key)
-
         fn = getattr(self, function_name)
 
         if callable(fn):
@@ -582,49 +559,34 @@ class FhirGenerator:
             )
 
             # Add effective datetime
-            observation.effectiveDateTime = random_date(
+            observation["effectiveDateTime"] = random_date(
                 end=self.reporting_period_end_date
             )
 
-            bundle.entry.append(
-                BundleEntry(
-                    resource=observation,
-                    request=BundleEntryRequest(method="PUT", url=Uri("Observation")),
-                )
-            )
+            bundle.add(observation)
         else:
             # Do nothing or add observation after reporting period
-            if random.choice([True, False]):
+            if get_rng().choice([True, False]):
                 observation = generate_observation_resource(
                     code=my_coding, patient_id=row["Patient.id"]
                 )
-                observation.effectiveDateTime = random_date(
+                observation["effectiveDateTime"] = random_date(
                     self.reporting_period_end_date,
                     self.reporting_period_end_date + timedelta(days=365),
                 )
 
-                bundle.entry.append(
-                    BundleEntry(
-                        resource=observation,
-                        request=BundleEntryRequest(
-                            method="PUT", url=Uri("Observation")
-                        ),
-                    )
-                )
+                bundle.add(observation)
 
         return bundle
 
     def generate_key_population_member_type(self, row, bundle, header):
         obs_value = row[header]
 
-        bundle.entry.append(
-            BundleEntry(
-                resource=generate_observation_resource(
-                    val=obs_value,
-                    code=self.codings["key-population"],
-                    patient_id=row["Patient.id"],
-                ),
-                request=BundleEntryRequest(method="PUT", url=Uri("Observation")),
+        bundle.add(
+            generate_observation_resource(
+                val=obs_value,
+                code=self.codings["key-population"],
+                patient_id=row["Patient.id"],
             )
         )
 
@@ -679,32 +641,24 @@ class FhirGenerator:
                 bundle, row, self.codings["hiv-test"]
             )
             observation = test_resources["obs"]
-            observation.method = self.codings["self-reported"]
+            observation["method"] = {"coding": [self.codings["self-reported"]]}
 
         return bundle
 
     def generate_hiv_test_result_hiv_positive(self, row, bundle, header):
         # Add / modify condition resource based on value of feature
         test_coding = self.codings["hiv-test"]
-        unrelated_coding = CodeableConcept.parse_obj(
-            {
-                "coding": [
-                    {
-                        "code": "1234567",
-                        "display": "Unrelated",
-                    }
-                ]
-            }
-        )
-        positive_coding = CodeableConcept.parse_obj(
-            {"coding": [self.codings["hiv-positive"]]}
-        )
-        negative_coding = CodeableConcept.parse_obj(
-            {"coding": [self.codings["hiv-negative"]]}
-        )
-        inconclusive_coding = CodeableConcept.parse_obj(
-            {"coding": [self.codings["inconclusive"]]}
-        )
+        unrelated_coding = {
+            "coding": [
+                {
+                    "code": "1234567",
+                    "display": "Unrelated",
+                }
+            ]
+        }
+        positive_coding = {"coding": [self.codings["hiv-positive"]]}
+        negative_coding = {"coding": [self.codings["hiv-negative"]]}
+        inconclusive_coding = {"coding": [self.codings["inconclusive"]]}
 
         # Search for existing condition resource or create new
         test_resources, bundle = find_or_create_test_resources(bundle, row, test_coding)
@@ -712,27 +666,22 @@ class FhirGenerator:
         obs = test_resources.get("obs")
 
         if row[header] == "1":
-            obs.valueCodeableConcept = positive_coding
+            obs["valueCodeableConcept"] = positive_coding
         else:
             # Randomly assign negative, inconclusive or no result
-            coding = random.choice(
+            coding = get_rng().choice(
                 [negative_coding, inconclusive_coding, unrelated_coding, None]
             )
             if coding is not None:
-                if obs and isinstance(obs, Observation):
-                    obs.valueCodeableConcept = coding
+                if obs:
+                    obs["valueCodeableConcept"] = coding
                 else:
                     raise Exception(
                         "Observation resource does not exist for test result"
                     )
             else:
                 # Remove Observation resource
-                bundle.entry = [
-                    x
-                    for x in bundle.entry
-                    if x.resource.resource_type != "Observation"
-                    or x.resource.id != obs.id
-                ]
+                bundle.remove(obs)
 
         return bundle
 
@@ -757,18 +706,18 @@ class FhirGenerator:
 
             if my_value == "1":
                 # Date should be in the reporting period
-                dr.effectiveDateTime = random_date_between(
+                dr["effectiveDateTime"] = random_date_between(
                     self.reporting_period_start_date, self.reporting_period_end_date
                 ).isoformat()
-                obs.effectiveDateTime = dr.effectiveDateTime
+                obs["effectiveDateTime"] = dr["effectiveDateTime"]
             else:
                 # Date should be outside the reporting period
                 outside_start = self.reporting_period_start_date - timedelta(days=10)
                 outside_end = outside_start + timedelta(days=5)
-                dr.effectiveDateTime = random_date_between(
+                dr["effectiveDateTime"] = random_date_between(
                     outside_start, outside_end
                 ).isoformat()
-                obs.effectiveDateTime = dr.effectiveDateTime
+                obs["effectiveDateTime"] = dr["effectiveDateTime"]
 
         else:
             # Test resources should not exist - do nothing
@@ -786,16 +735,16 @@ class FhirGenerator:
                 bundle, row, self.codings["hiv-test"]
             )
             sr = test_resources["sr"]
-            sr.authoredOn = random_date_between(
+            sr["authoredOn"] = random_date_between(
                 self.reporting_period_start_date, self.reporting_period_end_date
             ).isoformat()
         else:
-            if random.choice([True, False]):
+            if get_rng().choice([True, False]):
                 test_resources, bundle = find_or_create_test_resources(
                     bundle, row, self.codings["hiv-test"]
                 )
                 sr = test_resources["sr"]
-                sr.authoredOn = random_date_between(
+                sr["authoredOn"] = random_date_between(
                     self.reporting_period_start_date - timedelta(days=10),
                     self.reporting_period_end_date,
                 ).isoformat()
@@ -808,7 +757,7 @@ class FhirGenerator:
         my_coding = self.codings["hiv-condition"]
 
         # Determine if creating a new condition
-        create_new_condition = random.choice([True, False])
+        create_new_condition = get_rng().choice([True, False])
         if header:
             hiv_positive = row[header] and row[header] == "1"
         else:
@@ -842,29 +791,15 @@ class FhirGenerator:
 
     def generate_hiv_treatment_outcome_in_death_documented(self, row, bundle, header):
         val = row[header]
-        patient = next(
-            (
-                x.resource
-                for x in bundle.entry
-                if x.resource.resource_type == "Patient"
-                and x.resource.id == row["Patient.id"]
-            ),
-            None,
-        )
-
-        patient = (
-            patient.resource if patient and isinstance(patient, BundleEntry) else None
-        )
+        patient = bundle.find_by_id("Patient", row["Patient.id"])
 
         if patient:
             if val == "1":
-                patient.resource = add_deceased_information(
-                    patient.resource, self.reporting_period_end_date
-                )
+                add_deceased_information(patient, self.reporting_period_end_date)
             else:
-                if random.choice([True, False]):
-                    patient.resource = add_future_deceased_information(
-                        patient.resource, self.reporting_period_end_date
+                if get_rng().choice([True, False]):
+                    add_future_deceased_information(
+                        patient, self.reporting_period_end_date
                     )
 
         return bundle
@@ -874,16 +809,11 @@ class FhirGenerator:
 
         if val == "1":
             # Generate Episode of Care resource, connect to condition resource, and add
-            bundle.entry.append(
-                BundleEntry(
-                    resource=generate_art_medication_statement_resource(
-                        row,
-                        self.reporting_period_start_date,
-                        self.reporting_period_end_date,
-                    ),
-                    request=BundleEntryRequest(
-                        method="PUT", url=Uri("MedicationStatement")
-                    ),
+            bundle.add(
+                generate_art_medication_statement_resource(
+                    row,
+                    self.reporting_period_start_date,
+                    self.reporting_period_end_date,
                 )
             )
         else:
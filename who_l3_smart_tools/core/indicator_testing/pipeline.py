@@ -0,0 +1,166 @@
+"""
+An asyncio pipeline that overlaps bundle generation with writing or uploading.
+
+Bundles are generated in a worker thread and pushed into a bounded queue, from which
+a number of async workers pass them on to the sinks, e.g. a FHIR server upload or a
+local file. Generation blocks while the queue is full, so only a bounded number of
+bundles is held in memory at any time.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from who_l3_smart_tools.utils.fhirclient import AsyncFhirUploader
+from who_l3_smart_tools.utils.ndjson import NdjsonWriter
+
+__all__ = ["FhirServerSink", "NdjsonSink", "run_pipeline"]
+
+Sink = Callable[[str, Any], Awaitable[None]]
+
+# marks the end of the bundles
+_DONE = object()
+
+
+async def run_pipeline(
+    bundles: Iterable[Tuple[str, Any]],
+    sinks: List[Sink],
+    queue_size: int = 64,
+    workers: int = 4,
+) -> None:
+    """
+    Passes bundles to the sinks while they are being generated.
+
+    Args:
+        bundles (Iterable[tuple[str, Bundle]]): The sheet name and bundle pairs,
+            e.g. from `BundleGenerator.iter_bundles`. This is consumed in a worker
+            thread.
+        sinks (list): Async callables taking a sheet name and bundle. Each bundle
+            is passed to every sink in turn.
+        queue_size (int, optional): The maximum number of bundles waiting to be
+            consumed. Defaults to 64.
+        workers (int, optional): The number of async workers consuming bundles.
+            Defaults to 4.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        try:
+            for item in bundles:
+                if stop.is_set():
+                    return
+                put(item)
+        finally:
+            if not stop.is_set():
+                for _ in range(workers):
+                    put(_DONE)
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            sheet_name, bundle = item
+            for sink in sinks:
+                await sink(sheet_name, bundle)
+
+    producer = asyncio.create_task(asyncio.to_thread(produce))
+    consumers = [asyncio.create_task(consume()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*consumers)
+    finally:
+        for consumer in consumers:
+            consumer.cancel()
+
+        # unblock the producer if it is waiting on a full queue
+        stop.set()
+        while not queue.empty():
+            queue.get_nowait()
+
+        await producer
+
+
+class FhirServerSink:
+    """
+    A pipeline sink uploading bundles to a FHIR server. Other resources, e.g. the
+    MeasureReport of a sheet, are uploaded in a bundle of their own.
+
+    Args:
+        uploader (AsyncFhirUploader): The uploader. It is closed by `close`.
+    """
+
+    def __init__(self, uploader: AsyncFhirUploader):
+        self.uploader = uploader
+
+    async def __call__(self, sheet_name: str, bundle: Any) -> None:
+        await self.uploader.add(self._as_bundle(bundle))
+
+    @staticmethod
+    def _as_bundle(resource: Any) -> Any:
+        if isinstance(resource, dict):
+            resource_type = resource["resourceType"]
+        else:
+            resource_type = resource.resource_type
+        if resource_type == "Bundle":
+            return resource
+
+        if not isinstance(resource, dict):
+            resource = json.loads(resource.json())
+        return {
+            "resourceType": "Bundle",
+            "type": "transaction",
+            "entry": [
+                {
+                    "resource": resource,
+                    "request": {"method": "POST", "url": resource_type},
+                }
+            ],
+        }
+
+    async def close(self):
+        """
+        Waits for the remaining uploads to complete.
+
+        Returns:
+            UploadReport: The results of the uploads.
+        """
+        return await self.uploader.close()
+
+
+class NdjsonSink:
+    """
+    A pipeline sink writing bundles to NDJSON files in a directory per sheet, see
+    `NdjsonWriter`.
+
+    Args:
+        output_directory (str): The directory to write the files to.
+        **kwargs: Passed on to the `NdjsonWriter` of each sheet.
+    """
+
+    def __init__(self, output_directory: str, **kwargs):
+        self.output_directory = output_directory
+        self.writers: Dict[str, NdjsonWriter] = {}
+        self.__kwargs = kwargs
+
+    async def __call__(self, sheet_name: str, bundle: Any) -> None:
+        writer = self.writers.get(sheet_name)
+        if writer is None:
+            writer = self.writers[sheet_name] = NdjsonWriter(
+                os.path.join(self.output_directory, sheet_name), **self.__kwargs
+            )
+
+        await asyncio.to_thread(writer.write, bundle)
+
+    def close(self) -> None:
+        """
+        Closes the files of every sheet.
+        """
+        for writer in self.writers.values():
+            writer.close()
@@ -1,9 +1,18 @@
 import pandas as pd
-from itertools import product
 from openpyxl import Workbook
 import re
+from openpyxl.formatting.rule import FormulaRule
 from openpyxl.styles import PatternFill
-from openpyxl.utils import get_column_letter
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+from who_l3_smart_tools.core.indicator_testing.combinations import (
+    exclude,
+    generate_combinations,
+)
+from who_l3_smart_tools.core.parsers.calculation_parser import (
+    parse_calculation_expression,
+    parse_exclusion_terms,
+)
 
 # Define fill colors
 fills = {
@@ -25,6 +34,10 @@ fills = {
 }
 
 
+# The number of rows of an Excel worksheet
+MAX_ROWS = 1048576
+
+
 # Function to add unique items preserving order
 def add_unique_preserving_order(original_list, items_to_add):
     for item in items_to_add:
@@ -36,98 +49,66 @@ def apply_background_color(ws, column_letter, fill):
     """
     Apply background color to an entire column.
     """
-    for row in ws[column_letter]:
-        row.fill = fill
+    column = column_index_from_string(column_letter)
+    apply_fill_to_column_range(ws, column, column, fill)
 
 
 def apply_fill_to_column_range(ws, start_col, end_col, fill):
     """
     Apply a background fill to a range of columns within a worksheet.
-    """
 
-    for col in range(start_col, end_col + 1):
-        for row in ws[get_column_letter(col)]:
-            row.fill = fill
+    The fill is applied as a single conditional format spanning the whole columns,
+    rather than to each cell, so it costs the same however many rows the worksheet
+    has, and works on write-only worksheets whatever rows they have been written.
+    """
+    cell_range = (
+        f"{get_column_letter(start_col)}1:"
+        f"{get_column_letter(end_col)}{MAX_ROWS}"
+    )
+    ws.conditional_formatting.add(cell_range, FormulaRule(formula=["TRUE"], fill=fill))
 
 
 def parse_exclusions(exclusions_str):
-    try:
-        pattern = r'with a[n]? "(.*?)" IN (.*?) at the end of the reporting period'
-        match = re.search(pattern, exclusions_str)
-
-        if match:
-            variable = match.group(1)
-            terms = match.group(2)
-            terms_list = [term.strip() for term in terms.split(",")]
-            result = [f'"{variable}" IN {term}' for term in terms_list]
-            return exclusions_str, result
-        else:
-            return exclusions_str, exclusions_str.split(",")
-
-    except Exception as e:
-        print(f"Error parsing exclusions: {e}")
+    if not isinstance(exclusions_str, str):
         return None, []
+    return exclusions_str, list(parse_exclusion_terms(exclusions_str))
 
 
 def parse_calculation(description):
-    scope = "unknown"
-
-    if description == "1":
-        scope = "1"
-        return [], scope
-
-    client_scope_pattern = re.compile(r"of clients|for all clients", re.IGNORECASE)
-    test_scope_pattern = re.compile(r"of tests|for all tests", re.IGNORECASE)
-
-    if client_scope_pattern.search(description):
-        scope = "clients"
-    elif test_scope_pattern.search(description):
-        scope = "tests"
-
-    # Define the patterns
-    count_pattern = re.compile(r"COUNT OF (.*?) WITH", re.IGNORECASE)
-    sum_pattern = re.compile(r"SUM OF (.*?) FOR ALL CLIENTS WITH", re.IGNORECASE)
-    term_pattern = re.compile(r"WITH (.*)", re.IGNORECASE)
-    and_or_pattern = re.compile(r"\bAND\b|\bOR\b", re.IGNORECASE)
-    op_split_terms = []
-
-    # Find COUNT OF or SUM OF patterns
-    count_match = count_pattern.search(description)
-    sum_match = sum_pattern.search(description)
-
-    if count_match:
-        op_term_str = count_match.group(1)
-    elif sum_match:
-        op_term_str = sum_match.group(1)
-        op_split_terms = re.split(
-            r"\sAND\s|\sOR\s(?![^()]*\))", op_term_str, flags=re.IGNORECASE
-        )
-    else:
-        return [], scope
+    terms, _, scope = split_calculation(description)
+    return terms, scope
 
-    # Find the terms after the WITH
-    term_match = term_pattern.search(description)
-    if not term_match:
-        return [], scope
 
-    terms = term_match.group(1)
+def parse_connectives(description):
+    """
+    Returns the "AND" or "OR" connective between each pair of the terms returned
+    by `parse_calculation`.
+    """
+    _, connectives, _ = split_calculation(description)
+    return connectives
 
-    # Split the terms by AND or OR, but not within parentheses
-    split_terms = re.split(r"\sAND\s|\sOR\s(?![^()]*\))", terms, flags=re.IGNORECASE)
 
-    return_terms = []
-    if op_split_terms and len(op_split_terms) > 0:
-        return_terms.extend(op_split_terms)
-    return_terms.extend(split_terms)
+def split_calculation(description):
+    """
+    Returns the terms, connectives and scope of a calculation, see
+    `parse_calculation_expression`.
+    """
+    calculation = parse_calculation_expression(description)
+    return list(calculation.terms), list(calculation.connectives), calculation.scope
 
-    return_terms = [term.strip() for term in return_terms]
 
-    return return_terms, scope
+# Patterns of the elements of calculations
+operation_pattern = re.compile(r"(SUM|COUNT)\s+")
+simple_sum_term_pattern = re.compile(r'SUM of\s+"([^"]+)"\s+for all clients')
+complex_sum_term_pattern = re.compile(r"SUM of \[(.*?)\] for all clients", re.DOTALL)
+quoted_term_pattern = re.compile(r'"([^"]+)"')
+condition_pattern = re.compile(r'"([^"]+)"\s*(=|IN)\s*\'([^\']*)\'')
+reporting_period_pattern = re.compile(r'"([^"]+)"\s+in\s+the\s+reporting\s+period')
 
 
 def extract_elements(calculation_str):
     # Extract the main operation (SUM or COUNT)
-    operation_match = re.match(r"(SUM|COUNT)\s+", calculation_str)
+    operation_match = operation_pattern.match(calculation_str)
     operation = operation_match.group(1) if operation_match else ""
 
     if not operation:
@@ -140,33 +121,25 @@ def extract_elements(calculation_str):
     # Handle complex SUM expressions separately
     if operation == "SUM":
         # Look for a term immediately following "SUM of" for simple SUM operations
-        simple_sum_term_match = re.search(
-            r'SUM of\s+"([^"]+)"\s+for all clients', calculation_str
-        )
+        simple_sum_term_match = simple_sum_term_pattern.search(calculation_str)
         if simple_sum_term_match:
             sum_expression_terms.add(simple_sum_term_match.group(1))
 
         # Handle complex SUM expressions involving DIFFERENCE, MIN, and MAX
-        complex_sum_term_match = re.search(
-            r"SUM of \[(.*?)\] for all clients", calculation_str, re.DOTALL
-        )
+        complex_sum_term_match = complex_sum_term_pattern.search(calculation_str)
         if complex_sum_term_match:
             sum_expression = complex_sum_term_match.group(1)
             # Extract terms from the complex SUM expression
-            for term in re.findall(r'"([^"]+)"', sum_expression):
+            for term in quoted_term_pattern.findall(sum_expression):
                 sum_expression_terms.add(term)
 
     # Extract conditions outside of SUM expressions
-    conditions_match = re.finditer(
-        r'"([^"]+)"\s*(=|IN)\s*\'([^\']*)\'', calculation_str
-    )
+    conditions_match = condition_pattern.finditer(calculation_str)
     for match in conditions_match:
         unique_terms.add(f"{match.group(1)} {match.group(2)} {match.group(3)}")
 
     # Handle "in the reporting period" phrases
-    reporting_period_match = re.finditer(
-        r'"([^"]+)"\s+in\s+the\s+reporting\s+period', calculation_str
-    )
+    reporting_period_match = reporting_period_pattern.finditer(calculation_str)
     for match in reporting_period_match:
         unique_terms.add(f"{match.group(1)} in the reporting period")
 
@@ -179,11 +152,39 @@ def extract_elements(calculation_str):
 
 
 class ScaffoldingGenerator:
-    def __init__(self, input_file, output_file):
+    """
+    Generates a test scaffolding workbook with a worksheet per indicator, whose rows
+    combine the values of the indicator's numerator terms.
+
+    Args:
+        input_file (str): The DAK indicator workbook.
+        output_file (str): The scaffolding workbook to write.
+        combinations (str, optional): How the rows combine the term values, one of
+            "exhaustive" (every combination), "covering" (a covering array) or
+            "mcdc" (following the AND/OR structure of the calculation), see the
+            combinations module. Defaults to "exhaustive".
+        strength (int, optional): The strength of covering arrays, e.g. 2 for
+            pairwise coverage. Defaults to 2.
+        max_rows (int, optional): The maximum number of rows per indicator.
+    """
+
+    def __init__(
+        self,
+        input_file,
+        output_file,
+        combinations="exhaustive",
+        strength=2,
+        max_rows=None,
+    ):
         self.input_file = input_file
         self.output_file = output_file
+        self.combinations = combinations
+        self.strength = strength
+        self.max_rows = max_rows
         self.dak_data = pd.read_excel(input_file, sheet_name="Indicator definitions")
-        self.writer = pd.ExcelWriter(output_file, engine="openpyxl")
+        # Rows are streamed to the file rather than kept in memory, and worksheets
+        # are painted by column, see paint_worksheet
+        self.workbook = Workbook(write_only=True)
 
     def generate_test_scaffolding(self):
         for index, row in self.dak_data.iterrows():
@@ -195,7 +196,7 @@ class ScaffoldingGenerator:
             # Create a new worksheet for each indicator
             indicator_id = row_data["dak-id"]
             ws_name = f"{indicator_id}"
-            workbook = self.writer.book
+            workbook = self.workbook
 
             if ws_name in workbook.sheetnames:
                 ws = workbook[ws_name]
@@ -222,15 +223,7 @@ class ScaffoldingGenerator:
             # Only create combinations for numerator and numerator exclusion, since
             # denominator should be a superset and might need to be cleaned up manually
             # due to the DAK imprecise definitions.
-            combinations = list(
-                product(
-                    [0, 1],
-                    repeat=(
-                        len(row_data["numerator-terms"])
-                        + len(row_data["numerator-exclusions"])
-                    ),
-                )
-            )
+            combinations = self.generate_combinations(row_data)
 
             # If client scope, then each row represents a unique client. If test scope,
             # then each row represents a unique test. For simplicity, we only deal with the
@@ -244,7 +237,25 @@ class ScaffoldingGenerator:
             # Apply color fills based on calculated column ranges
             self.paint_worksheet(ws, row_data)
 
-        self.writer.close()
+        self.workbook.save(self.output_file)
+
+    def generate_combinations(self, row_data):
+        """
+        Generates the combinations of values of the numerator terms and exclusions
+        of an indicator lazily, with the generator's strategy and row budget.
+        """
+        num_terms = len(row_data["numerator-terms"])
+        num_exclusions = len(row_data["numerator-exclusions"])
+        condition = exclude(
+            row_data["numerator-calculation"].condition, num_terms, num_exclusions
+        )
+        return generate_combinations(
+            self.combinations,
+            num_terms + num_exclusions,
+            condition,
+            strength=self.strength,
+            max_rows=self.max_rows,
+        )
 
     def parse_dak_row(self, row):
         # Extract the elements from the row
@@ -269,13 +280,14 @@ class ScaffoldingGenerator:
         )
 
         # Parse the numerator and denominator calculations
-        row_data["numerator-terms"], row_data["numerator-scope"] = parse_calculation(
-            row["Numerator calculation"]
-        )
-
-        row_data["denominator-terms"], row_data["denominator-scope"] = (
-            parse_calculation(row["Denominator calculation"])
-        )
+        for part in ("numerator", "denominator"):
+            calculation = parse_calculation_expression(
+                row[f"{part.capitalize()} calculation"]
+            )
+            row_data[f"{part}-calculation"] = calculation
+            row_data[f"{part}-terms"] = list(calculation.terms)
+            row_data[f"{part}-connectives"] = list(calculation.connectives)
+            row_data[f"{part}-scope"] = calculation.scope
 
         return row_data
 
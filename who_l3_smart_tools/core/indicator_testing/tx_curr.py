@@ -29,18 +29,9 @@ def generate_random_row():
 
 # Compute numerator and denominator based on the dataset
 def compute_counts(df):
-    df["Numerator"] = df.apply(
-        lambda x: int(
-            x["HIV_Positive"]
-            and x["HIV_Treatment"]
-            and not (x["Deceased"] or x["Stopped_ART"])
-        ),
-        axis=1,
-    )
-    df["Denominator (EST)"] = df.apply(
-        lambda x: int(x["HIV_Positive"] and not (x["Deceased"] or x["Stopped_ART"])),
-        axis=1,
-    )
+    retained = df["HIV_Positive"] & ~(df["Deceased"] | df["Stopped_ART"])
+    df["Numerator"] = (retained & df["HIV_Treatment"]).astype(int)
+    df["Denominator (EST)"] = retained.astype(int)
     total_numerator = df["Numerator"].sum()
     total_denominator = df["Denominator (EST)"].sum()
     overall_indicator = total_numerator / total_denominator if total_denominator else 0
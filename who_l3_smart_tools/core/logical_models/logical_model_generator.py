@@ -2,13 +2,19 @@ import os
 import re
 import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, NamedTuple, Tuple
 
 import inflect
 import pandas as pd
 import stringcase
 
+from who_l3_smart_tools.core.parsers.dak_workbook import DakWorkbook
 from who_l3_smart_tools.utils import camel_case
+from who_l3_smart_tools.utils.cache import file_sha256, get_cache_dir, set_cache_dir
 from who_l3_smart_tools.utils.counter import Counter
+from who_l3_smart_tools.utils.manifest import BuildManifest, hash_inputs
 
 # TODO: differentiate between Coding, code, and CodableConcept
 # Boolean
@@ -104,13 +110,34 @@ fsh_vs_code_template = """
 inflect_engine = inflect.engine()
 
 
+class SheetArtifacts(NamedTuple):
+    """The output generated for a single sheet of the data dictionary.
+
+    Attributes:
+        files (list[tuple[str, str]]): The paths and contents of the logical model
+            and value set files, in the order they are written.
+        codes (list[dict]): The codes to add to the CodeSystem.
+        input_hash (str): The hash of the inputs the sheet was generated from.
+        invariants (int): The number of invariant ids the sheet used.
+        reused (bool): Whether the files of the sheet are unchanged since the last
+            run, in which case they were not generated again and `files` is empty.
+    """
+
+    files: List[Tuple[str, str]]
+    codes: List[dict]
+    input_hash: str
+    invariants: int
+    reused: bool = False
+
+
 # pylint: disable=too-many-locals,too-few-public-methods
 class LogicalModelAndTerminologyGenerator:
     """
     Class for generating FSH logical models and terminologies based on an input Excel file.
 
     Attributes:
-        input_file (str): The path to the input Excel file.
+        input_file (str | DakWorkbook): The path to the input Excel file, or an
+            already opened DakWorkbook.
         output_dir (str): The directory where the generated FSH files will be saved.
         models_dir (str): The directory within the output directory where the
             logical models will be saved.
@@ -129,16 +156,21 @@ class LogicalModelAndTerminologyGenerator:
         self.invariants_dict = defaultdict(Counter)
 
     # pylint: disable=too-many-branches,too-many-statements
-    def generate_fsh_from_excel(self):
+    def generate_fsh_from_excel(self, jobs=1):
         """
         Generates FSH logical models and terminologies from the input Excel file.
+
+        Args:
+            jobs (int, optional): The number of processes used to generate the
+                logical models. Sheets are processed serially in this process if 1.
+                Defaults to 1.
         """
         for _dir in [self.models_dir, self.codesystem_dir, self.valuesets_dir]:
             if not os.path.exists(_dir):
                 os.makedirs(_dir)
 
-        # Load the Excel file
-        dd_xls = pd.read_excel(self.input_file, sheet_name=None)
+        # Load the Excel file; sheets are only parsed when accessed
+        dd_xls = DakWorkbook.open(self.input_file)
 
         # Process the Cover sheet
         cover_info = self.process_cover(dd_xls["COVER"])
@@ -148,312 +180,506 @@ class LogicalModelAndTerminologyGenerator:
         # store the actual codes as we process them
         codes = []
 
+        # Iterate over each sheet in the Excel file and generate a FSH logical model for each one
+        sheet_names = [
+            sheet_name
+            for sheet_name in dd_xls.keys()
+            if re.match(r"HIV\.\w+", sheet_name)
+        ]
+
+        with BuildManifest(self.output_dir) as manifest:
+            # sheets whose inputs are unchanged since the last run are not generated
+            # again, see reuse_sheet
+            if jobs > 1 and len(sheet_names) > 1:
+                sheet_artifacts = self._generate_sheets_in_parallel(
+                    sheet_names, cover_info, jobs, manifest
+                )
+            else:
+                sheet_artifacts = (
+                    self._reuse_or_generate_sheet(
+                        manifest,
+                        sheet_name,
+                        dd_xls[sheet_name],
+                        cover_info[sheet_name.upper()],
+                    )
+                    for sheet_name in sheet_names
+                )
+
+            # files are written here, in sheet order, so the output does not depend on
+            # the order in which the sheets were generated. Unchanged files are not
+            # rewritten.
+            for sheet_name, artifacts in zip(sheet_names, sheet_artifacts):
+                for output_file, content in artifacts.files:
+                    manifest.write(output_file, content, artifacts.input_hash)
+                if not artifacts.reused:
+                    manifest.record(
+                        sheet_name,
+                        artifacts.input_hash,
+                        [output_file for output_file, _ in artifacts.files],
+                        {"codes": artifacts.codes, "invariants": artifacts.invariants},
+                    )
+
+                codes.extend(artifacts.codes)
+
+            if len(codes) > 0:
+                code_system_artifact = fsh_cs_header_template.format(
+                    code_system=code_system,
+                    title="WHO SMART HIV Concepts CodeSystem",
+                    description="This code system defines the concepts used in the "
+                    "World Health Organization SMART HIV DAK",
+                )
+
+                for code in codes:
+                    code_system_artifact += fsh_cs_code_template.format(**code)
+
+                code_system_output_file = os.path.join(
+                    self.codesystem_dir, "HIVConcepts.fsh"
+                )
+
+                manifest.write(
+                    code_system_output_file,
+                    code_system_artifact + "\n",
+                    hash_inputs(codes),
+                )
+
+    def sheet_input_hash(self, sheet_name, df, cover_description):
+        """
+        Returns the hash of everything the files of a sheet are generated from: the
+        contents of the sheet, its description, the invariant ids it starts from and
+        the code of this generator.
+
+        Args:
+            sheet_name (str): The name of the sheet.
+            df (pd.DataFrame): The contents of the sheet.
+            cover_description (str): The description of the sheet on the cover.
+
+        Returns:
+            str: The hash, see `hash_inputs`.
+        """
+        return hash_inputs(
+            _generator_version(),
+            sheet_name,
+            cover_description,
+            self.invariants_dict[self.invariant_key(sheet_name)].current,
+            list(df.columns),
+            pd.util.hash_pandas_object(df).values.tobytes(),
+        )
+
+    def reuse_sheet(self, manifest, sheet_name, input_hash):
+        """
+        Restores the codes and invariant ids of a sheet from the build manifest, if
+        its inputs and files are unchanged since the last run.
+
+        Args:
+            manifest (BuildManifest): The manifest of the output directory.
+            sheet_name (str): The name of the sheet.
+            input_hash (str): The hash of the sheet's inputs, see `sheet_input_hash`.
+
+        Returns:
+            SheetArtifacts | None: The artifacts of the sheet, without files, or None
+                if the sheet must be generated.
+        """
+        recorded = manifest.reuse(sheet_name, input_hash)
+        if recorded is None:
+            return None
+
+        counter = self.invariants_dict[self.invariant_key(sheet_name)]
+        self.invariants_dict[self.invariant_key(sheet_name)] = Counter(
+            counter.current + recorded["invariants"]
+        )
+        return SheetArtifacts(
+            [], recorded["codes"], input_hash, recorded["invariants"], reused=True
+        )
+
+    def _reuse_or_generate_sheet(self, manifest, sheet_name, df, cover_description):
+        input_hash = self.sheet_input_hash(sheet_name, df, cover_description)
+        artifacts = self.reuse_sheet(manifest, sheet_name, input_hash)
+        if artifacts is None:
+            artifacts = self.generate_sheet(
+                sheet_name, df, cover_description, input_hash
+            )
+        return artifacts
+
+    def generate_sheet(self, sheet_name, df, cover_description, input_hash=None):
+        """
+        Generates the FSH logical model and value sets for a single sheet of the
+        data dictionary.
+
+        Args:
+            sheet_name (str): The name of the sheet.
+            df (pd.DataFrame): The contents of the sheet.
+            cover_description (str): The description of the sheet on the cover.
+            input_hash (str, optional): The hash of the sheet's inputs, if already
+                computed, see `sheet_input_hash`.
+
+        Returns:
+            SheetArtifacts: The files to write and the codes defined by the sheet.
+        """
+        # Code system name
+        code_system = "HIVConcepts"
+
+        # hard-coded, but the page labelled E-F has no F codes
+        if sheet_name == "HIV.E-F PMTCT":
+            cleaned_sheet_name = "HIV.E PMTCT"
+        else:
+            cleaned_sheet_name = sheet_name
+
+        clean_name = stringcase.alphanumcase(cleaned_sheet_name)
+        short_name = (cleaned_sheet_name.split(" ")[0]).split(".")
+
+        # everything the sheet's files are generated from, for the build manifest
+        if input_hash is None:
+            input_hash = self.sheet_input_hash(sheet_name, df, cover_description)
+        invariant_start = self.invariants_dict[short_name[1]].current
+
+        # Initialize the FSH artifact
+        fsh_artifact = ""
+
+        # invariants are only referenced within the sheet that defines them
         validation_lookup = {}
 
-        # Iterate over each sheet in the Excel file and generate a FSH logical model for each one
+        # codes for the CodeSystem
+        codes = []
 
-        # pylint: disable=too-many-nested-blocks
-        for sheet_name in dd_xls.keys():
-            if re.match(r"HIV\.\w+", sheet_name):
-                df = dd_xls[sheet_name]
+        # Initialize any ValueSets
+        valuesets = []
+        active_valueset = None
 
-                # hard-coded, but the page labelled E-F has no F codes
-                if sheet_name == "HIV.E-F PMTCT":
-                    cleaned_sheet_name = "HIV.E PMTCT"
-                else:
-                    cleaned_sheet_name = sheet_name
+        # Track element names
+        existing_elements = defaultdict(Counter)
+
+        # For handling "Other (specify)"
+        previous_element_label = None
 
-                clean_name = stringcase.alphanumcase(cleaned_sheet_name)
-                short_name = (cleaned_sheet_name.split(" ")[0]).split(".")
+        # Process Invariants First
+        # Get all unique validation conditions, and store their assigned rows
+        validations = self.parse_validations(df)
 
-                # Initialize the FSH artifact
-                fsh_artifact = ""
+        # Template for invariants based on validation conditions
+        for validation, data_ids in validations.items():
+            _id = self.invariants_dict[short_name[1]].next
+            invariant_id = f"{short_name[0]}-{short_name[1]}-{_id}"
+            if isinstance(validation, str):
+                description = validation.replace('"', "'")
+            else:
+                description = ""
+
+            expression = "<NOT-IMPLEMENTED>"
+            fsh_artifact += (
+                fsh_invariant_template.format(
+                    invariant_id=invariant_id,
+                    description=description,
+                    expression=expression,
+                )
+                + "\n"
+            )
 
-                # Initialize any ValueSets
-                valuesets = []
-                active_valueset = None
+            for data_element_id in data_ids:
+                validation_lookup[data_element_id] = invariant_id
 
-                # Track element names
-                existing_elements = defaultdict(Counter)
+        # Generate the FSH logical model header based on the sheet name
+        fsh_header = (
+            fsh_lm_header_template.format(
+                name=clean_name,
+                title=sheet_name,
+                description=cover_description,
+            )
+            + "\n"
+        )
 
-                # For handling "Other (specify)"
-                previous_element_label = None
+        fsh_artifact += fsh_header
 
-                # Process Invariants First
-                # Get all unique validation conditions, and store their assigned rows
-                validations = self.parse_validations(df)
+        for _, row in df.iterrows():
+            data_element_id = row["Data Element ID"]
+            if not isinstance(data_element_id, str) or not data_element_id:
+                continue
 
-                # Template for invariants based on validation conditions
-                for validation, data_ids in validations.items():
-                    _id = self.invariants_dict[short_name[1]].next
-                    invariant_id = f"{short_name[0]}-{short_name[1]}-{_id}"
-                    if isinstance(validation, str):
-                        description = validation.replace('"', "'")
+            # Process general fields
+            multiple_choice_type = row["Multiple Choice Type (if applicable)"]
+            data_type = row["Data Type"]
+            label = row["Data Element Label"]
+
+            if isinstance(label, str) and label:
+                # Other (specify) elements come after a list as a data element to
+                # contain a non-coded selection
+                if label.lower() == "other (specify)":
+                    if previous_element_label:
+                        label_clean = f"Other_{previous_element_label.lower()}"
                     else:
-                        description = ""
-
-                    expression = "<NOT-IMPLEMENTED>"
-                    fsh_artifact += (
-                        fsh_invariant_template.format(
-                            invariant_id=invariant_id,
-                            description=description,
-                            expression=expression,
-                        )
-                        + "\n"
-                    )
+                        label_clean = "Other (specify)"
+                else:
 
-                    for data_element_id in data_ids:
-                        validation_lookup[data_element_id] = invariant_id
+                    # equalize spaces
+                    label = (
+                        label.strip()
+                        .replace("*", "")
+                        .replace("[", "")
+                        .replace("]", "")
+                        .replace('"', "'")
+                    )
 
-                # Generate the FSH logical model header based on the sheet name
-                fsh_header = (
-                    fsh_lm_header_template.format(
-                        name=clean_name,
-                        title=sheet_name,
-                        description=cover_info[sheet_name.upper()],
+                    # remove many special characters
+                    label_clean = (
+                        label.replace("(", "")
+                        .replace(")", "")
+                        .replace("'s", "")
+                        .replace("-", "_")
+                        .replace("/", "_")
+                        .replace(",", "")
+                        .replace(" ", "_")
+                        .replace(">=", "more than")
+                        .replace("<=", "less than")
+                        .replace(">", "more than")
+                        .replace("<", "less than")
+                        .lower()
                     )
-                    + "\n"
-                )
+            else:
+                label = ""
+                label_clean = ""
 
-                fsh_artifact += fsh_header
-
-                for _, row in df.iterrows():
-                    data_element_id = row["Data Element ID"]
-                    if not isinstance(data_element_id, str) or not data_element_id:
-                        continue
-
-                    # Process general fields
-                    multiple_choice_type = row["Multiple Choice Type (if applicable)"]
-                    data_type = row["Data Type"]
-                    label = row["Data Element Label"]
-
-                    if isinstance(label, str) and label:
-                        # Other (specify) elements come after a list as a data element to
-                        # contain a non-coded selection
-                        if label.lower() == "other (specify)":
-                            if previous_element_label:
-                                label_clean = f"Other_{previous_element_label.lower()}"
-                            else:
-                                label_clean = "Other (specify)"
-                        else:
-
-                            # equalize spaces
-                            label = (
-                                label.strip()
-                                .replace("*", "")
-                                .replace("[", "")
-                                .replace("]", "")
-                                .replace('"', "'")
-                            )
-
-                            # remove many special characters
-                            label_clean = (
-                                label.replace("(", "")
-                                .replace(")", "")
-                                .replace("'s", "")
-                                .replace("-", "_")
-                                .replace("/", "_")
-                                .replace(",", "")
-                                .replace(" ", "_")
-                                .replace(">=", "more than")
-                                .replace("<=", "less than")
-                                .replace(">", "more than")
-                                .replace("<", "less than")
-                                .lower()
-                            )
-                    else:
-                        label = ""
-                        label_clean = ""
+            code_sys_ref = f"{code_system}#{data_element_id}"
+            description = row["Description and Definition"]
 
-                    code_sys_ref = f"{code_system}#{data_element_id}"
-                    description = row["Description and Definition"]
+            if isinstance(description, str):
+                description = description.replace("*", "").replace('"', "'")
+            else:
+                description = ""
 
-                    if isinstance(description, str):
-                        description = description.replace("*", "").replace('"', "'")
-                    else:
-                        description = ""
+            required = row["Required"]
 
-                    required = row["Required"]
+            if required == "C":
+                # pylint: disable=unused-variable
+                required_condition = row["Explain Conditionality"]
 
-                    if required == "C":
-                        # pylint: disable=unused-variable
-                        required_condition = row["Explain Conditionality"]
+            codes.append(
+                {
+                    "code": data_element_id,
+                    "label": label,
+                    "description": description,
+                }
+            )
 
-                    codes.append(
+            # handle ValueSets
+            # First we identify a ValueSet
+            # Originally, this looked at the Multiple Choice Type,
+            # but that doesn't seem to be
+            # guaranteed to be meaningful
+            if data_type == "Coding":
+                active_valueset = {
+                    "value_set": data_element_id,
+                    "name": data_element_id.replace(".", ""),
+                    "title": f"{label} ValueSet",
+                    "description": f"Value set of "
+                    f"{description[0].lower() + description[1:] \
+                       if description[0].isupper() \
+                        and not description.startswith("HIV") else description}",
+                    "codes": [],
+                }
+                valuesets.append(active_valueset)
+            # Then we identify the codes for the ValueSet
+            elif (
+                data_type == "Codes" and multiple_choice_type == "Input Option"
+            ):
+                if active_valueset is None:
+                    print(
+                        f"Attempted to create a member of a ValueSet without a "
+                        f"ValueSet context for code {data_element_id}",
+                        sys.stderr,
+                    )
+                else:
+                    active_valueset["codes"].append(
                         {
-                            "code": data_element_id,
-                            "label": label,
-                            "description": description,
+                            "code": f"{code_system}#{data_element_id}",
+                            "label": f"{label}",
                         }
                     )
 
-                    # handle ValueSets
-                    # First we identify a ValueSet
-                    # Originally, this looked at the Multiple Choice Type,
-                    # but that doesn't seem to be
-                    # guaranteed to be meaningful
-                    if data_type == "Coding":
-                        active_valueset = {
-                            "value_set": data_element_id,
-                            "name": data_element_id.replace(".", ""),
-                            "title": f"{label} ValueSet",
-                            "description": f"Value set of "
-                            f"{description[0].lower() + description[1:] \
-                               if description[0].isupper() \
-                                and not description.startswith("HIV") else description}",
-                            "codes": [],
-                        }
-                        valuesets.append(active_valueset)
-                    # Then we identify the codes for the ValueSet
-                    elif (
-                        data_type == "Codes" and multiple_choice_type == "Input Option"
-                    ):
-                        if active_valueset is None:
-                            print(
-                                f"Attempted to create a member of a ValueSet without a "
-                                f"ValueSet context for code {data_element_id}",
-                                sys.stderr,
-                            )
-                        else:
-                            active_valueset["codes"].append(
-                                {
-                                    "code": f"{code_system}#{data_element_id}",
-                                    "label": f"{label}",
-                                }
-                            )
-
-                    # If row is a value in a valueset, skip since the info is in Terminology
-                    if data_type == "Codes":
-                        continue
-
-                    # For any non-code we set the previous element name. This is used to determine the
-                    # name for "Other (specify)" data elements
-                    previous_element_label = label_clean
-
-                    # The camel-case version of the label becomes the element name in the logical model
-                    label_camel = camel_case(label_clean)
-
-                    # valid element identifiers in FHIR must start with a alphabetical character
-                    # therefore if an element starts with a number, we swap the spelt-out version of the
-                    # number, using the inflect library
-                    if len(label_camel) > 0 and not label_camel[0].isalpha():
-                        try:
-                            prefix, rest = re.split(r"(?=[a-zA-Z])", label_camel, 1)
-                        except Exception:  # pylint: disable=broad-exception-caught
-                            prefix, rest = label_camel, ""
-
-                        if prefix.isnumeric():
-                            prefix = camel_case(
-                                inflect_engine.number_to_words(int(prefix)).replace(
-                                    "-", "_"
-                                )
-                            )
-                        else:
-                            print(
-                                "Did not know how to handle element prefix:",
-                                sheet_name,
-                                data_element_id,
-                                prefix,
-                                file=sys.stderr,
-                            )
-
-                        label_camel = f"{prefix}{rest}"
-
-                    # data elements can only be 64 characters
-                    # note that the idea here is that we trim whole words until reaching the desired size
-                    if len(label_camel) > 64:
-                        new_label_camel = ""
-                        for label_part in re.split("(?=[A-Z1-9])", label_camel):
-                            if len(new_label_camel) + len(label_part) > 64:
-                                break
-
-                            new_label_camel += label_part
-                        label_camel = new_label_camel
-
-                    # data elements names must be unique per logical model
-                    count = existing_elements[label_camel].next
-
-                    # we have a duplicate data element
-                    if count > 1:
-                        # the first element needs no suffix
-                        # so the suffix is one less than the count
-                        suffix = str(count - 1)
-
-                        # if the data element id will still be less than 64 characters, we're ok
-                        if len(label_camel) + len(suffix) <= 64:
-                            label_camel += suffix
-                        # otherwise, shorten the name to include the suffix
-                        else:
-                            label_camel = label_camel[: 64 - len(suffix)] + suffix
-
-                    # Process as a normal entry
-                    fsh_artifact += fsh_lm_element_template.format(
-                        element_name=label_camel,
-                        cardinality=self.map_cardinality(
-                            required, multiple_choice_type
-                        ),
-                        data_type=self.map_data_type(data_type),
-                        label=label,
-                        description=description,
-                    )
+            # If row is a value in a valueset, skip since the info is in Terminology
+            if data_type == "Codes":
+                continue
 
-                    # Add validation if needed
-                    if data_element_id in validation_lookup:
-                        fsh_artifact += fsh_lm_validation_element_template.format(
-                            validation_id=validation_lookup[data_element_id]
+            # For any non-code we set the previous element name. This is used to determine the
+            # name for "Other (specify)" data elements
+            previous_element_label = label_clean
+
+            # The camel-case version of the label becomes the element name in the logical model
+            label_camel = camel_case(label_clean)
+
+            # valid element identifiers in FHIR must start with a alphabetical character
+            # therefore if an element starts with a number, we swap the spelt-out version of the
+            # number, using the inflect library
+            if len(label_camel) > 0 and not label_camel[0].isalpha():
+                try:
+                    prefix, rest = re.split(r"(?=[a-zA-Z])", label_camel, 1)
+                except Exception:  # pylint: disable=broad-exception-caught
+                    prefix, rest = label_camel, ""
+
+                if prefix.isnumeric():
+                    prefix = camel_case(
+                        inflect_engine.number_to_words(int(prefix)).replace(
+                            "-", "_"
                         )
-
-                    # Add Terminology reference
-                    fsh_artifact += fsh_lm_coding_element_template.format(
-                        code=code_sys_ref
+                    )
+                else:
+                    print(
+                        "Did not know how to handle element prefix:",
+                        sheet_name,
+                        data_element_id,
+                        prefix,
+                        file=sys.stderr,
                     )
 
-                    # Process Coding/Codes/Input Options with ValueSets
-                    if data_type == "Coding":
-                        fsh_artifact += fsh_lm_valueset_element_template.format(
-                            label=label_camel, valueset=f"{data_element_id}"
-                        )
+                label_camel = f"{prefix}{rest}"
 
-                output_file = os.path.join(
-                    self.models_dir, f"{stringcase.alphanumcase(sheet_name)}.fsh"
-                )
+            # data elements can only be 64 characters
+            # note that the idea here is that we trim whole words until reaching the desired size
+            if len(label_camel) > 64:
+                new_label_camel = ""
+                for label_part in re.split("(?=[A-Z1-9])", label_camel):
+                    if len(new_label_camel) + len(label_part) > 64:
+                        break
 
-                with open(output_file, "w") as f:
-                    f.write(fsh_artifact + "\n")
+                    new_label_camel += label_part
+                label_camel = new_label_camel
 
-                if len(valuesets) > 0:
-                    for valueset in valuesets:
-                        vs_artifact = fsh_vs_header_temmplate.format(**valueset)
-                        for code in valueset["codes"]:
-                            vs_artifact += fsh_vs_code_template.format(**code)
+            # data elements names must be unique per logical model
+            count = existing_elements[label_camel].next
 
-                        if len(valueset["codes"]) > 0:
-                            vs_artifact += "\n"
+            # we have a duplicate data element
+            if count > 1:
+                # the first element needs no suffix
+                # so the suffix is one less than the count
+                suffix = str(count - 1)
 
-                        output_file = os.path.join(
-                            self.valuesets_dir, f"{valueset['value_set']}.fsh"
-                        )
+                # if the data element id will still be less than 64 characters, we're ok
+                if len(label_camel) + len(suffix) <= 64:
+                    label_camel += suffix
+                # otherwise, shorten the name to include the suffix
+                else:
+                    label_camel = label_camel[: 64 - len(suffix)] + suffix
+
+            # Process as a normal entry
+            fsh_artifact += fsh_lm_element_template.format(
+                element_name=label_camel,
+                cardinality=self.map_cardinality(
+                    required, multiple_choice_type
+                ),
+                data_type=self.map_data_type(data_type),
+                label=label,
+                description=description,
+            )
+
+            # Add validation if needed
+            if data_element_id in validation_lookup:
+                fsh_artifact += fsh_lm_validation_element_template.format(
+                    validation_id=validation_lookup[data_element_id]
+                )
 
-                        with open(output_file, "w") as f:
-                            f.write(vs_artifact)
+            # Add Terminology reference
+            fsh_artifact += fsh_lm_coding_element_template.format(
+                code=code_sys_ref
+            )
+
+            # Process Coding/Codes/Input Options with ValueSets
+            if data_type == "Coding":
+                fsh_artifact += fsh_lm_valueset_element_template.format(
+                    label=label_camel, valueset=f"{data_element_id}"
+                )
 
-        if len(codes) > 0:
-            code_system_artifact = fsh_cs_header_template.format(
-                code_system=code_system,
-                title="WHO SMART HIV Concepts CodeSystem",
-                description="This code system defines the concepts used in the World "
-                "Health Organization SMART HIV DAK",
+        files = [
+            (
+                os.path.join(
+                    self.models_dir, f"{stringcase.alphanumcase(sheet_name)}.fsh"
+                ),
+                fsh_artifact + "\n",
             )
+        ]
+
+        for valueset in valuesets:
+            vs_artifact = fsh_vs_header_temmplate.format(**valueset)
+            for code in valueset["codes"]:
+                vs_artifact += fsh_vs_code_template.format(**code)
 
-            for code in codes:
-                code_system_artifact += fsh_cs_code_template.format(**code)
+            if len(valueset["codes"]) > 0:
+                vs_artifact += "\n"
 
-            code_system_output_file = os.path.join(
-                self.codesystem_dir, "HIVConcepts.fsh"
+            files.append(
+                (
+                    os.path.join(self.valuesets_dir, f"{valueset['value_set']}.fsh"),
+                    vs_artifact,
+                )
             )
 
-            with open(code_system_output_file, "w") as f:
-                f.write(code_system_artifact + "\n")
+        return SheetArtifacts(
+            files,
+            codes,
+            input_hash,
+            self.invariants_dict[short_name[1]].current - invariant_start,
+        )
+
+    def _generate_sheets_in_parallel(self, sheet_names, cover_info, jobs, manifest):
+        # Invariant ids are numbered per sheet prefix, so sheets sharing a prefix
+        # are generated in order by the same worker, starting from the current count.
+        # Sheets are reused in order until the first that must be generated, after
+        # which the invariant ids they start from are not known here.
+        dd_xls = DakWorkbook.open(self.input_file)
+        sheet_artifacts = {}
+        groups = defaultdict(list)
+        for sheet_name in sheet_names:
+            key = self.invariant_key(sheet_name)
+            if not groups[key]:
+                artifacts = self.reuse_sheet(
+                    manifest,
+                    sheet_name,
+                    self.sheet_input_hash(
+                        sheet_name, dd_xls[sheet_name], cover_info[sheet_name.upper()]
+                    ),
+                )
+                if artifacts is not None:
+                    sheet_artifacts[sheet_name] = artifacts
+                    continue
+            groups[key].append(sheet_name)
+        groups = {key: group for key, group in groups.items() if group}
+        if not groups:
+            return [sheet_artifacts[sheet_name] for sheet_name in sheet_names]
+
+        input_file = getattr(self.input_file, "input_file", self.input_file)
+        with ProcessPoolExecutor(max_workers=min(jobs, len(groups))) as executor:
+            futures = [
+                executor.submit(
+                    _generate_sheets,
+                    input_file,
+                    self.output_dir,
+                    group,
+                    {
+                        sheet_name: cover_info[sheet_name.upper()]
+                        for sheet_name in group
+                    },
+                    key,
+                    self.invariants_dict[key].current,
+                    get_cache_dir(),
+                )
+                for key, group in groups.items()
+            ]
+
+            for key, future in zip(groups, futures):
+                artifacts, invariant_count = future.result()
+                self.invariants_dict[key] = Counter(invariant_count)
+                sheet_artifacts.update(artifacts)
+
+        return [sheet_artifacts[sheet_name] for sheet_name in sheet_names]
+
+    @staticmethod
+    def invariant_key(sheet_name):
+        """
+        Returns the key used to number the invariants of a sheet, e.g. "A" for
+        "HIV.A Registration".
+        """
+        # hard-coded, but the page labelled E-F has no F codes
+        if sheet_name == "HIV.E-F PMTCT":
+            sheet_name = "HIV.E PMTCT"
+
+        return (sheet_name.split(" ")[0]).split(".")[1]
 
     ### Helpers
     def process_cover(self, cover_df):
@@ -508,3 +734,31 @@ class LogicalModelAndTerminologyGenerator:
         # unique_validations = set(df["Validation Condition"])
         valids = df.groupby("Validation Condition")["Data Element ID"].groups
         return valids
+
+
+@lru_cache(maxsize=None)
+def _generator_version():
+    # the files generated from unchanged inputs change with the code generating them
+    return file_sha256(__file__)
+
+
+def _generate_sheets(
+    input_file, output_dir, sheet_names, cover_info, key, invariant_count, cache_dir
+):
+    """Generates a group of sheets in a worker process. Returns the artifacts keyed by
+    sheet name and the final value of the invariant counter for the group."""
+    # the cache configuration is not inherited by spawned processes
+    set_cache_dir(cache_dir)
+
+    generator = LogicalModelAndTerminologyGenerator(input_file, output_dir)
+    generator.invariants_dict[key] = Counter(invariant_count)
+
+    dd_xls = DakWorkbook.open(input_file)
+    artifacts = {
+        sheet_name: generator.generate_sheet(
+            sheet_name, dd_xls[sheet_name], cover_info[sheet_name]
+        )
+        for sheet_name in sheet_names
+    }
+
+    return artifacts, generator.invariants_dict[key].current
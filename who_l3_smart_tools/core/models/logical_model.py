@@ -1,6 +1,6 @@
 from enum import Enum
 import sys
-from typing import Dict, List, Set, Union
+from typing import Any, Callable, Dict, List, Set, Union
 
 __all__ = [
     "Code",
@@ -17,6 +17,50 @@ __all__ = [
 ]
 
 
+class _LazyCollection:
+    """A descriptor for a collection attribute stored in a slot. The collection is
+    only allocated the first time it is accessed, so records that never use it do
+    not pay for an empty list or dict."""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self.factory = factory
+
+    def __set_name__(self, owner, name: str):
+        self.slot = getattr(owner, f"_{name}")
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            return self.slot.__get__(instance, owner)
+        except AttributeError:
+            value = self.factory()
+            self.slot.__set__(instance, value)
+            return value
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, value)
+
+
+class _InternedString:
+    """A descriptor for a string attribute stored in a slot. Strings are interned
+    so that values repeated across many records, e.g. activity ids and data types,
+    are only held in memory once."""
+
+    def __set_name__(self, owner, name: str):
+        self.slot = getattr(owner, f"_{name}")
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return self.slot.__get__(instance, owner)
+
+    def __set__(self, instance, value):
+        if type(value) is str:
+            value = sys.intern(value)
+        self.slot.__set__(instance, value)
+
+
 class ImplementationGuideLogicalModel:
     """An ImplementationGuideLogicalModel is an instance of the full logical model
     for an IG, including all terminology, logical models, and data elements"""
@@ -31,6 +75,34 @@ class ImplementationGuideLogicalModel:
 class DataElementRecord:
     """A DataElementRecord stores the full record for a data element defined by an ImplementationGuide"""
 
+    __slots__ = (
+        "data_element_id",
+        "_activity_id",
+        "data_element_label",
+        "data_element_label_camel",
+        "description",
+        "multiple_choice_type",
+        "_data_type",
+        "input_options",
+        "quantity_subtype",
+        "calculation",
+        "required",
+        "condition_expression",
+        "_decision_support_tables",
+        "_aggregate_indicators",
+        "annotations",
+        "containing_value_set",
+        "_extra_attributes",
+        "_invariants",
+    )
+
+    activity_id = _InternedString()
+    data_type = _InternedString()
+    decision_support_tables = _LazyCollection(list)
+    aggregate_indicators = _LazyCollection(list)
+    extra_attributes = _LazyCollection(dict)
+    invariants = _LazyCollection(list)
+
     def __init__(self, data_element_id: str):
         self.data_element_id = data_element_id
         self.activity_id: Union[str, None] = None
@@ -44,12 +116,10 @@ class DataElementRecord:
         self.calculation: Union[str, None] = None
         self.required: Union[RequiredType, None] = None
         self.condition_expression: Union[str, None] = None
-        self.decision_support_tables: List[str] = []
-        self.aggregate_indicators: List[str] = []
         self.annotations: Union[str, None] = None
         self.containing_value_set: Union[str, None] = None
-        self.extra_attributes: Dict[str, str] = {}
-        self.invariants: List[Invariant] = []
+        # decision_support_tables, aggregate_indicators, extra_attributes and
+        # invariants are allocated on first access
 
     def is_required(self):
         return self.required == RequiredType.REQUIRED
@@ -61,6 +131,8 @@ class DataElementRecord:
 class Invariant:
     """An Invariant is an invariant used by the logical model defined by an ImplementationGuide"""
 
+    __slots__ = ("invariant_id", "description", "expression")
+
     def __init__(
         self,
         invariant_id: str,
@@ -96,6 +168,8 @@ class ValueSet:
 class Code:
     """A Code is a code defined in a CodeSystem by this ImplemnetationGuide"""
 
+    __slots__ = ("code", "label", "description")
+
     def __init__(
         self,
         code: str,
@@ -146,6 +220,18 @@ class RequiredType(Enum):
 
 
 class LogicalModelElement:
+    __slots__ = (
+        "name",
+        "description",
+        "cardinality",
+        "_data_type",
+        "label",
+        "value_set",
+        "_validation_rules",
+    )
+
+    validation_rules = _LazyCollection(list)
+
     __data_type_map = {
         "Boolean": "boolean",
         "String": "string",
@@ -163,7 +249,6 @@ class LogicalModelElement:
         self._data_type: Union[None, str] = None
         self.label = label
         self.value_set: Union[str, None] = None
-        self.validation_rules: List[str] = []
 
     @property
     def data_type(self):
@@ -176,10 +261,14 @@ class LogicalModelElement:
         elif data_type in LogicalModelElement.__data_type_map:
             self._data_type = LogicalModelElement.__data_type_map[data_type]
         else:
-            self._data_type = data_type
+            self._data_type = (
+                sys.intern(data_type) if type(data_type) is str else data_type
+            )
 
 
 class Cardinality:
+    __slots__ = ("minimum", "maximum")
+
     def __init__(self):
         self.minimum = 0
         self.maximum = 1
@@ -0,0 +1,390 @@
+"""
+A parser of the calculations of DAK indicators, such as
+
+    COUNT of clients with "HIV status"='HIV-positive' AND "On ART"=True
+
+A calculation is split into tokens (quoted data elements and values, parentheses,
+operators and words) and parsed into a `Calculation`: the operation (COUNT or SUM),
+the scope of the calculation, its terms and the AND/OR condition combining them.
+
+Calculations are parsed once per process: parsed calculations are immutable and
+memoized by their text, so the scaffolding, test data and CQL generators share them.
+"""
+
+import functools
+import re
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+__all__ = [
+    "Calculation",
+    "Condition",
+    "Token",
+    "build_condition",
+    "parse_calculation_expression",
+    "parse_exclusion_terms",
+    "tokenize",
+]
+
+# A condition is the index of a term, or an operator ("AND", "OR" or "NOT") and the
+# conditions it applies to
+Condition = Union[int, Tuple[str, List["Condition"]]]
+
+
+class Token(NamedTuple):
+    """
+    A token of a calculation.
+
+    Attributes:
+        kind (str): "newline", "space", "element" (a double-quoted data element),
+            "value" (a single-quoted value), "open" or "close" (a parenthesis or
+            bracket), "operator" (a comparison) or "word".
+        text (str): The text of the token.
+        start (int): The offset of the token in the calculation.
+        end (int): The offset following the token.
+    """
+
+    kind: str
+    text: str
+    start: int
+    end: int
+
+
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<newline>\n)
+    |(?P<space>[^\S\n]+)
+    |(?P<element>"[^"\n]*")
+    |(?P<value>(?<![\w'])'[^'\n]*')
+    |(?P<open>[(\[])
+    |(?P<close>[)\]])
+    |(?P<operator>[<>!]?=|[<>])
+    |(?P<word>,|[^\s"'()\[\]<>=!,]+|["'<>=!])
+    """,
+    re.VERBOSE,
+)
+
+
+def tokenize(text: str) -> List[Token]:
+    """
+    Splits a calculation into tokens. Quotes that are not closed on the same line,
+    e.g. in `"Syphilis test result"=Positive'`, are read as words.
+
+    Args:
+        text (str): The calculation.
+
+    Returns:
+        list[Token]: The tokens, covering the whole text.
+    """
+    return [
+        Token(match.lastgroup, match.group(), match.start(), match.end())
+        for match in _TOKEN_PATTERN.finditer(text)
+    ]
+
+
+class Calculation(NamedTuple):
+    """
+    A parsed calculation, e.g. of the numerator of an indicator.
+
+    Attributes:
+        text (str): The calculation.
+        operation (str | None): "COUNT", "SUM", or None if the calculation is not
+            written in the DAK grammar.
+        scope (str): What is counted: "clients", "tests", "1" for a constant
+            calculation, or "unknown".
+        terms (tuple[str, ...]): The terms, in order. The values summed by a SUM
+            come first, followed by the terms following WITH.
+        connectives (tuple[str, ...]): The "AND" or "OR" between each pair of terms.
+        condition (Condition | None): The terms combined by their connectives and
+            parentheses, with terms by index. AND takes precedence over OR.
+    """
+
+    text: str
+    operation: Optional[str]
+    scope: str
+    terms: Tuple[str, ...]
+    connectives: Tuple[str, ...]
+    condition: Optional[Condition]
+
+    @property
+    def is_constant(self) -> bool:
+        """Whether the calculation is the constant 1, as for continuous variables."""
+        return self.scope == "1"
+
+
+@functools.lru_cache(maxsize=None)
+def parse_calculation_expression(text: str) -> Calculation:
+    """
+    Parses a calculation in the DAK grammar:
+
+        (COUNT of <subject> | SUM of <values> for all clients) with <terms>
+
+    where the terms are separated by AND or OR and may be grouped by parentheses or
+    brackets. The terms extend to the end of the line, and an OR within the
+    innermost parentheses is part of its term, as in `(A OR B)`. Text that does
+    not follow the grammar gives a calculation without terms.
+
+    Results are memoized, so each calculation is only parsed once.
+
+    Args:
+        text (str): The calculation.
+
+    Returns:
+        Calculation: The parsed calculation.
+    """
+    if text.strip() == "1":
+        return Calculation(text, None, "1", (), (), None)
+
+    tokens = tokenize(text)
+    if _find(tokens, ("OF", "CLIENTS")) or _find(tokens, ("FOR", "ALL", "CLIENTS")):
+        scope = "clients"
+    elif _find(tokens, ("OF", "TESTS")) or _find(tokens, ("FOR", "ALL", "TESTS")):
+        scope = "tests"
+    else:
+        scope = "unknown"
+
+    operation = None
+    terms: List[Tuple[int, int]] = []
+    connectives: List[str] = []
+    for start, end in _lines(tokens):
+        count = _find(tokens, ("COUNT", "OF"), start, end)
+        total = _find(tokens, ("SUM", "OF"), start, end)
+        if count:
+            with_index = _find(tokens, ("WITH",), count[1], end)
+            if with_index:
+                operation = "COUNT"
+                break
+        if total:
+            with_index = _find(tokens, ("FOR", "ALL", "CLIENTS", "WITH"), total[1], end)
+            if with_index:
+                # The summed values apply to the clients with the terms
+                operation = "SUM"
+                terms, connectives = _split_terms(tokens, total[1], with_index[0])
+                connectives.append("AND")
+                break
+    if operation is None:
+        return Calculation(text, None, scope, (), (), None)
+
+    if any(token.kind != "space" for token in tokens[with_index[1] : end]):
+        with_terms, with_connectives = _split_terms(tokens, with_index[1], end)
+        terms += with_terms
+        connectives += with_connectives
+
+    return Calculation(
+        text,
+        operation,
+        scope,
+        tuple(_text(text, tokens, start, stop) for start, stop in terms),
+        tuple(connectives),
+        build_condition([tokens[start:stop] for start, stop in terms], connectives),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def parse_exclusion_terms(text: str) -> Tuple[str, ...]:
+    """
+    Parses the exclusions of a calculation into terms. Exclusions of clients with
+    a data element IN a list of values at the end of the reporting period give a
+    term per value, e.g. `"HIV treatment outcome" IN 'Transferred out'`. Other
+    exclusions are split at commas.
+
+    Results are memoized, so each exclusion is only parsed once.
+
+    Args:
+        text (str): The exclusions.
+
+    Returns:
+        tuple[str, ...]: The exclusion terms.
+    """
+    tokens = tokenize(text)
+    for index, token in enumerate(tokens):
+        if token.text != "with":
+            continue
+        # The three words following "with"
+        words = [i for i in range(index + 1, len(tokens)) if tokens[i].kind != "space"]
+        words = words[:3]
+        if (
+            len(words) < 3
+            or tokens[words[0]].text not in ("a", "an")
+            or tokens[words[1]].kind != "element"
+            or tokens[words[2]].text != "IN"
+        ):
+            continue
+        end = _find(
+            tokens,
+            ("at", "the", "end", "of", "the", "reporting", "period"),
+            words[2] + 1,
+            case_sensitive=True,
+        )
+        if not end:
+            continue
+
+        element = tokens[words[1]].text
+        values = _split_at(tokens, words[2] + 1, end[0], lambda t: t.text == ",")
+        return tuple(
+            f"{element} IN {_text(text, tokens, start, stop)}" for start, stop in values
+        )
+
+    return tuple(text.split(","))
+
+
+def build_condition(
+    terms: Sequence[Sequence[Token]], connectives: Sequence[str]
+) -> Optional[Condition]:
+    """
+    Builds the condition of the tokens of terms and the AND/OR connectives between
+    them. Unbalanced parentheses or brackets in a term group it with the terms
+    before or after it.
+
+    Args:
+        terms (list[list[Token]]): The tokens of each term.
+        connectives (list[str]): The "AND" or "OR" between each pair of terms.
+
+    Returns:
+        Condition | None: The condition, with terms by index, or None without terms.
+    """
+    symbols: List[Union[str, int]] = []
+    for index, term in enumerate(terms):
+        depth = sum(
+            1 if token.kind == "open" else -1
+            for token in term
+            if token.kind in ("open", "close")
+        )
+        symbols.extend(["("] * max(depth, 0) + [index] + [")"] * max(-depth, 0))
+        if index < len(connectives):
+            symbols.append(connectives[index].strip().upper())
+
+    return _ConditionParser(symbols).parse() if terms else None
+
+
+class _ConditionParser:
+    # A recursive descent parser of terms, connectives and parentheses, tolerating
+    # unbalanced parentheses
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.position = 0
+
+    def parse(self) -> Optional[Condition]:
+        condition = self._or()
+        while self.position < len(self.symbols):
+            # Skip unmatched closing parentheses or connectives
+            self.position += 1
+            operands = [condition, self._or()]
+            operands = [operand for operand in operands if operand is not None]
+            condition = operands[0] if len(operands) == 1 else ("AND", operands)
+        return condition
+
+    def _peek(self):
+        if self.position < len(self.symbols):
+            return self.symbols[self.position]
+        return None
+
+    def _or(self):
+        return self._operation("OR", self._and)
+
+    def _and(self):
+        return self._operation("AND", self._operand)
+
+    def _operation(self, operator, parse_operand):
+        operands = [parse_operand()]
+        while self._peek() == operator:
+            self.position += 1
+            operands.append(parse_operand())
+        operands = [operand for operand in operands if operand is not None]
+        if len(operands) <= 1:
+            return operands[0] if operands else None
+        return (operator, operands)
+
+    def _operand(self):
+        symbol = self._peek()
+        if symbol == "(":
+            self.position += 1
+            condition = self._or()
+            if self._peek() == ")":
+                self.position += 1
+            return condition
+        if isinstance(symbol, int):
+            self.position += 1
+            return symbol
+        # A missing operand
+        return None
+
+
+def _lines(tokens):
+    # The (start, end) token indices of each line
+    start = 0
+    for index, token in enumerate(tokens):
+        if token.kind == "newline":
+            yield start, index
+            start = index + 1
+    yield start, len(tokens)
+
+
+def _find(tokens, words, start=0, end=None, case_sensitive=False):
+    # Finds the first sequence of words separated by spaces, returning the indices
+    # of its first token and of the token following it
+    end = len(tokens) if end is None else end
+    for first in range(start, end):
+        index = first
+        for word in words:
+            while index < end and tokens[index].kind == "space" and index > first:
+                index += 1
+            text = tokens[index].text if index < end else ""
+            if (text if case_sensitive else text.upper()) != word:
+                break
+            index += 1
+        else:
+            return first, index
+    return None
+
+
+def _split_terms(tokens, start, end):
+    # Splits the tokens into terms at the AND and OR words between spaces, except
+    # for an OR directly within a pair of parentheses
+    terms = _split_at(
+        tokens,
+        start,
+        end,
+        lambda index: _is_connective(tokens, index, start, end),
+        by_index=True,
+    )
+    connectives = [tokens[stop].text.upper() for _, stop in terms[:-1]]
+    return terms, connectives
+
+
+def _is_connective(tokens, index, start, end):
+    token = tokens[index]
+    if (
+        token.kind != "word"
+        or token.text.upper() not in ("AND", "OR")
+        or index - 1 < start
+        or index + 1 >= end
+        or tokens[index - 1].kind != "space"
+        or tokens[index + 1].kind != "space"
+    ):
+        return False
+    if token.text.upper() == "AND":
+        return True
+    for following in tokens[index + 1 : end]:
+        if following.text in ("(", ")"):
+            return following.text == "("
+    return True
+
+
+def _split_at(tokens, start, end, is_separator, by_index=False):
+    # The (start, end) token indices of the parts between separators
+    parts = []
+    part_start = start
+    for index in range(start, end):
+        if is_separator(index if by_index else tokens[index]):
+            parts.append((part_start, index))
+            part_start = index + 1
+    parts.append((part_start, end))
+    return parts
+
+
+def _text(text, tokens, start, end):
+    # The stripped text of the tokens from start to end
+    if start >= end:
+        return ""
+    return text[tokens[start].start : tokens[end - 1].end].strip()
@@ -0,0 +1,177 @@
+import os
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+import pandas as pd
+from pandas import DataFrame
+
+from who_l3_smart_tools.utils.cache import ParsedFileCache
+
+__all__ = ["DakWorkbook"]
+
+
+class DakWorkbook(Mapping):
+    """A DakWorkbook is a shared, lazily-parsed view of a DAK Excel file.
+
+    The file is opened once and each sheet is only parsed into a DataFrame the first
+    time it is accessed. Workbooks obtained through `DakWorkbook.open` are shared by
+    every generator in the process that reads the same (unchanged) file.
+
+    A DakWorkbook can be used anywhere the dictionary returned by
+    `pd.read_excel(..., sheet_name=None)` was used. The parsed DataFrames are shared,
+    so callers must treat them as read-only.
+
+    Parsed sheets are also kept in the persistent cache (see `utils.cache`), so a
+    later run on an unchanged file does not need to open the Excel file at all.
+    """
+
+    # shared workbooks keyed by (absolute path, mtime, size)
+    __open_workbooks: Dict[Tuple[str, int, int], "DakWorkbook"] = {}
+
+    def __init__(self, input_file: str, cache: Union[ParsedFileCache, None] = None):
+        self.input_file = input_file
+        self.cache = cache
+        self._excel_file: Union[pd.ExcelFile, None] = None
+        self._sheet_names: Union[List[str], None] = None
+        self._frames: Dict[str, DataFrame] = {}
+
+    @classmethod
+    def open(cls, input_file: Union[str, "DakWorkbook"]) -> "DakWorkbook":
+        """Returns the shared DakWorkbook for the given file, creating it if needed.
+
+        Args:
+            input_file (str | DakWorkbook): The path to the Excel file. If a DakWorkbook
+                is passed, it is returned unchanged.
+
+        Returns:
+            DakWorkbook: The shared workbook for the file.
+        """
+        if isinstance(input_file, DakWorkbook):
+            return input_file
+
+        path = os.path.abspath(input_file)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+
+        workbook = cls.__open_workbooks.get(key)
+        if workbook is None:
+            workbook = cls.__open_workbooks[key] = cls(
+                input_file, ParsedFileCache.for_file(path)
+            )
+
+        return workbook
+
+    @classmethod
+    def close_all(cls) -> None:
+        """Closes and forgets all shared workbooks."""
+        for workbook in cls.__open_workbooks.values():
+            workbook.close()
+        cls.__open_workbooks.clear()
+
+    @classmethod
+    def _reset_after_fork(cls) -> None:
+        # A forked process shares the position of the parent's open files, so the
+        # inherited handles are dropped and files are reopened in the child on demand.
+        # Sheets that were already parsed remain available.
+        for workbook in cls.__open_workbooks.values():
+            workbook._excel_file = None
+
+    @property
+    def excel_file(self) -> pd.ExcelFile:
+        """The underlying pandas ExcelFile, opened on first use."""
+        if self._excel_file is None:
+            self._excel_file = pd.ExcelFile(self.input_file, engine="openpyxl")
+        return self._excel_file
+
+    @property
+    def sheet_names(self) -> List[str]:
+        """The names of the sheets in the workbook, in workbook order."""
+        if self._sheet_names is None:
+            if self.cache is not None:
+                self._sheet_names = self.cache.load("sheet_names")
+            if self._sheet_names is None:
+                self._sheet_names = list(self.excel_file.sheet_names)
+                if self.cache is not None:
+                    self.cache.store("sheet_names", self._sheet_names)
+        return self._sheet_names
+
+    def iter_rows(self, sheet_name: str) -> Iterator[Tuple[Any, ...]]:
+        """Iterates over the raw cell values of a sheet, one tuple per row.
+
+        This mirrors openpyxl's `iter_rows(values_only=True)`. Rows are streamed from
+        the workbook, which is opened in read-only mode with cached formula values, so
+        only the current row is held in memory.
+        """
+        if sheet_name not in self.sheet_names:
+            raise KeyError(sheet_name)
+
+        if self.cache is None:
+            yield from self.excel_file.book[sheet_name].iter_rows(values_only=True)
+            return
+
+        def read_rows():
+            return self.excel_file.book[sheet_name].iter_rows(values_only=True)
+
+        # rows that cannot be read from the cache are read from the workbook instead
+        cache_key = f"rows:{sheet_name}"
+        rows = self.cache.load_records(cache_key, reload=read_rows)
+        if rows is None:
+            rows = self.cache.store_records(cache_key, read_rows())
+        yield from rows
+
+    def iter_records(self, sheet_name: str) -> Iterator[Dict[Any, Any]]:
+        """Iterates over the rows of a sheet as dictionaries keyed by the header row."""
+        header = None
+        for row in self.iter_rows(sheet_name):
+            # the first row is the header
+            if header is None:
+                header = row
+                continue
+            yield dict(zip(header, row))
+
+    def close(self) -> None:
+        """Closes the underlying file. Already parsed sheets remain available and the
+        file is reopened if it is needed again."""
+        if self._excel_file is not None:
+            self._excel_file.close()
+            self._excel_file = None
+
+    def __enter__(self) -> "DakWorkbook":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def __getitem__(self, sheet_name: str) -> DataFrame:
+        if sheet_name not in self._frames:
+            if sheet_name not in self.sheet_names:
+                raise KeyError(sheet_name)
+            self._frames[sheet_name] = self._parse_sheet(sheet_name)
+        return self._frames[sheet_name]
+
+    def _parse_sheet(self, sheet_name: str) -> DataFrame:
+        if self.cache is None:
+            return self.excel_file.parse(sheet_name=sheet_name)
+
+        cache_key = f"frame:{sheet_name}"
+        df = self.cache.load(cache_key)
+        if df is None:
+            df = self.excel_file.parse(sheet_name=sheet_name)
+            self.cache.store(cache_key, df)
+        return df
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.sheet_names)
+
+    def __len__(self) -> int:
+        return len(self.sheet_names)
+
+    def __contains__(self, sheet_name: object) -> bool:
+        return sheet_name in self.sheet_names
+
+    def __repr__(self) -> str:
+        return f"DakWorkbook({self.input_file!r})"
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=DakWorkbook._reset_after_fork)
@@ -6,7 +6,19 @@ from pandas import DataFrame
 import re
 import stringcase
 import sys
-from typing import Any, Callable, Dict, List, ParamSpec, Tuple, TypeVar, Union, cast
+from enum import Enum
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    ParamSpec,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
 from who_l3_smart_tools.core.models.logical_model import (
     Code,
     CodeSystem,
@@ -20,6 +32,7 @@ from who_l3_smart_tools.core.models.logical_model import (
     RequiredType,
     ValueSet,
 )
+from who_l3_smart_tools.core.parsers.dak_workbook import DakWorkbook
 from who_l3_smart_tools.utils import Counter, camel_case
 
 
@@ -27,6 +40,7 @@ __all__ = ["LogicalModelParser"]
 
 T = TypeVar("T")
 P = ParamSpec("P")
+E = TypeVar("E", bound=Enum)
 
 
 def ensure_parsed(fn: Callable[P, T]) -> Callable[P, T]:
@@ -56,7 +70,7 @@ def ensure_parsed(fn: Callable[P, T]) -> Callable[P, T]:
 
 
 class LogicalModelParser:
-    def __init__(self, input_file: str):
+    def __init__(self, input_file: Union[str, DakWorkbook]):
         self.input_file = input_file
         self.dak_name: Union[str, None] = None
         self.logical_model: Union[ImplementationGuideLogicalModel, None] = None
@@ -71,8 +85,15 @@ class LogicalModelParser:
     def parse_logical_model(self):
         """Parses the data elements from the input file into a series of DataElementRecords.
         These are used by other methods to turn into useful output."""
-        # Load the Excel file
-        dd_xls: Dict[str, DataFrame] = pd.read_excel(self.input_file, sheet_name=None)
+        # Load the Excel file; sheets are only parsed when accessed
+        dd_xls = DakWorkbook.open(self.input_file)
+
+        # An unchanged file can be restored from the persistent cache
+        if dd_xls.cache is not None:
+            cached = dd_xls.cache.load("logical-model")
+            if cached is not None:
+                self.dak_name, self.cover_info, self.logical_model = cached
+                return
 
         # Process the Cover sheet
         self.cover_info = self._process_cover(dd_xls["COVER"])
@@ -92,106 +113,76 @@ class LogicalModelParser:
             self.dak_name
         )
 
-        for sheet_name, df in dd_xls.items():
+        for sheet_name in dd_xls:
             if not sheet_name.startswith(self.dak_name + "."):
                 continue
 
+            df = dd_xls[sheet_name]
+
             # Used to track element names to ensure uniqueness
             existing_elements = defaultdict(Counter)
 
             # populates the invariant_ids and invariant_lookups
             self._process_invariants(df, logical_model)
 
+            # normalise the sheet column-wise before building the records
+            columns = self._normalize_data_elements(df)
+
             # used to track the current valueset
             current_valueset: Union[DataElementRecord, None] = None
-            for i, row in df.iterrows():
-                data_element_id = cast(Any, row["Data Element ID"])
-                if pd.isna(data_element_id):
-                    continue
-
+            for (
+                data_element_id,
+                activity_id,
+                data_element_label,
+                label_clean,
+                is_other_specify,
+                description,
+                multiple_choice_type,
+                data_type,
+                input_options,
+                quantity_subtype,
+                calculation,
+                required,
+                condition_expression,
+                decision_support_tables,
+                aggregate_indicators,
+                annotations,
+            ) in zip(*columns):
                 data_element = DataElementRecord(data_element_id)
-                data_element.activity_id = cast(str, row["Activity ID"])
-
-                data_element_label = cast(Any, row["Data Element Label"])
-                if pd.isna(data_element_label):
-                    # Pandas converts "None" to null
-                    data_element_label = "None"
+                data_element.activity_id = activity_id
 
-                data_element.data_element_label, label_clean = self._process_label(
-                    cast(str, data_element_label), current_valueset
-                )
+                # Other (specify) elements come after a list as a data element to
+                # contain a non-coded selection, so depend on the current valueset
+                if is_other_specify:
+                    label_clean = self._process_other_specify_label(current_valueset)
+                data_element.data_element_label = data_element_label
 
                 # this is only used for the logical model
                 data_element.data_element_label_camel = self._process_camel_case_label(
                     label_clean, existing_elements
                 )
-                data_element.description = (
-                    cast(str, row["Description and Definition"])
-                    .replace("*", "")
-                    .replace('"', "'")
-                )
-                multiple_choice = cast(str, row["Multiple Choice Type (if applicable)"])
-                if not pd.isna(multiple_choice):
-                    data_element.multiple_choice_type = MultipleChoiceType(
-                        cast(str, row["Multiple Choice Type (if applicable)"])
-                    )
-                data_element.data_type = cast(str, row["Data Type"])
-                # sometimes "Multiple Choice Type" is set to N/A even though there are multiple choices
-                # in these cases, we default to the assumption that the choice is one of the options
-                if (
-                    data_element.data_type == "Coding"
-                    and data_element.multiple_choice_type is None
-                ):
-                    data_element.multiple_choice_type = MultipleChoiceType.ONE_OF
-                data_element.input_options = cast(str, row["Input Options"])
-                if data_element.data_type == "Quantity":
-                    quantity_subtype = cast(Any, row["Quantity Sub-type"])
-                    if not pd.isna(quantity_subtype):
-                        data_element.quantity_subtype = QuantityType(
-                            re.sub(
-                                r"\s*Quantity",
-                                "",
-                                cast(str, quantity_subtype),
-                                flags=re.IGNORECASE,
-                            )
-                        )
-                data_element.calculation = cast(str, row["Calculation"])
-                if data_element.calculation == "N/A":
-                    data_element.calculation = None
+                data_element.description = description
+                data_element.multiple_choice_type = multiple_choice_type
+                data_element.data_type = data_type
+                data_element.input_options = input_options
+                data_element.quantity_subtype = quantity_subtype
+                data_element.calculation = calculation
 
                 if data_element_id in self.__invariant_lookup:
                     data_element.invariants += [
                         self.__invariant_lookup[data_element_id]
                     ]
 
-                required = cast(Any, row["Required"])
-                if not pd.isna(required):
-                    data_element.required = RequiredType(row["Required"])
-                    if data_element.required == RequiredType.CONDITIONAL:
-                        data_element.condition_expression = cast(
-                            str, row["Explain Conditionality"]
-                        )
-                else:
-                    # if unspecified, assume the field is optional
-                    data_element.required = RequiredType.OPTIONAL
+                data_element.required = required
+                data_element.condition_expression = condition_expression
 
-                links_to_ds_tables = cast(
-                    Any, row["Linkages to Decision Support Tables"]
-                )
-                if not pd.isna(links_to_ds_tables):
-                    data_element.decision_support_tables += cast(
-                        str, links_to_ds_tables
-                    ).split(",")
+                if decision_support_tables is not None:
+                    data_element.decision_support_tables += decision_support_tables
 
-                links_to_indicators = cast(Any, row["Linkages to Aggregate Indicators"])
-                if not pd.isna(links_to_indicators):
-                    data_element.aggregate_indicators += cast(
-                        str, links_to_indicators
-                    ).split(",")
+                if aggregate_indicators is not None:
+                    data_element.aggregate_indicators += aggregate_indicators
 
-                annotation = cast(Any, row["Annotations"])
-                if not pd.isna(annotation):
-                    data_element.annotations = cast(str, row["Annotations"])
+                data_element.annotations = annotations
 
                 if (
                     data_element.multiple_choice_type is not None
@@ -212,6 +203,11 @@ class LogicalModelParser:
                         data_element.data_element_label
                     ] = [data_element]
 
+        if dd_xls.cache is not None:
+            dd_xls.cache.store(
+                "logical-model", (self.dak_name, self.cover_info, self.logical_model)
+            )
+
     @ensure_parsed
     def generate_terminology_resources(self) -> Tuple[CodeSystem, Dict[str, ValueSet]]:
         """Generates a CodeSystem and ValueSets from the parsed DataElementRecords"""
@@ -387,42 +383,130 @@ class LogicalModelParser:
 
                 self.__invariant_lookup[data_id] = invariant
 
-    def _process_label(
-        self, label: str, current_valueset: Union[DataElementRecord, None]
-    ) -> Tuple[str, str]:
-        # Other (specify) elements come after a list as a data element to
-        # contain a non-coded selection
-        if label.lower() == "other (specify)":
-            if current_valueset and current_valueset.data_element_label:
-                label_clean = f"Other {current_valueset.data_element_label[0].upper()}{current_valueset.data_element_label[1:]}"
-            else:
-                label_clean = "Other Specify"
-        else:
-            label = (
-                label.strip()
-                .replace("*", "")
-                .replace("[", "")
-                .replace("]", "")
-                .replace('"', "'")
-            )
+    def _normalize_data_elements(self, df: DataFrame) -> List[List[Any]]:
+        """Normalises the data element columns of a data dictionary sheet over whole
+        Series at once, rather than row by row.
+
+        Returns one list per DataElementRecord field, in the order they are consumed by
+        `parse_logical_model`, covering only the rows with a data element id. Optional
+        fields that are missing in the sheet are returned as None."""
+        df = df[df["Data Element ID"].notna()].astype(object)
+
+        labels = df["Data Element Label"]
+        # Pandas converts "None" to null
+        labels = labels.where(labels.notna(), "None").astype(str)
+        is_other_specify = labels.str.lower() == "other (specify)"
+        labels, labels_clean = self._normalize_labels(labels, is_other_specify)
+
+        descriptions = (
+            df["Description and Definition"]
+            .str.replace("*", "", regex=False)
+            .str.replace('"', "'", regex=False)
+        )
 
-            # remove many special characters
-            label_clean = (
-                label.replace("(", "")
-                .replace(")", "")
-                .replace("'s", "")
-                .replace("-", "_")
-                .replace("/", "_")
-                .replace(",", "")
-                .replace(" ", "_")
-                .replace(">=", "more than")
-                .replace("<=", "less than")
-                .replace(">", "more than")
-                .replace("<", "less than")
-                .lower()
-            )
+        data_types = df["Data Type"]
+
+        multiple_choice_types = self._to_enum(
+            df["Multiple Choice Type (if applicable)"], MultipleChoiceType
+        )
+        # sometimes "Multiple Choice Type" is set to N/A even though there are multiple choices
+        # in these cases, we default to the assumption that the choice is one of the options
+        multiple_choice_types = multiple_choice_types.mask(
+            (data_types == "Coding") & multiple_choice_types.isna(),
+            MultipleChoiceType.ONE_OF,
+        )
 
-        return label, label_clean
+        quantity_subtypes = self._to_enum(
+            df["Quantity Sub-type"]
+            .where(data_types == "Quantity")
+            .str.replace(r"\s*Quantity", "", regex=True, flags=re.IGNORECASE),
+            QuantityType,
+        )
+
+        calculations = df["Calculation"].mask(df["Calculation"] == "N/A", None)
+
+        # if unspecified, assume the field is optional
+        required = self._to_enum(df["Required"], RequiredType).fillna(
+            RequiredType.OPTIONAL
+        )
+        condition_expressions = df["Explain Conditionality"].where(
+            required == RequiredType.CONDITIONAL, None
+        )
+
+        return [
+            df["Data Element ID"].tolist(),
+            df["Activity ID"].tolist(),
+            labels.tolist(),
+            labels_clean.tolist(),
+            is_other_specify.tolist(),
+            descriptions.tolist(),
+            self._to_list(multiple_choice_types),
+            data_types.tolist(),
+            df["Input Options"].tolist(),
+            self._to_list(quantity_subtypes),
+            calculations.tolist(),
+            required.tolist(),
+            condition_expressions.tolist(),
+            self._to_list(df["Linkages to Decision Support Tables"].str.split(",")),
+            self._to_list(df["Linkages to Aggregate Indicators"].str.split(",")),
+            self._to_list(df["Annotations"]),
+        ]
+
+    @staticmethod
+    def _normalize_labels(
+        labels: "pd.Series[str]", is_other_specify: "pd.Series[bool]"
+    ) -> Tuple["pd.Series[str]", "pd.Series[str]"]:
+        """Cleans up the data element labels and derives the label used to build
+        the element name. The names for "Other (specify)" elements depend on the
+        preceding valueset, so they are left for the caller to fill in."""
+        cleaned = (
+            labels.str.strip()
+            .str.replace("*", "", regex=False)
+            .str.replace("[", "", regex=False)
+            .str.replace("]", "", regex=False)
+            .str.replace('"', "'", regex=False)
+        )
+        labels = labels.mask(~is_other_specify, cleaned)
+
+        # remove many special characters
+        labels_clean = cleaned
+        for old, new in (
+            ("(", ""),
+            (")", ""),
+            ("'s", ""),
+            ("-", "_"),
+            ("/", "_"),
+            (",", ""),
+            (" ", "_"),
+            (">=", "more than"),
+            ("<=", "less than"),
+            (">", "more than"),
+            ("<", "less than"),
+        ):
+            labels_clean = labels_clean.str.replace(old, new, regex=False)
+        labels_clean = labels_clean.str.lower()
+
+        return labels, labels_clean
+
+    @staticmethod
+    def _to_enum(values: "pd.Series[Any]", enum_type: Type[E]) -> "pd.Series[Any]":
+        """Maps the non-null values of a Series to members of an Enum, constructing
+        each distinct member only once."""
+        members = {value: enum_type(value) for value in values.dropna().unique()}
+        return values.map(members).astype(object)
+
+    @staticmethod
+    def _to_list(values: "pd.Series[Any]") -> List[Any]:
+        """Converts a Series to a list, replacing missing values with None."""
+        return values.astype(object).where(values.notna(), None).tolist()
+
+    @staticmethod
+    def _process_other_specify_label(
+        current_valueset: Union[DataElementRecord, None]
+    ) -> str:
+        if current_valueset and current_valueset.data_element_label:
+            return f"Other {current_valueset.data_element_label[0].upper()}{current_valueset.data_element_label[1:]}"
+        return "Other Specify"
 
     def _process_camel_case_label(
         self, label: str, existing_elements: defaultdict[str, Counter]
@@ -1,15 +1,15 @@
 import os
 import re
-from typing import List, Union
-
-from openpyxl import load_workbook
+from typing import Any, Dict, Iterator, List, Tuple, Union
 
+from who_l3_smart_tools.core.parsers.dak_workbook import DakWorkbook
 from who_l3_smart_tools.utils import camel_case
 from who_l3_smart_tools.utils.jinja2 import (
     DATA_TYPE_MAP,
     initalize_jinja_env,
     render_to_file,
 )
+from who_l3_smart_tools.utils.manifest import BuildManifest
 
 jinja2_env = initalize_jinja_env(__name__)
 
@@ -20,7 +20,7 @@ class QuestionnaireGenerator:
     A class that generates FHIR Questionnaire resources from an Excel file.
 
     Args:
-        input_file (str): The path to the input Excel file.
+        input_file (str | DakWorkbook): The path to the input Excel file.
         output_dir (str): The directory where the generated FHIR Questionnaire
             resources will be saved.
 
@@ -30,10 +30,11 @@ class QuestionnaireGenerator:
             resources will be saved.
         _activities (dict): A dictionary to store the activities and their associated
             questionnaire items.
-        workbook: The loaded Excel workbook.
+        workbook (DakWorkbook): The shared Excel workbook.
 
     Methods:
         generate_fsh_from_excel: Generates FHIR Questionnaire resources from the Excel file.
+        iter_activity_items: Streams the questionnaire items for each activity.
         _add_items_to_activity: Adds questionnaire items to the specified activity.
 
     """
@@ -42,7 +43,7 @@ class QuestionnaireGenerator:
         self.input_file = input_file
         self.output_dir = output_dir
         self._activities = {}
-        self.workbook = load_workbook(self.input_file)
+        self.workbook = DakWorkbook.open(self.input_file)
 
     def generate_fsh_from_excel(self):
         """
@@ -59,71 +60,104 @@ class QuestionnaireGenerator:
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
-        for sheet_name in self.workbook.sheetnames:
-            if not re.match(r"HIV\.[A-Z\-]+\s", sheet_name):
-                continue
-            current_activity_id = None
-            questionnaire_items = []
-
-            sheet = self.workbook[sheet_name]
-            header = None
-            for row in sheet.iter_rows(values_only=True):
-                if header is None:
-                    header = row
-                    continue
-                row = dict(zip(header, row))
-                activity_id = row["Activity ID"]
-
-                # handle an activity change
-                if isinstance(activity_id, str) and activity_id != current_activity_id:
-                    # write out any existing activity
-                    self._add_items_to_activity(
-                        current_activity_id, questionnaire_items
-                    )
-
-                    # start a new activity
-                    current_activity_id = activity_id
-                    # NB The template gets formatted when written
-                    questionnaire_items = []
+        for activity_id, questionnaire_items in self.iter_activity_items():
+            self._add_items_to_activity(activity_id, questionnaire_items)
+
+        # unchanged questionnaires are not rewritten
+        with BuildManifest(self.output_dir) as manifest:
+            for activity_code, activity in self._activities.items():
+                _filename = os.path.join(self.output_dir, f"{activity_code}.fsh")
+                render_to_file(
+                    jinja2_env.get_template("questionnaire.fsh.j2"),
+                    activity,
+                    _filename,
+                    manifest,
+                )
+
+    def iter_activity_items(
+        self,
+    ) -> Iterator[Tuple[Union[str, None], List[Dict[str, Any]]]]:
+        """
+        Streams the questionnaire items from the workbook, one activity at a time.
 
-                data_type = row["Data Type"]
+        Rows are read from the workbook as they are needed, so only the items of the
+        current activity are held in memory. The workbook file is closed once all
+        sheets have been read.
 
-                # we only want questions on the questionnaires
-                if data_type == "Codes":
+        Yields:
+            tuple: The activity ID (which may be None for items preceding the first
+                activity in a sheet) and the questionnaire items for that activity.
+        """
+        try:
+            for sheet_name in self.workbook.sheet_names:
+                if not re.match(r"HIV\.[A-Z\-]+\s", sheet_name):
                     continue
+                current_activity_id = None
+                questionnaire_items = []
+
+                for row in self.workbook.iter_records(sheet_name):
+                    activity_id = row["Activity ID"]
+
+                    # handle an activity change
+                    if (
+                        isinstance(activity_id, str)
+                        and activity_id != current_activity_id
+                    ):
+                        # emit any existing activity
+                        yield current_activity_id, questionnaire_items
+
+                        # start a new activity
+                        current_activity_id = activity_id
+                        # NB The template gets formatted when written
+                        questionnaire_items = []
+
+                    questionnaire_item = self._questionnaire_item(row)
+                    if questionnaire_item is not None:
+                        questionnaire_items.append(questionnaire_item)
+
+                yield current_activity_id, questionnaire_items
+        finally:
+            self.workbook.close()
+
+    @staticmethod
+    def _questionnaire_item(row: Dict[str, Any]) -> Union[Dict[str, Any], None]:
+        """
+        Converts a data dictionary row into a questionnaire item.
 
-                data_element_id = row["Data Element ID"]
-
-                if not isinstance(data_element_id, str) or not data_element_id:
-                    continue
+        Args:
+            row (dict): The data dictionary row.
 
-                questionnaire_item = {
-                    "data_element_id": data_element_id,
-                    "data_element_label": str(row["Data Element Label"])
-                    .replace("*", "")
-                    .replace("[", "")
-                    .replace("]", "")
-                    .replace('"', "'")
-                    .strip(),
-                    "data_type": DATA_TYPE_MAP[data_type],
-                    "required": "true" if str(row["Required"]) == "R" else "false",
-                }
-
-                # coded answers should be bound to a dataset
-                if data_type == "Coding":
-                    questionnaire_item["has_valueset"] = True
-
-                questionnaire_items.append(questionnaire_item)
-
-            self._add_items_to_activity(current_activity_id, questionnaire_items)
-
-        for activity_code, activity in self._activities.items():
-            _filename = os.path.join(self.output_dir, f"{activity_code}.fsh")
-            render_to_file(
-                jinja2_env.get_template("questionnaire.fsh.j2"),
-                activity,
-                _filename,
-            )
+        Returns:
+            dict or None: The questionnaire item, or None if the row is not a question.
+        """
+        data_type = row["Data Type"]
+
+        # we only want questions on the questionnaires
+        if data_type == "Codes":
+            return None
+
+        data_element_id = row["Data Element ID"]
+
+        if not isinstance(data_element_id, str) or not data_element_id:
+            return None
+
+        questionnaire_item = {
+            "data_element_id": data_element_id,
+            "data_element_label": str(row["Data Element Label"])
+            .replace("*", "")
+            .replace("[", "")
+            .replace("]", "")
+            .replace('"', "'")
+            .strip(),
+            "data_type": DATA_TYPE_MAP[data_type],
+            "required": "true" if str(row["Required"]) == "R" else "false",
+        }
+
+        # coded answers should be bound to a dataset
+        if data_type == "Coding":
+            questionnaire_item["has_valueset"] = True
+
+        return questionnaire_item
 
     def _add_items_to_activity(
         self, current_activity_id: Union[str, None], questionnaire_items: List[str]
@@ -1,8 +1,10 @@
 import re
-from typing import Union
-import pandas as pd
+from typing import Any, Iterator, List, Tuple
 import os
+from pandas import DataFrame
+from who_l3_smart_tools.core.parsers.dak_workbook import DakWorkbook
 from who_l3_smart_tools.utils import camel_case
+from who_l3_smart_tools.utils.manifest import BuildManifest, hash_inputs
 
 
 requirement_template = """Instance: {id}
@@ -37,68 +39,112 @@ non_functional_requirement_item_template = """
 
 
 class RequirementGenerator:
-    def __init__(self, input_file, output_dir):
+    """
+    Generates FHIR Requirements resources from a functional and non-functional
+    requirements Excel file.
+
+    Args:
+        input_file (str | DakWorkbook): The path to the input Excel file.
+        output_dir (str): The directory where the generated FSH files will be saved.
+        writer (optional): The writer the FSH files are written through. This is any
+            object with a `write(output_file, content, input_hash)` method, e.g. to
+            capture the output in memory. Defaults to a BuildManifest for the output
+            directory, so unchanged files are not rewritten.
+    """
+
+    def __init__(self, input_file, output_dir, writer=None):
         self.input_file = input_file
         self.output_dir = output_dir
+        self.writer = writer
 
     def generate_fsh_from_excel(self):
+        if self.writer is not None:
+            self._write_requirements(self.writer)
+            return
+
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
-        # Load the Excel file
-        dd_xls = pd.read_excel(self.input_file, sheet_name=None)
-        fileName = None
-        for sheet_name in dd_xls.keys():
+        # unchanged requirements are not rewritten
+        with BuildManifest(self.output_dir) as manifest:
+            self._write_requirements(manifest)
 
-            if sheet_name == "Functional":
+    def _write_requirements(self, writer):
+        for file, requirements, input_hash in self.iter_requirements():
+            writer.write(
+                os.path.join(self.output_dir, f"{file}.fsh"), requirements, input_hash
+            )
+
+    def iter_requirements(self) -> Iterator[Tuple[str, str, str]]:
+        """
+        Streams the requirements from the input file, one activity at a time.
 
-                df = dd_xls[sheet_name]
-                current_requirement_template = ""
-
-                for i, row in df.iterrows():
-                    requirement_id = str(row["Requirement ID"])
-                    description = row["Activity ID and Description"]
-                    if not isinstance(description, str):
-                        element_id, title = requirement_id.split(" ", 1)
-                        fileName = element_id.rstrip(".")
-                        current_requirement_template = requirement_template.format(
-                            id=requirement_id.replace(" ", ""), title=title
-                        )
-
-                    if isinstance(description, str):
-                        current_requirement_template += (
-                            functional_requirement_item_template.format(
-                                data_element_id=requirement_id,
-                                actor=row["As a…"],
-                                action=str(row["I want…"]).strip("…").strip("..."),
-                                reason=str(row["So that…"]).strip("…").strip("..."),
-                            )
-                        )
-
-                        self._write_current_activity(
-                            fileName, current_requirement_template
-                        )
+        The statements of each activity are accumulated and emitted once the activity
+        is complete. Activities without any statements are not emitted.
 
+        Yields:
+            tuple: The name of the file, the FSH for the activity and a hash of the
+                rows it was generated from.
+        """
+        # Load the Excel file
+        dd_xls = DakWorkbook.open(self.input_file)
+        for sheet_name in dd_xls.keys():
+            if sheet_name == "Functional":
+                yield from self._iter_functional_requirements(dd_xls[sheet_name])
             elif sheet_name == "Non-functional":
-                fileName = "HIV.Non_Functional"
-                df = dd_xls[sheet_name]
-                current_requirement_template = non_functional_requirement_template
-                for i, row in df.iterrows():
-                    requirement_id = row["Requirement ID"]
-                    category = row["Category"]
-                    action = row["Non-Functional Requirement"]
-                    current_requirement_template += (
-                        non_functional_requirement_item_template.format(
-                            data_element_id=requirement_id,
-                            category=category,
-                            action=action,
-                        )
+                yield self._non_functional_requirements(dd_xls[sheet_name])
+
+    def _iter_functional_requirements(
+        self, df: DataFrame
+    ) -> Iterator[Tuple[str, str, str]]:
+        fileName = None
+        statements: List[str] = []
+        rows: List[Tuple[Any, ...]] = []
+
+        for _, row in df.iterrows():
+            requirement_id = str(row["Requirement ID"])
+            description = row["Activity ID and Description"]
+            if not isinstance(description, str):
+                # emit the previous activity
+                if fileName is not None and len(statements) > 1:
+                    yield fileName, "".join(statements), hash_inputs(rows)
+
+                element_id, title = requirement_id.split(" ", 1)
+                fileName = element_id.rstrip(".")
+                statements = [
+                    requirement_template.format(
+                        id=requirement_id.replace(" ", ""), title=title
                     )
-                self._write_current_activity(fileName, current_requirement_template)
-
-    def _write_current_activity(
-        self, file: Union[str, None], current_requirement_template: str
-    ):
-        if file is not None:
-            with open(os.path.join(self.output_dir, f"{file}.fsh"), "w") as f:
-                f.write(current_requirement_template)
+                ]
+                rows = [tuple(row)]
+                continue
+
+            statements.append(
+                functional_requirement_item_template.format(
+                    data_element_id=requirement_id,
+                    actor=row["As a…"],
+                    action=str(row["I want…"]).strip("…").strip("..."),
+                    reason=str(row["So that…"]).strip("…").strip("..."),
+                )
+            )
+            rows.append(tuple(row))
+
+        # requirements that precede the first activity are not written
+        if fileName is not None and len(statements) > 1:
+            yield fileName, "".join(statements), hash_inputs(rows)
+
+    def _non_functional_requirements(self, df: DataFrame) -> Tuple[str, str, str]:
+        statements = [non_functional_requirement_template]
+        rows: List[Tuple[Any, ...]] = []
+
+        for _, row in df.iterrows():
+            statements.append(
+                non_functional_requirement_item_template.format(
+                    data_element_id=row["Requirement ID"],
+                    category=row["Category"],
+                    action=row["Non-Functional Requirement"],
+                )
+            )
+            rows.append(tuple(row))
+
+        return "HIV.Non_Functional", "".join(statements), hash_inputs(rows)
@@ -1,9 +1,8 @@
 import csv
 import json
-from typing import Optional, Union
-
-from openpyxl import load_workbook
+from typing import Iterator, Optional, Union
 
+from who_l3_smart_tools.core.parsers.dak_workbook import DakWorkbook
 from who_l3_smart_tools.core.terminology.schema import ConceptSchema
 
 
@@ -195,14 +194,15 @@ class ConceptResourceGenerator:
         sheet_name_prefix (str): The prefix of the sheet names to process.
         extra_args (dict): Extra arguments for concept generation.
         valueset (Any): The current valueset being processed.
-        valuesets (list): The list of valuesets collected.
-        rows (list): The list of ConceptRow objects.
+        valuesets (list): The list of valuesets collected, read on first access
+            unless the rows have already been read.
+        rows (list): The list of ConceptRow objects, read on first access.
 
     Methods:
         collect_value_sets(row: dict) -> None:
             Collects value sets from the rows.
-        _convert_rows() -> None:
-            Converts the rows from the data files into ConceptRow objects.
+        iter_rows() -> Iterator[ConceptRow]:
+            Streams the rows from the data files as ConceptRow objects.
         _format_csv_extras(key: dict) -> dict:
             Formats the extras for CSV output.
         _expand_objects_for_csv(key, obj: dict) -> dict:
@@ -231,10 +231,45 @@ class ConceptResourceGenerator:
             "concept_class": "Misc",
         }
         self.valueset = None
-        self.valuesets = []
 
-        self.rows = []
-        self._convert_rows()
+        self._rows: Optional[list[ConceptRow]] = None
+        self._valuesets: Optional[list] = None
+        self._collected_valuesets: list = []
+
+        # the file is only read when the rows are, but a missing file fails here
+        DakWorkbook.open(file)
+
+    @property
+    def rows(self) -> list[ConceptRow]:
+        """
+        The ConceptRow objects for every row in the data file.
+
+        Accessing this property reads the whole file into memory; use `iter_rows`
+        to stream the rows instead.
+
+        Returns:
+            list: The list of ConceptRow objects.
+        """
+        if self._rows is None:
+            self._rows = list(self.iter_rows())
+        return self._rows
+
+    @property
+    def valuesets(self) -> list:
+        """
+        The valuesets collected from the rows of the data file.
+
+        The valuesets are collected while the rows are read, see `iter_rows`.
+        Accessing this property before all rows have been read reads the whole
+        file, without keeping the rows in memory.
+
+        Returns:
+            list: The list of valuesets.
+        """
+        if self._valuesets is None:
+            for _ in self.iter_rows():
+                pass
+        return self._valuesets
 
     def collect_value_sets(self, row: dict) -> None:
         """
@@ -248,39 +283,46 @@ class ConceptResourceGenerator:
             None
         """
         if self.valueset and row.converted_row["datatype"].lower() != "codes":
-            self.valuesets.append(self.valueset)
+            self._collected_valuesets.append(self.valueset)
             self.valueset = row.value_set
         if not self.valueset:
             self.valueset = row.value_set
 
-    def _convert_rows(self) -> None:
+    def iter_rows(self) -> Iterator[ConceptRow]:
         """
-        Converts the rows from the data files into ConceptRow objects and
-        appends them to the rows list. Also collects value sets from the rows.
+        Streams the rows from the data files as ConceptRow objects, collecting
+        value sets from the rows as they are read.
+
+        The data file is read in read-only mode, so only the current row is held
+        in memory, and is closed once all rows have been read.
 
         Returns:
-            None
+            Iterator[ConceptRow]: The ConceptRow objects.
         """
-        workbook = load_workbook(self.file)
-        for sheet_name in workbook.sheetnames:
-            if not sheet_name.startswith(self.sheet_name_prefix):
-                continue
-            sheet = workbook[sheet_name]
-            header: Optional[list[str]] = None
-            for row in sheet.iter_rows(values_only=True):
-                # if header is None. Set the current row as the header and skip to the next row.
-                if header is None:
-                    header = row
+        if self._rows is not None:
+            yield from self._rows
+            return
+
+        self.valueset = None
+        self._collected_valuesets = []
+
+        workbook = DakWorkbook.open(self.file)
+        try:
+            for sheet_name in workbook.sheet_names:
+                if not sheet_name.startswith(self.sheet_name_prefix):
                     continue
-                row_as_dict = dict(zip(header, row))
-                concept_row = ConceptRow(
-                    row_as_dict,
-                    self.schema,
-                    self.valueset,
-                    **self.extra_args,
-                )
-                self.rows.append(concept_row)
-                self.collect_value_sets(concept_row)
+                for row_as_dict in workbook.iter_records(sheet_name):
+                    concept_row = ConceptRow(
+                        row_as_dict,
+                        self.schema,
+                        self.valueset,
+                        **self.extra_args,
+                    )
+                    self.collect_value_sets(concept_row)
+                    yield concept_row
+            self._valuesets = self._collected_valuesets
+        finally:
+            workbook.close()
 
     def _format_csv_extras(self, key: dict) -> dict:
         """
@@ -321,10 +363,8 @@ class ConceptResourceGenerator:
             None
         """
         with open(path, "w", encoding="utf-8") as output_file:
-            if not self.rows:
-                return
             writer = None
-            for row in self.rows:
+            for row in self.iter_rows():
                 csv_row = {}
                 for key, value in row.converted_row.items():
                     if key == "extras":
@@ -353,8 +393,16 @@ class ConceptResourceGenerator:
             None
         """
         with open(path, "w", encoding="utf-8") as output_file:
-            json.dump(
-                [row.converted_row for row in self.rows],
-                output_file,
-                indent=2,
-            )
+            # rows are written as they are read, matching the layout of
+            # json.dump(rows, indent=2)
+            output_file.write("[")
+            separator = "\n  "
+            for row in self.iter_rows():
+                output_file.write(separator)
+                output_file.write(
+                    json.dumps(row.converted_row, indent=2).replace("\n", "\n  ")
+                )
+                separator = ",\n  "
+            if separator != "\n  ":
+                output_file.write("\n")
+            output_file.write("]")
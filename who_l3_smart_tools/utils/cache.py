@@ -0,0 +1,309 @@
+"""
+A persistent on-disk cache for data parsed from input files.
+
+Entries are stored under a directory named for the SHA-256 of the input file and the
+code of the parsers, see `code_version`, so any change to the file or the parsers
+results in a fresh set of entries. The cache directory defaults to
+`$XDG_CACHE_HOME/who_l3_smart_tools` (usually `~/.cache/who_l3_smart_tools`) and can be
+changed with the `WHO_L3_SMART_TOOLS_CACHE_DIR` environment variable or `set_cache_dir`.
+Setting the environment variable to an empty string disables the cache.
+"""
+
+import functools
+import glob
+import hashlib
+import importlib.util
+import itertools
+import os
+import pickle
+import sys
+import tempfile
+from typing import Any, Callable, Iterable, Iterator, Union
+
+__all__ = [
+    "CACHE_DIR_ENV",
+    "ParsedFileCache",
+    "code_version",
+    "default_cache_dir",
+    "file_sha256",
+    "get_cache_dir",
+    "set_cache_dir",
+]
+
+CACHE_DIR_ENV = "WHO_L3_SMART_TOOLS_CACHE_DIR"
+
+# bump this whenever the layout of the cache itself changes
+CACHE_VERSION = "3"
+
+# The packages whose code produces the cached objects, see code_version
+CACHED_PACKAGES = (
+    "who_l3_smart_tools.core.models",
+    "who_l3_smart_tools.core.parsers",
+)
+
+_UNSET = object()
+_cache_dir: Any = _UNSET
+
+
+def default_cache_dir() -> str:
+    """
+    Returns the default cache directory, honouring XDG_CACHE_HOME.
+
+    Returns:
+        str: The default cache directory.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "who_l3_smart_tools")
+
+
+def get_cache_dir() -> Union[str, None]:
+    """
+    Returns the configured cache directory, or None if caching is disabled.
+
+    Returns:
+        str | None: The cache directory.
+    """
+    if _cache_dir is not _UNSET:
+        return _cache_dir
+
+    configured = os.environ.get(CACHE_DIR_ENV)
+    if configured is None:
+        return default_cache_dir()
+    return configured or None
+
+
+def set_cache_dir(cache_dir: Union[str, None]) -> None:
+    """
+    Sets the cache directory for this process. Passing None disables the cache.
+
+    Args:
+        cache_dir (str | None): The cache directory.
+    """
+    global _cache_dir  # pylint: disable=global-statement
+    _cache_dir = cache_dir
+
+
+@functools.lru_cache(maxsize=None)
+def code_version() -> str:
+    """
+    Computes a digest of the source of the packages that produce the cached objects,
+    so entries written before a change to the parsers or models are not reused.
+
+    Returns:
+        str: The hex digest of the sources.
+    """
+    digest = hashlib.sha256(CACHE_VERSION.encode("utf-8"))
+    for package in CACHED_PACKAGES:
+        for directory in importlib.util.find_spec(package).submodule_search_locations:
+            for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+                digest.update(os.path.basename(path).encode("utf-8"))
+                digest.update(file_sha256(path).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    """
+    Computes the SHA-256 of a file's contents.
+
+    Args:
+        path (str): The path to the file.
+
+    Returns:
+        str: The hex digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParsedFileCache:
+    """
+    Stores objects parsed from a single input file, keyed by the file's SHA-256.
+
+    Args:
+        input_file (str): The file the cached objects were parsed from.
+        cache_dir (str): The root cache directory.
+
+    Attributes:
+        input_file (str): The file the cached objects were parsed from.
+        sha256 (str): The SHA-256 of the input file.
+        directory (str): The directory holding entries for this file.
+    """
+
+    def __init__(self, input_file: str, cache_dir: str):
+        self.input_file = input_file
+        self.sha256 = file_sha256(input_file)
+        self.directory = os.path.join(
+            cache_dir,
+            f"v{CACHE_VERSION}",
+            code_version()[:16],
+            self.sha256[:2],
+            self.sha256,
+        )
+
+    @classmethod
+    def for_file(
+        cls, input_file: str, cache_dir: Any = _UNSET
+    ) -> Union["ParsedFileCache", None]:
+        """
+        Returns a cache for the given file, or None if caching is disabled.
+
+        Args:
+            input_file (str): The file the cached objects are parsed from.
+            cache_dir (str | None, optional): The root cache directory. Defaults to
+                the configured cache directory.
+        """
+        if cache_dir is _UNSET:
+            cache_dir = get_cache_dir()
+        if not cache_dir:
+            return None
+        return cls(input_file, cache_dir)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(
+            self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".pkl"
+        )
+
+    def load(self, key: str, default: Any = None) -> Any:
+        """
+        Loads a cached object.
+
+        Args:
+            key (str): The key the object was stored under.
+            default (Any, optional): Returned if the object is not cached.
+
+        Returns:
+            Any: The cached object, or the default.
+        """
+        try:
+            with open(self._path(key), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return default
+        except Exception:  # pylint: disable=broad-exception-caught
+            # entries written by an incompatible version are treated as misses
+            return default
+
+    def store(self, key: str, value: Any) -> None:
+        """
+        Stores an object in the cache. Failures to write are reported but not raised.
+
+        Args:
+            key (str): The key to store the object under.
+            value (Any): The object to store.
+        """
+        with self._writer(key) as f:
+            if f is not None:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load_records(
+        self, key: str, reload: Union[Callable[[], Iterable[Any]], None] = None
+    ) -> Union[Iterator[Any], None]:
+        """
+        Streams records stored with `store_records`, one at a time.
+
+        An entry that cannot be read, e.g. one written by an incompatible version, is
+        treated as a miss even once some of its records have been streamed: it is
+        discarded, and the remaining records are read from `reload` and stored again.
+
+        Args:
+            key (str): The key the records were stored under.
+            reload (callable, optional): Returns all the records afresh. Without it,
+                the error reading the entry is raised once it has been discarded.
+
+        Returns:
+            Iterator | None: An iterator over the records, or None if not cached.
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        def records():
+            count = 0
+            with open(path, "rb") as f:
+                while True:
+                    try:
+                        record = pickle.load(f)
+                    except EOFError:
+                        return
+                    except Exception as e:  # pylint: disable=broad-exception-caught
+                        error = e
+                        break
+                    count += 1
+                    yield record
+
+            self.discard(key)
+            if reload is None:
+                raise error
+            # the records already streamed from the entry are skipped
+            yield from itertools.islice(self.store_records(key, reload()), count, None)
+
+        return records()
+
+    def store_records(self, key: str, records: Iterable[Any]) -> Iterator[Any]:
+        """
+        Passes records through while streaming them into the cache. The entry is only
+        committed once the records have been fully consumed.
+
+        Args:
+            key (str): The key to store the records under.
+            records (Iterable): The records to store.
+
+        Returns:
+            Iterator: The records.
+        """
+        with self._writer(key) as f:
+            for record in records:
+                if f is not None:
+                    pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+                yield record
+
+    def discard(self, key: str) -> None:
+        """
+        Removes an entry from the cache, if it is there.
+
+        Args:
+            key (str): The key the entry was stored under.
+        """
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def _writer(self, key: str) -> "_AtomicWriter":
+        return _AtomicWriter(self._path(key))
+
+
+class _AtomicWriter:
+    """Context manager writing to a temporary file that replaces `path` on success."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, self.tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.path), suffix=".tmp"
+            )
+            self.file = os.fdopen(fd, "wb")
+        except OSError as e:
+            print(f"Could not write to cache {self.path}: {e}", file=sys.stderr)
+            self.file = None
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.file is None:
+            return False
+
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.unlink(self.tmp_path)
+        return False
@@ -3,6 +3,10 @@ import re
 import pandas as pd
 import stringcase
 
+from who_l3_smart_tools.core.parsers.calculation_parser import (
+    parse_calculation_expression,
+)
+
 # Measure Profiles from http://hl7.org/fhir/us/cqfmeasures/STU4/index.html
 measure_instance = {
     "proportion": "http://hl7.org/fhir/us/cqfmeasures/StructureDefinition/proportion-measure-cqfm",
@@ -128,11 +132,12 @@ def create_cql_concept_dictionaries(dd_xls: dict, dak_name: str):
 
 
 def determine_scoring_suggestion(denominator_val: str):
-    # Determine Scoring Type and set proper values
+    # Determine Scoring Type and set proper values. A denominator of 1 (a constant
+    # calculation) is a continuous variable.
     if (
         not denominator_val
-        or denominator_val.strip() == "1"
         or denominator_val.strip() == ""
+        or parse_calculation_expression(denominator_val).is_constant
     ):
         scoring = "continuous-variable"
         scoring_title = stringcase.titlecase(scoring)
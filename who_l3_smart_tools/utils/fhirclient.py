@@ -1,6 +1,27 @@
+import asyncio
+import bisect
 import json
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Set, Union
 
+import aiohttp
+import requests
 from fhirpy import SyncFHIRClient
+from requests.adapters import HTTPAdapter
+
+__all__ = [
+    "AsyncFhirUploader",
+    "FhirUploader",
+    "UploadFailure",
+    "UploadReport",
+    "send_to_fhir_server",
+]
+
+# responses that are worth retrying
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
 
 
 def send_to_fhir_server(bundle, fhir_server_url):
@@ -27,3 +48,459 @@ def send_to_fhir_server(bundle, fhir_server_url):
         print("Transaction bundle sent successfully to the FHIR server.")
     except Exception as e:  # pylint: disable=broad-except
         print(f"Failed to send transaction bundle to the FHIR server: {e}")
+
+
+class UploadFailure(NamedTuple):
+    """
+    A bundle, or an entry of a batch bundle, that could not be uploaded.
+
+    Attributes:
+        bundles (list[int]): The indices of the bundles passed to `FhirUploader.add`
+            that were part of the failed upload. For a failed entry of a batch, this
+            is only the bundle the entry came from.
+        status (int | None): The HTTP status of the failure, if there was a response.
+        message (str): A description of the failure.
+    """
+
+    bundles: List[int]
+    status: Union[int, None]
+    message: str
+
+
+class UploadReport:
+    """
+    A summary of the bundles uploaded by a FhirUploader.
+
+    Attributes:
+        requests (int): The number of bundles sent to the server.
+        entries (int): The number of entries that were uploaded successfully.
+        failures (list[UploadFailure]): The uploads that failed.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.entries = 0
+        self.failures: List[UploadFailure] = []
+
+    def __str__(self):
+        return (
+            f"Uploaded {self.entries} entries in {self.requests} bundles, "
+            f"{len(self.failures)} failures"
+        )
+
+
+class _Chunk:
+    """The entries of several input bundles, coalesced into a single upload."""
+
+    def __init__(self):
+        self.bundles: List[int] = []
+        # the position of the first entry of each bundle
+        self.offsets: List[int] = []
+        self.entries: List[str] = []
+        self.size = 0
+
+    def bundle_of(self, entry_index: int) -> int:
+        """Returns the index of the bundle an entry of the upload came from."""
+        return self.bundles[bisect.bisect_right(self.offsets, entry_index) - 1]
+
+
+# pylint: disable=too-many-instance-attributes
+class _BaseFhirUploader:
+    """Coalesces bundles into uploads and records their results. Subclasses send the
+    uploads."""
+
+    headers = {
+        "Content-Type": "application/fhir+json",
+        "Accept": "application/fhir+json",
+    }
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        fhir_server_url: str,
+        bundle_type: str = "transaction",
+        max_entries: int = 500,
+        max_bytes: int = 5 * 1024 * 1024,
+        max_workers: int = 4,
+        retries: int = 3,
+        backoff: float = 1.0,
+        timeout: float = 120,
+    ):
+        if bundle_type not in ("transaction", "batch"):
+            raise ValueError(f"Unsupported bundle type: {bundle_type}")
+
+        self.fhir_server_url = fhir_server_url
+        self.bundle_type = bundle_type
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.report = UploadReport()
+
+        self._chunk = _Chunk()
+        self._count = 0
+
+    def _queue(self, bundle: Any) -> Union[_Chunk, None]:
+        """Adds a bundle to the current upload. Returns the previous upload if it is
+        full and needs to be sent."""
+        index = self._count
+        self._count += 1
+
+        entries = [self._entry_json(entry) for entry in self._entries(bundle)]
+        size = sum(len(entry) + 1 for entry in entries)
+
+        full = None
+        if self._chunk.entries and (
+            len(self._chunk.entries) + len(entries) > self.max_entries
+            or self._chunk.size + size > self.max_bytes
+        ):
+            full = self._take()
+
+        chunk = self._chunk
+        chunk.bundles.append(index)
+        chunk.offsets.append(len(chunk.entries))
+        chunk.entries.extend(entries)
+        chunk.size += size
+        return full
+
+    def _take(self) -> Union[_Chunk, None]:
+        """Takes the current upload, if it has any entries."""
+        chunk, self._chunk = self._chunk, _Chunk()
+        return chunk if chunk.entries else None
+
+    @staticmethod
+    def _entries(bundle: Any) -> List[Any]:
+        if isinstance(bundle, dict):
+            return bundle.get("entry") or []
+        return bundle.entry or []
+
+    @staticmethod
+    def _entry_json(entry: Any) -> str:
+        if isinstance(entry, dict):
+            return json.dumps(entry, default=str)
+        return entry.json()
+
+    def _body(self, chunk: _Chunk) -> bytes:
+        # the entries are already serialized, so the bundle is assembled as text
+        return (
+            f'{{"resourceType":"Bundle","type":"{self.bundle_type}","entry":['
+            + ",".join(chunk.entries)
+            + "]}"
+        ).encode("utf-8")
+
+    def _retry_delay(self, attempt: int, retry_after: Union[str, None]) -> float:
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** (attempt - 1)
+
+    def _record_success(
+        self, chunk: _Chunk, response: Union[Dict[str, Any], None]
+    ) -> None:
+        failures = []
+        succeeded = len(chunk.entries)
+
+        # entries of a batch succeed or fail independently
+        if self.bundle_type == "batch" and response:
+            # the response has an entry for each entry of the request, in order
+            for entry_index, entry in enumerate(response.get("entry", [])):
+                entry_response = entry.get("response", {})
+                status = self._parse_status(entry_response.get("status", ""))
+                if status is not None and status >= 400:
+                    succeeded -= 1
+                    failures.append(
+                        UploadFailure(
+                            [chunk.bundle_of(entry_index)],
+                            status,
+                            self._describe_outcome(entry_response.get("outcome"))
+                            or entry_response.get("status", ""),
+                        )
+                    )
+
+        self.report.requests += 1
+        self.report.entries += succeeded
+        self.report.failures.extend(failures)
+
+    def _record_failure(self, failure: UploadFailure) -> None:
+        print(
+            f"Failed to upload bundles {failure.bundles[0]}-{failure.bundles[-1]} "
+            f"to the FHIR server: {failure.message}",
+            file=sys.stderr,
+        )
+        self.report.requests += 1
+        self.report.failures.append(failure)
+
+    @staticmethod
+    def _parse_status(status: str) -> Union[int, None]:
+        # entry statuses start with the HTTP status code, e.g. "201 Created"
+        code = status.split(" ", 1)[0]
+        return int(code) if code.isdigit() else None
+
+    @classmethod
+    def _describe_error(
+        cls, status: int, reason: str, response: Union[Dict[str, Any], None]
+    ) -> str:
+        return cls._describe_outcome(response) or f"{status} {reason}"
+
+    @staticmethod
+    def _describe_outcome(outcome: Union[Dict[str, Any], None]) -> str:
+        if not outcome or outcome.get("resourceType") != "OperationOutcome":
+            return ""
+        return "; ".join(
+            issue.get("diagnostics") or issue.get("details", {}).get("text", "")
+            for issue in outcome.get("issue", [])
+        )
+
+
+class FhirUploader(_BaseFhirUploader):
+    """
+    Uploads bundles to a FHIR server in size-bounded transaction or batch bundles.
+
+    Bundles passed to `add` are coalesced into larger bundles, without splitting any
+    of them, and sent by a pool of workers sharing a single HTTP connection pool.
+    Requests that fail with a transient error are retried with exponential backoff.
+    Call `close` (or use the uploader as a context manager) to send any remaining
+    entries and wait for the uploads to complete.
+
+    Args:
+        fhir_server_url (str): The base URL of the FHIR server.
+        bundle_type (str, optional): The type of the uploaded bundles, "transaction"
+            or "batch". Defaults to "transaction".
+        max_entries (int, optional): The maximum number of entries per uploaded
+            bundle. Defaults to 500.
+        max_bytes (int, optional): The maximum size of an uploaded bundle. A single
+            bundle larger than this is uploaded on its own. Defaults to 5 MiB.
+        max_workers (int, optional): The maximum number of concurrent uploads.
+            Defaults to 4.
+        retries (int, optional): The number of times a failed upload is retried.
+            Defaults to 3.
+        backoff (float, optional): The delay before the first retry, in seconds.
+            It doubles for every subsequent retry. Defaults to 1.0.
+        timeout (float, optional): The timeout for each request, in seconds.
+            Defaults to 120.
+        session (requests.Session, optional): The session used for the requests.
+
+    Attributes:
+        report (UploadReport): The results of the uploads so far.
+    """
+
+    def __init__(self, fhir_server_url: str, session=None, **kwargs):
+        super().__init__(fhir_server_url, **kwargs)
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+        self.__executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        # bounds the number of uploads held in memory
+        self.__pending = threading.BoundedSemaphore(2 * self.max_workers)
+        self.__futures: List[Future] = []
+        self.__lock = threading.Lock()
+
+    def add(self, bundle: Any) -> None:
+        """
+        Queues a bundle for upload.
+
+        Args:
+            bundle (Bundle | dict): The bundle to upload.
+        """
+        chunk = self._queue(bundle)
+        if chunk is not None:
+            self._submit(chunk)
+
+    def flush(self) -> None:
+        """
+        Sends the entries queued so far, without waiting for the upload to complete.
+        """
+        chunk = self._take()
+        if chunk is not None:
+            self._submit(chunk)
+
+    def close(self) -> UploadReport:
+        """
+        Sends any remaining entries and waits for all uploads to complete.
+
+        Returns:
+            UploadReport: The results of the uploads.
+        """
+        self.flush()
+        for future in self.__futures:
+            future.result()
+        self.__futures.clear()
+        self.__executor.shutdown()
+        return self.report
+
+    def __enter__(self) -> "FhirUploader":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def _submit(self, chunk: _Chunk) -> None:
+        self.__pending.acquire()
+        future = self.__executor.submit(self._upload, chunk)
+        future.add_done_callback(lambda _: self.__pending.release())
+        self.__futures.append(future)
+
+    def _upload(self, chunk: _Chunk) -> None:
+        body = self._body(chunk)
+
+        status, message, retry_after = None, "", None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self._retry_delay(attempt, retry_after))
+
+            try:
+                response = self.session.post(
+                    self.fhir_server_url,
+                    data=body,
+                    headers=self.headers,
+                    timeout=self.timeout,
+                )
+            except requests.RequestException as e:
+                status, message, retry_after = None, str(e), None
+                continue
+
+            status = response.status_code
+            try:
+                response_json = response.json()
+            except ValueError:
+                response_json = None
+
+            if status < 400:
+                with self.__lock:
+                    self._record_success(chunk, response_json)
+                return
+
+            message = self._describe_error(status, response.reason, response_json)
+            retry_after = response.headers.get("Retry-After")
+            if status not in RETRY_STATUSES:
+                break
+
+        with self.__lock:
+            self._record_failure(UploadFailure(chunk.bundles, status, message))
+
+
+class AsyncFhirUploader(_BaseFhirUploader):
+    """
+    The asyncio counterpart of `FhirUploader`, sending uploads with aiohttp.
+
+    Bundles passed to `add` are coalesced in the same way and up to `max_workers`
+    uploads are in flight at once; `add` waits while that many are pending. Call
+    `close` (or use the uploader as an async context manager) to send any remaining
+    entries and wait for the uploads to complete.
+
+    Args:
+        fhir_server_url (str): The base URL of the FHIR server.
+        session (aiohttp.ClientSession, optional): The session used for the
+            requests. Defaults to a new session, closed by `close`.
+        **kwargs: The options accepted by `FhirUploader`.
+
+    Attributes:
+        report (UploadReport): The results of the uploads so far.
+    """
+
+    def __init__(self, fhir_server_url: str, session=None, **kwargs):
+        super().__init__(fhir_server_url, **kwargs)
+        self.session = session
+        self.__owns_session = session is None
+        self.__pending: Union[asyncio.Semaphore, None] = None
+        self.__tasks: Set[asyncio.Task] = set()
+
+    async def add(self, bundle: Any) -> None:
+        """
+        Queues a bundle for upload.
+
+        Args:
+            bundle (Bundle | dict): The bundle to upload.
+        """
+        chunk = self._queue(bundle)
+        if chunk is not None:
+            await self._submit(chunk)
+
+    async def flush(self) -> None:
+        """
+        Sends the entries queued so far, without waiting for the upload to complete.
+        """
+        chunk = self._take()
+        if chunk is not None:
+            await self._submit(chunk)
+
+    async def close(self) -> UploadReport:
+        """
+        Sends any remaining entries and waits for all uploads to complete.
+
+        Returns:
+            UploadReport: The results of the uploads.
+        """
+        await self.flush()
+        if self.__tasks:
+            await asyncio.gather(*self.__tasks)
+        if self.__owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+        return self.report
+
+    async def __aenter__(self) -> "AsyncFhirUploader":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def _submit(self, chunk: _Chunk) -> None:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_workers)
+            )
+        if self.__pending is None:
+            self.__pending = asyncio.Semaphore(self.max_workers)
+
+        await self.__pending.acquire()
+        task = asyncio.create_task(self._upload(chunk))
+        self.__tasks.add(task)
+        task.add_done_callback(self._upload_done)
+
+    def _upload_done(self, task: asyncio.Task) -> None:
+        self.__tasks.discard(task)
+        assert self.__pending is not None
+        self.__pending.release()
+
+    async def _upload(self, chunk: _Chunk) -> None:
+        body = self._body(chunk)
+
+        status, message, retry_after = None, "", None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(self._retry_delay(attempt, retry_after))
+
+            try:
+                async with self.session.post(
+                    self.fhir_server_url,
+                    data=body,
+                    headers=self.headers,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                ) as response:
+                    status = response.status
+                    try:
+                        response_json = await response.json(content_type=None)
+                    except ValueError:
+                        response_json = None
+                    reason = response.reason or ""
+                    retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status, message, retry_after = None, str(e) or repr(e), None
+                continue
+
+            if status < 400:
+                self._record_success(chunk, response_json)
+                return
+
+            message = self._describe_error(status, reason, response_json)
+            if status not in RETRY_STATUSES:
+                break
+
+        self._record_failure(UploadFailure(chunk.bundles, status, message))
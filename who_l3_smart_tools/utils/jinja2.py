@@ -1,5 +1,7 @@
 from jinja2 import Environment, PackageLoader
 
+from who_l3_smart_tools.utils.manifest import hash_inputs
+
 DATA_TYPE_MAP = {
     "Boolean": "boolean",
     "String": "string",
@@ -19,9 +21,14 @@ def initalize_jinja_env(module):
     )
 
 
-def render_to_file(template, context, output_file):
+def render_to_file(template, context, output_file, manifest=None):
     """
-    Render a template to a file.
+    Render a template to a file. If a BuildManifest is given, the file is only
+    written if the rendered content has changed.
     """
+    if manifest is not None:
+        manifest.write(output_file, template.render(context), hash_inputs(context))
+        return
+
     with open(output_file, "w") as f:
         f.write(template.render(context))
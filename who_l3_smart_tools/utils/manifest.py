@@ -0,0 +1,221 @@
+"""
+A build manifest for incrementally regenerating output files.
+
+The manifest records, for each output file, a hash of the inputs it was generated
+from and a hash of its rendered content. Files whose content has not changed since
+the last run are not rewritten, so their modification times are left alone and
+downstream tools (e.g. SUSHI and the IG Publisher) can reuse their own caches.
+
+Generators can also record the files generated from a group of inputs, e.g. a sheet
+of the data dictionary, so that the group is not rendered again while its inputs
+are unchanged, see `BuildManifest.reuse`.
+
+The manifest is stored as `.build-manifest.json` in the output directory. Deleting
+it forces every file to be rewritten on the next run.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterable, Union
+
+__all__ = ["MANIFEST_FILE", "BuildManifest", "hash_inputs"]
+
+MANIFEST_FILE = ".build-manifest.json"
+
+# bump this whenever the layout of the manifest changes
+MANIFEST_VERSION = 2
+
+
+def hash_inputs(*inputs: Any) -> str:
+    """
+    Computes a stable hash of the inputs an output file was generated from.
+
+    Args:
+        *inputs: The inputs. Bytes and strings are hashed as-is, anything else is
+            hashed by its repr.
+
+    Returns:
+        str: The hex digest of the inputs.
+    """
+    digest = hashlib.sha256()
+    for value in inputs:
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        elif not isinstance(value, bytes):
+            value = repr(value).encode("utf-8")
+        digest.update(len(value).to_bytes(8, "little"))
+        digest.update(value)
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """
+    Writes output files, skipping any whose content is unchanged since the last run.
+
+    A file is only skipped if its content hash matches the manifest and the file on
+    disk is still the one that was written, i.e. it has not been modified or removed
+    since.
+
+    Args:
+        output_dir (str): The directory holding the manifest. Output files are
+            recorded relative to this directory.
+
+    Attributes:
+        output_dir (str): The directory holding the manifest.
+        path (str): The path to the manifest file.
+        written (int): The number of files written during this run.
+        skipped (int): The number of unchanged files skipped during this run.
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_FILE)
+        self.written = 0
+        self.skipped = 0
+        manifest = self._load()
+        self.__entries: Dict[str, Dict[str, Any]] = manifest.get("files", {})
+        self.__inputs: Dict[str, Dict[str, Any]] = manifest.get("inputs", {})
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest
+
+    def _key(self, output_file: str) -> str:
+        return os.path.relpath(output_file, self.output_dir).replace(os.sep, "/")
+
+    def write(
+        self, output_file: str, content: str, input_hash: Union[str, None] = None
+    ) -> bool:
+        """
+        Writes a file unless its content is unchanged since the last run.
+
+        Args:
+            output_file (str): The path to the output file.
+            content (str): The content of the file.
+            input_hash (str, optional): The hash of the inputs the content was
+                generated from, see `hash_inputs`.
+
+        Returns:
+            bool: True if the file was written, False if it was skipped.
+        """
+        key = self._key(output_file)
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+        entry = self.__entries.get(key)
+        if (
+            entry is not None
+            and entry.get("content") == content_hash
+            and self._unmodified(output_file, entry)
+        ):
+            entry["input"] = input_hash
+            self.skipped += 1
+            return False
+
+        with open(output_file, "w") as f:
+            f.write(content)
+
+        stat = os.stat(output_file)
+        self.__entries[key] = {
+            "input": input_hash,
+            "content": content_hash,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        self.written += 1
+        return True
+
+    def reuse(self, name: str, input_hash: str) -> Any:
+        """
+        Returns the data recorded for a group of inputs, if its inputs are unchanged
+        since the last run and none of the files generated from them has been
+        modified since. The files are then counted as skipped, and need not be
+        rendered again.
+
+        Args:
+            name (str): The name the group was recorded under, see `record`.
+            input_hash (str): The hash of the group's inputs, see `hash_inputs`.
+
+        Returns:
+            Any: The recorded data, or None if the group must be generated again.
+        """
+        recorded = self.__inputs.get(name)
+        if recorded is None or recorded["input"] != input_hash:
+            return None
+
+        for key in recorded["files"]:
+            entry = self.__entries.get(key)
+            if entry is None or not self._unmodified(
+                os.path.join(self.output_dir, key), entry
+            ):
+                return None
+
+        self.skipped += len(recorded["files"])
+        return recorded["data"]
+
+    def record(
+        self, name: str, input_hash: str, output_files: Iterable[str], data: Any
+    ) -> None:
+        """
+        Records the files generated from a group of inputs, see `reuse`.
+
+        Args:
+            name (str): The name of the group, e.g. a sheet name.
+            input_hash (str): The hash of the group's inputs, see `hash_inputs`.
+            output_files (list[str]): The paths of the files generated, as written.
+            data (Any): Anything else generated from the group that is needed when
+                it is reused. It must be serializable to JSON.
+        """
+        self.__inputs[name] = {
+            "input": input_hash,
+            "files": [self._key(output_file) for output_file in output_files],
+            "data": data,
+        }
+
+    @staticmethod
+    def _unmodified(output_file: str, entry: Dict[str, Any]) -> bool:
+        try:
+            stat = os.stat(output_file)
+        except OSError:
+            return False
+        return stat.st_size == entry.get("size") and stat.st_mtime_ns == entry.get(
+            "mtime_ns"
+        )
+
+    def save(self) -> None:
+        """
+        Saves the manifest to the output directory.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "version": MANIFEST_VERSION,
+                        "files": self.__entries,
+                        "inputs": self.__inputs,
+                    },
+                    f,
+                    indent=2,
+                    sort_keys=True,
+                )
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def __enter__(self) -> "BuildManifest":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # files written before a failure are still recorded
+        self.save()
@@ -0,0 +1,165 @@
+"""
+Streaming NDJSON output for FHIR resources, in the FHIR Bulk Data layout.
+
+Each line of an NDJSON file holds a single resource, and resources are grouped into
+files by resource type (e.g. `Patient.000.ndjson`), as expected by bulk loaders
+such as the `$import` operation. Files can be gzip-compressed and are split once
+they reach a maximum size, so large test sets produce a few large files instead of
+many small ones.
+
+Validated resources and plain dicts are written alike, see `resource_json`, so the
+output does not depend on which bundles were validated.
+"""
+
+import gzip
+import json
+import os
+import threading
+from typing import IO, Any, Dict, List, Union
+
+__all__ = ["NdjsonWriter", "resource_json"]
+
+
+def resource_json(resource: Any, indent: Union[int, None] = None) -> str:
+    """
+    Serializes a resource to JSON with its keys sorted, whether it is a validated
+    resource or a plain dict, so both are written identically.
+
+    Args:
+        resource (Resource | dict): The resource.
+        indent (int, optional): Pretty-prints the JSON with this indentation.
+
+    Returns:
+        str: The JSON.
+    """
+    if not isinstance(resource, dict):
+        resource = json.loads(resource.json())
+    return json.dumps(resource, indent=indent, sort_keys=True, default=str)
+
+
+class NdjsonWriter:
+    """
+    Writes FHIR resources or bundles to NDJSON files as they are generated.
+
+    Args:
+        output_dir (str): The directory to write the files to.
+        split_resources (bool, optional): If True, the entries of each bundle are
+            written as individual resources, one file per resource type. Otherwise
+            each bundle is written as a single line of a `Bundle` file. Defaults to
+            True.
+        compress (bool, optional): Whether to gzip the files. Defaults to False.
+        max_bytes (int, optional): The uncompressed size at which a file is closed
+            and a new one started. Defaults to 1 GiB. A file always holds at least
+            one line.
+        prefix (str, optional): A prefix for the file names, e.g. to keep apart
+            the files of several writers sharing a directory.
+
+    Attributes:
+        files (list[str]): The paths of the files written so far.
+        lines (int): The number of lines written so far.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        split_resources: bool = True,
+        compress: bool = False,
+        max_bytes: Union[int, None] = 1024**3,
+        prefix: str = "",
+    ):
+        self.output_dir = output_dir
+        self.split_resources = split_resources
+        self.compress = compress
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.files: List[str] = []
+        self.lines = 0
+
+        # the open file for each resource type, and its part number and size
+        self.__files: Dict[str, IO[str]] = {}
+        self.__parts: Dict[str, int] = {}
+        self.__sizes: Dict[str, int] = {}
+        self.__lock = threading.Lock()
+
+    def write(self, resource: Any) -> None:
+        """
+        Writes a bundle or a single resource.
+
+        Args:
+            resource (Resource | dict): The bundle or resource to write.
+        """
+        if self.split_resources and self._resource_type(resource) == "Bundle":
+            if isinstance(resource, dict):
+                resources = [entry["resource"] for entry in resource.get("entry", [])]
+            else:
+                resources = [entry.resource for entry in resource.entry or []]
+            lines = [self._line(r) for r in resources]
+        else:
+            lines = [self._line(resource)]
+
+        with self.__lock:
+            for resource_type, line in lines:
+                self._write_line(resource_type, line)
+
+    def close(self) -> None:
+        """
+        Closes all open files.
+        """
+        with self.__lock:
+            for f in self.__files.values():
+                f.close()
+            self.__files.clear()
+
+    def __enter__(self) -> "NdjsonWriter":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    @staticmethod
+    def _resource_type(resource: Any) -> str:
+        if isinstance(resource, dict):
+            return resource["resourceType"]
+        return resource.resource_type
+
+    @classmethod
+    def _line(cls, resource: Any) -> tuple:
+        return cls._resource_type(resource), resource_json(resource)
+
+    def _write_line(self, resource_type: str, line: str) -> None:
+        size = len(line.encode("utf-8")) + 1
+
+        f = self.__files.get(resource_type)
+        if (
+            f is not None
+            and self.max_bytes is not None
+            and self.__sizes[resource_type] + size > self.max_bytes
+        ):
+            f.close()
+            f = None
+
+        if f is None:
+            f = self._open(resource_type)
+
+        f.write(line)
+        f.write("\n")
+        self.__sizes[resource_type] += size
+        self.lines += 1
+
+    def _open(self, resource_type: str) -> IO[str]:
+        part = self.__parts.get(resource_type, -1) + 1
+        self.__parts[resource_type] = part
+        self.__sizes[resource_type] = 0
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        file_name = f"{self.prefix}{resource_type}.{part:03d}.ndjson"
+        if self.compress:
+            path = os.path.join(self.output_dir, file_name + ".gz")
+            f = gzip.open(path, "wt", encoding="utf-8")
+        else:
+            path = os.path.join(self.output_dir, file_name)
+            f = open(path, "w", encoding="utf-8")
+
+        self.files.append(path)
+        self.__files[resource_type] = f
+        return f
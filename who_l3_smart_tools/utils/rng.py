@@ -0,0 +1,100 @@
+"""
+Seedable randomness for generated test data.
+
+The test data generators draw all their random choices and UUIDs from the random
+generator of the current context, see `use_rng`, so a run can be reproduced from its
+seed. Independent streams are derived from a seed and a key, e.g. a sheet name and
+row number, so the data generated for a row does not depend on the order in which
+rows are generated, nor on the process generating them.
+"""
+
+import contextlib
+import contextvars
+import hashlib
+import random
+import uuid
+from typing import Any, Hashable, Iterator, Union
+
+__all__ = ["SeededRandom", "get_rng", "use_rng", "uuid4"]
+
+
+class SeededRandom(random.Random):
+    """
+    A random generator that remembers its seed, derives independent streams from it
+    and generates UUIDs.
+
+    Args:
+        seed (int | str, optional): The seed. By default a random one is used.
+
+    Attributes:
+        initial_seed (int | str): The seed the generator was created with.
+    """
+
+    def __init__(self, seed: Union[int, str, None] = None):
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        self.initial_seed = seed
+        super().__init__(seed)
+
+    def derive(self, *keys: Hashable) -> "SeededRandom":
+        """
+        Derives an independent generator from the seed of this one and the keys.
+
+        The derived generator only depends on the seed and keys, not on how much
+        of this generator's stream has been used.
+
+        Args:
+            *keys: The keys, e.g. a sheet name and row number.
+
+        Returns:
+            SeededRandom: The derived generator.
+        """
+        digest = hashlib.sha256(repr((self.initial_seed, keys)).encode("utf-8"))
+        return SeededRandom(int.from_bytes(digest.digest()[:8], "little"))
+
+    def uuid4(self) -> uuid.UUID:
+        """
+        Generates a random (version 4) UUID from this generator's stream.
+        """
+        return uuid.UUID(int=self.getrandbits(128), version=4)
+
+    def __reduce__(self) -> Any:
+        # random.Random pickles without its seed
+        return self.__class__, (self.initial_seed,), self.getstate()
+
+
+_default_rng = SeededRandom()
+_current_rng: contextvars.ContextVar = contextvars.ContextVar("rng")
+
+
+def get_rng() -> SeededRandom:
+    """
+    Returns the random generator of the current context, or an unseeded one outside
+    of `use_rng`.
+    """
+    return _current_rng.get(_default_rng)
+
+
+@contextlib.contextmanager
+def use_rng(rng: SeededRandom) -> Iterator[SeededRandom]:
+    """
+    Makes a random generator the current one within the context.
+
+    Args:
+        rng (SeededRandom): The random generator.
+
+    Yields:
+        SeededRandom: The random generator.
+    """
+    token = _current_rng.set(rng)
+    try:
+        yield rng
+    finally:
+        _current_rng.reset(token)
+
+
+def uuid4() -> uuid.UUID:
+    """
+    Generates a random UUID from the current random generator.
+    """
+    return get_rng().uuid4()